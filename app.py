@@ -6,7 +6,7 @@ from flask_login import LoginManager, current_user
 from config import Config
 from models import db, User
 
-from extensions import socketio, api, csrf
+from extensions import socketio, api, csrf, message_queue_options
 
 app = Flask(__name__, 
     static_url_path='/static',
@@ -26,11 +26,20 @@ db.init_app(app)
 socketio.init_app(app, 
     cors_allowed_origins="*",
     async_mode='eventlet',
-    async_handlers=True
+    async_handlers=True,
+    **message_queue_options(app.config['SOCKETIO_MESSAGE_QUEUE'], app.config['SOCKETIO_CHANNEL'])
 )
 api.init_app(app)
 csrf.init_app(app)
 
+# Queues are built from app.config; routes create the QueueService on import
+from services import QueueService, broadcasts
+QueueService.configure(app.config)
+broadcasts.configure(
+    window=app.config['QUEUE_BROADCAST_WINDOW_MS'] / 1000,
+    max_delay=app.config['QUEUE_BROADCAST_MAX_DELAY_MS'] / 1000
+)
+
 # Debug route to list all registered routes
 @app.route('/debug/routes')
 def list_routes():
@@ -128,6 +137,31 @@ with app.app_context():
             print("Please create an admin account by visiting /setup")
             print("Or set ADMIN_EMAIL and ADMIN_PASSWORD environment variables")
             print("="*60 + "\n")
+    
+    if app.config['SOCKETIO_MESSAGE_QUEUE']:
+        # Several workers only share queues kept outside the process
+        if QueueService().backend.name == 'memory':
+            print("[WARN] SOCKETIO_MESSAGE_QUEUE is set but queues are in memory; "
+                  "each worker will see its own queues. Use QUEUE_BACKEND=redis or database.")
+        if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+            print("[WARN] SOCKETIO_MESSAGE_QUEUE is set but the database is SQLite, which takes one writer "
+                  "at a time; use a PostgreSQL DATABASE_URL before running several workers.")
+    
+    if app.config['QUEUE_REBUILD_ON_STARTUP']:
+        # Restore waiting patients lost by a Redis restart or flush
+        from services import rebuild_queues
+        try:
+            report = rebuild_queues(QueueService())
+            print(f"Queues rebuilt: {report['restored']} restored, {report['moved']} moved, "
+                  f"{report['removed']} orphans removed, {report['cancelled']} stale rows cancelled "
+                  f"in {report['elapsed_ms']} ms")
+        except Exception as e:
+            print(f"[WARN] Queue rebuild failed: {str(e)}")
+    
+    if app.config['QUEUE_SWEEP_AT']:
+        from services import run_scheduled_sweeps
+        socketio.start_background_task(run_scheduled_sweeps, app, QueueService(),
+                                       app.config['QUEUE_SWEEP_AT'], socketio.sleep)
 
 def find_available_port(start_port, max_attempts=5):
     """Try to find an available port starting from start_port"""
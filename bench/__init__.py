@@ -0,0 +1 @@
+from .queue_bench import BACKENDS, OPERATIONS, compare_results, run_benchmark
@@ -0,0 +1,294 @@
+import os
+import platform
+import random
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+from eventlet import patcher
+
+from services.queue_backends import DatabaseQueueBackend, MemoryQueueBackend, QueueJournal, RedisQueueBackend, ShardedRedisQueueBackend
+
+BACKENDS = ('memory', 'memory-journal', 'redis', 'redis-sharded', 'database')
+OPERATIONS = ('get_position', 'get_queue', 'enqueue', 'dequeue', 'remove', 'reorder')
+SIZES = (100, 10000, 100000)
+CALLERS = (1, 4, 16, 64)
+
+# Timed calls per operation, size and caller count. A reorder rewrites the
+# whole queue, so it gets SAMPLES * REORDER_BASE / size calls instead
+SAMPLES = 200
+REORDER_BASE = 100
+
+# Bump when the meaning of a result changes, so old files are not compared
+RESULTS_VERSION = 1
+
+DOCTOR_ID = 1
+PAGE_SIZE = 20
+FILL_BATCH = 5000  # entries per bulk_enqueue, below SQLite's bound-parameter limit
+SHARDS = 3
+
+
+@contextmanager
+def open_backend(name, workdir):
+    """
+    A fresh, empty backend and the context each caller runs it in. Redis
+    backends run on fakeredis, the database backend on its own SQLite file
+    in workdir, so nothing the app uses is touched.
+    """
+    if name == 'memory':
+        yield MemoryQueueBackend(), nullcontext
+    elif name == 'memory-journal':
+        journal = QueueJournal(os.path.join(workdir, 'journal'))
+        backend = MemoryQueueBackend(journal)
+        try:
+            yield backend, nullcontext
+        finally:
+            if backend._snapshot_thread is not None:
+                backend._snapshot_thread.join()
+            journal.close()
+    elif name in ('redis', 'redis-sharded'):
+        import fakeredis
+        if name == 'redis':
+            yield RedisQueueBackend(fakeredis.FakeRedis(decode_responses=True)), nullcontext
+        else:
+            yield ShardedRedisQueueBackend({
+                f"shard-{n}": fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+                for n in range(SHARDS)
+            }), nullcontext
+    elif name == 'database':
+        from flask import Flask
+        from models import db
+        app = Flask('queue_bench')
+        app.config.update(
+            SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+            SQLALCHEMY_ENGINE_OPTIONS={'connect_args': {'timeout': 60}}
+        )
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+        try:
+            yield DatabaseQueueBackend(), app.app_context
+        finally:
+            with app.app_context():
+                db.session.remove()
+                db.engine.dispose()
+    else:
+        raise ValueError(f"Unknown queue backend {name!r}; choose from {', '.join(BACKENDS)}")
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _result(backend, size, callers, op, latencies, seconds):
+    ordered = sorted(latencies)
+    result = {
+        'backend': backend,
+        'size': size,
+        'callers': callers,
+        'op': op,
+        'ops': len(latencies),
+        'seconds': round(seconds, 6),
+        'ops_per_sec': round(len(latencies) / seconds, 1) if seconds and latencies else None
+    }
+    for name, value in (
+        ('mean_us', sum(ordered) / len(ordered) if ordered else None),
+        ('p50_us', _percentile(ordered, 0.5) if ordered else None),
+        ('p95_us', _percentile(ordered, 0.95) if ordered else None),
+        ('p99_us', _percentile(ordered, 0.99) if ordered else None),
+        ('max_us', ordered[-1] if ordered else None)
+    ):
+        result[name] = round(value * 1e6, 1) if value is not None else None
+    return result
+
+
+def _timed_calls(call, args, callers, context):
+    """
+    Run call(arg) for every arg, spread over `callers` threads that start
+    together. Returns (latencies, wall seconds). The first call to fail
+    stops every caller and is raised here: timings of a broken operation
+    would only mislead.
+    """
+    chunks = [args[i::callers] for i in range(callers)]
+    chunks = [chunk for chunk in chunks if chunk]
+    latencies, errors = [], []
+    lock = threading.Lock()
+    started = []
+    barrier = threading.Barrier(len(chunks), action=lambda: started.append(time.perf_counter()))
+
+    def caller(chunk):
+        mine = []
+        with context():
+            barrier.wait()
+            for arg in chunk:
+                if errors:
+                    break
+                begin = time.perf_counter()
+                try:
+                    call(arg)
+                except Exception as e:
+                    with lock:
+                        errors.append(e)
+                    break
+                mine.append(time.perf_counter() - begin)
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=caller, args=(chunk,), daemon=True) for chunk in chunks]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return latencies, time.perf_counter() - started[0]
+
+
+def _fill(backend, patient_ids):
+    _restore(backend, [{'patient_id': pid, 'doctor_id': DOCTOR_ID} for pid in patient_ids])
+
+
+def _restore(backend, entries):
+    """Enqueue entries as given, keeping the join time and priority of any taken off a queue."""
+    entries = [
+        dict(entry, joined_at=datetime.fromisoformat(entry['joined_at'])) if entry.get('joined_at') else entry
+        for entry in entries
+    ]
+    for i in range(0, len(entries), FILL_BATCH):
+        backend.bulk_enqueue(entries[i:i + FILL_BATCH])
+
+
+def _measure(backend, context, name, op, size, callers, samples, rng, next_patient):
+    """
+    Time one operation against a queue of `size` patients (ids 0..size-1),
+    then put the queue back the way it was for the next measurement.
+    """
+    count = samples if op != 'reorder' else max(1, min(samples, samples * REORDER_BASE // size))
+    if op in ('dequeue', 'remove'):
+        count = min(count, size)
+
+    if op == 'get_position':
+        call, args = backend.get_position, [rng.randrange(size) for _ in range(count)]
+    elif op == 'get_queue':
+        call = lambda offset: backend.get_queue(DOCTOR_ID, offset=offset, limit=PAGE_SIZE)
+        args = [rng.randrange(max(size - PAGE_SIZE, 1)) for _ in range(count)]
+    elif op == 'enqueue':
+        call = lambda pid: backend.enqueue(pid, DOCTOR_ID)
+        args = list(range(next_patient, next_patient + count))
+    elif op == 'dequeue':
+        popped = []
+        call = lambda _: popped.append(backend.dequeue(DOCTOR_ID))
+        args = [None] * count
+    elif op == 'remove':
+        call, args = backend.remove_from_queue, rng.sample(range(size), count)
+        with context():
+            removed = [info['entry'] for info in backend.get_positions(args).values()]
+    elif op == 'reorder':
+        with context():
+            order = [{'patient_id': entry['patient_id'], 'doctor_id': DOCTOR_ID} for entry in backend.get_queue(DOCTOR_ID)]
+        args = []
+        for _ in range(count):
+            # Moving one patient is what a doctor does; the call still sends the whole order
+            new_order = list(order)
+            new_order.insert(rng.randrange(size), new_order.pop(rng.randrange(size)))
+            args.append(new_order)
+        call = lambda new_order: backend.reorder_queue(DOCTOR_ID, new_order)
+    else:
+        raise ValueError(f"Unknown queue operation {op!r}; choose from {', '.join(OPERATIONS)}")
+
+    latencies, seconds = _timed_calls(call, args, callers, context)
+
+    with context():
+        if op == 'enqueue':
+            backend.bulk_remove(args)
+        elif op == 'dequeue':
+            _restore(backend, [entry for entry in popped if entry])
+        elif op == 'remove':
+            _restore(backend, removed)
+        elif op == 'reorder':
+            backend.reorder_queue(DOCTOR_ID, order)
+    return _result(name, size, callers, op, latencies, seconds)
+
+
+def run_benchmark(backends=BACKENDS, sizes=SIZES, callers=CALLERS, operations=OPERATIONS, samples=SAMPLES,
+                  seed=0, progress=None):
+    """
+    Time every operation on every backend, for each queue size and number
+    of concurrent callers, and return the results as a JSON-ready dict.
+    Each backend starts empty for each size and is filled with one doctor's
+    queue of that many patients (the fill is reported as op 'fill'); every
+    operation then leaves the queue as it found it. An operation that fails
+    raises and ends the run. progress(message) is called as each
+    measurement finishes.
+    """
+    rng = random.Random(seed)
+    report = {
+        'benchmark': 'queue',
+        'version': RESULTS_VERSION,
+        'started_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'green_threads': patcher.is_monkey_patched('thread'),
+        'samples': samples,
+        'seed': seed,
+        'results': []
+    }
+    for name in backends:
+        for size in sizes:
+            workdir = tempfile.mkdtemp(prefix='queue-bench-')
+            try:
+                with open_backend(name, workdir) as (backend, context):
+                    patient_ids = list(range(size))
+                    with context():
+                        started = time.perf_counter()
+                        _fill(backend, patient_ids)
+                        seconds = time.perf_counter() - started
+                    report['results'].append(_result(name, size, 1, 'fill', [seconds / size] * size, seconds))
+                    next_patient = size
+                    for count in callers:
+                        for op in operations:
+                            result = _measure(backend, context, name, op, size, count, samples, rng, next_patient)
+                            next_patient += result['ops']
+                            report['results'].append(result)
+                            if progress is not None:
+                                progress(f"{name} n={size} callers={count} {op}: "
+                                         f"p50 {result['p50_us']}us, {result['ops_per_sec']} ops/s")
+                    with context():
+                        backend.clear_all()
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+    report['finished_at'] = datetime.utcnow().isoformat()
+    return report
+
+
+def compare_results(baseline, current):
+    """
+    p50 latency of each measurement in `current` against the same one in
+    `baseline`: a list of {backend, size, callers, op, baseline_p50_us,
+    p50_us, ratio}, slowest change first. Ratios above 1 are slowdowns.
+    """
+    if baseline.get('version') != current.get('version'):
+        raise ValueError(f"Results version {baseline.get('version')} cannot be compared with {current.get('version')}")
+
+    def key(result):
+        return result['backend'], result['size'], result['callers'], result['op']
+
+    before = {key(result): result for result in baseline['results']}
+    rows = []
+    for result in current['results']:
+        old = before.get(key(result))
+        if old is None or not old['p50_us'] or not result['p50_us']:
+            continue
+        rows.append({
+            'backend': result['backend'],
+            'size': result['size'],
+            'callers': result['callers'],
+            'op': result['op'],
+            'baseline_p50_us': old['p50_us'],
+            'p50_us': result['p50_us'],
+            'ratio': round(result['p50_us'] / old['p50_us'], 3)
+        })
+    return sorted(rows, key=lambda row: row['ratio'], reverse=True)
@@ -7,6 +7,50 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     REDIS_URL = os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/0')
     USE_REDIS = os.environ.get('USE_REDIS', 'True').lower() == 'true'
+    # Queue storage: 'redis', 'memory' or 'database' (queue_entries is the queue)
+    QUEUE_BACKEND = os.environ.get('QUEUE_BACKEND', 'redis' if USE_REDIS else 'memory').lower()
+    # Comma-separated Redis URLs to spread doctors' queues over by consistent
+    # hashing; after changing the list run `python manage.py rebalance-queues`
+    REDIS_SHARD_URLS = os.environ.get('REDIS_SHARD_URLS', '')
+    # Connections per Redis instance and worker; once all are in use callers
+    # wait up to REDIS_POOL_TIMEOUT seconds for one (see /api/queue/metrics)
+    REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 50))
+    REDIS_POOL_TIMEOUT = float(os.environ.get('REDIS_POOL_TIMEOUT', 5))
+    # Connections per event loop for AsyncQueueService (ASGI deployments)
+    ASYNC_REDIS_MAX_CONNECTIONS = int(os.environ.get('ASYNC_REDIS_MAX_CONNECTIONS', 100))
+    # While Redis is unreachable queues are served from memory; it is pinged
+    # every QUEUE_FAILOVER_RETRY_SECONDS and up to QUEUE_FAILOVER_BUFFER
+    # changes are replayed onto it when it answers
+    QUEUE_FAILOVER_RETRY_SECONDS = float(os.environ.get('QUEUE_FAILOVER_RETRY_SECONDS', 5))
+    QUEUE_FAILOVER_BUFFER = int(os.environ.get('QUEUE_FAILOVER_BUFFER', 100000))
+    
+    # In-memory queues are journaled here (snapshot + op log) when set
+    QUEUE_SNAPSHOT_DIR = os.environ.get('QUEUE_SNAPSHOT_DIR')
+    QUEUE_SNAPSHOT_EVERY = int(os.environ.get('QUEUE_SNAPSHOT_EVERY', 10000))
+    QUEUE_SNAPSHOT_INTERVAL = float(os.environ.get('QUEUE_SNAPSHOT_INTERVAL', 60))
+    QUEUE_SNAPSHOT_FSYNC = os.environ.get('QUEUE_SNAPSHOT_FSYNC', 'False').lower() == 'true'
+    
+    # Reconcile the queue backend with waiting queue_entries when the app starts
+    QUEUE_REBUILD_ON_STARTUP = os.environ.get('QUEUE_REBUILD_ON_STARTUP', 'False').lower() == 'true'
+    
+    # Daily sweep (HH:MM, UTC) closing entries left over from previous days and
+    # archiving finished ones older than QUEUE_ARCHIVE_AFTER_DAYS; unset to
+    # run `python manage.py sweep-queues` from cron instead
+    QUEUE_SWEEP_AT = os.environ.get('QUEUE_SWEEP_AT')
+    QUEUE_ARCHIVE_AFTER_DAYS = int(os.environ.get('QUEUE_ARCHIVE_AFTER_DAYS', 30))
+    
+    # Number of queue entries the doctor dashboard loads per page
+    QUEUE_PAGE_SIZE = int(os.environ.get('QUEUE_PAGE_SIZE', 50))
+    
+    # queue:update events to a room within this window go out as one (0 disables);
+    # a busy room still gets an event at least every QUEUE_BROADCAST_MAX_DELAY_MS
+    QUEUE_BROADCAST_WINDOW_MS = int(os.environ.get('QUEUE_BROADCAST_WINDOW_MS', 150))
+    QUEUE_BROADCAST_MAX_DELAY_MS = int(os.environ.get('QUEUE_BROADCAST_MAX_DELAY_MS', 250))
+    
+    # Socket.IO emits are published here so every worker reaches its own
+    # clients (e.g. redis://redis:6379/0); unset for a single worker
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    SOCKETIO_CHANNEL = os.environ.get('SOCKETIO_CHANNEL', 'mediqueue-socketio')
     
     # Template settings
     TEMPLATE_AUTO_RELOAD = True
@@ -1,3 +1,9 @@
+import json
+import queue
+from collections import defaultdict
+
+import socketio as python_socketio
+from flask_login import current_user
 from flask_socketio import SocketIO, join_room, leave_room
 from flask_restx import Api
 from flask_wtf.csrf import CSRFProtect
@@ -13,10 +19,68 @@ api = Api(
 )
 csrf = CSRFProtect()
 
+
+class LocalPubSubManager(python_socketio.PubSubManager):
+    """
+    In-process stand-in for a Socket.IO message queue, used for 'local://'
+    URLs. Every manager on a channel hears what the others publish, so
+    several Socket.IO servers in one process (tests, a single-process dev
+    run) behave like workers sharing Redis. Messages go through JSON just
+    as they would on the wire.
+    """
+    name = 'local'
+    _subscribers = defaultdict(list)  # channel -> [queue.Queue]
+
+    def _publish(self, data):
+        message = json.dumps(data)
+        for subscriber in list(self._subscribers[self.channel]):
+            subscriber.put(message)
+
+    def _listen(self):
+        subscriber = queue.Queue()
+        self._subscribers[self.channel].append(subscriber)
+        try:
+            while True:
+                yield subscriber.get()
+        finally:
+            self._subscribers[self.channel].remove(subscriber)
+
+
+def message_queue_options(url, channel='flask-socketio'):
+    """
+    socketio.init_app() options that fan emits out to every worker through
+    the message queue at `url`: redis:// (or any URL Flask-SocketIO
+    accepts), local://<channel> for the in-process stand-in, or nothing
+    for a single worker.
+    """
+    if not url:
+        return {}
+    if url.startswith('local://'):
+        return {'client_manager': LocalPubSubManager(channel=url[len('local://'):] or channel)}
+    return {'message_queue': url, 'channel': channel}
+
+def may_join(user, room):
+    """
+    Whether `user` may listen in `room`: their own user_<id> room, any
+    waiting_<doctor id> room (queue changes without patients' entries),
+    and a doctor_<id> room, which carries full entries, only for that
+    doctor or an admin.
+    """
+    kind, _, owner = room.rpartition('_')
+    if not user.is_authenticated or not owner.isdigit():
+        return False
+    if kind == 'waiting':
+        return True
+    if kind == 'user':
+        return int(owner) == user.id
+    if kind == 'doctor':
+        return user.is_admin() or int(owner) == user.id
+    return False
+
 @socketio.on('join')
 def handle_join(data):
-    room = data.get('room') 
-    if room:
+    room = (data or {}).get('room')
+    if isinstance(room, str) and may_join(current_user, room):
         join_room(room)
 
 @socketio.on('leave')
@@ -15,7 +15,117 @@ def recreate_db():
     db.create_all()
     print("Database recreated.")
 
+@click.command()
+@click.option('--dry-run', is_flag=True, help='Only report the drift, change nothing.')
+@click.option('--batch-size', default=5000, show_default=True, help='Entries per bulk enqueue/remove.')
+@with_appcontext
+def rebuild_queues(dry_run, batch_size):
+    """Rebuilds the live queues from waiting queue_entries and reports drift."""
+    from services import QueueService, rebuild_queues as rebuild
+
+    report = rebuild(QueueService(), dry_run=dry_run, batch_size=batch_size)
+    print(f"Queue backend: {report['backend']}{' (dry run)' if dry_run else ''}")
+    for label, key in [
+        ('waiting in database', 'db_waiting'),
+        ('queued before', 'queued_before'),
+        ('already in sync', 'in_sync'),
+        ('restored', 'restored'),
+        ('moved to new doctor', 'moved'),
+        ('orphans removed', 'removed'),
+        ('stale rows cancelled', 'cancelled'),
+    ]:
+        print(f"  {label:<21} {report[key]}")
+    print(f"Done in {report['elapsed_ms']} ms.")
+
+@click.command()
+@with_appcontext
+def rebalance_queues():
+    """Moves doctor queues onto the Redis shard the current shard list places them on."""
+    from services import QueueService
+
+    backend = QueueService().backend
+    if not hasattr(backend, 'rebalance'):
+        print(f"Queue backend {backend.name} is not sharded; nothing to rebalance.")
+        return
+    report = backend.rebalance()
+    print(f"Shards: {len(backend.shards)}")
+    print(f"  doctors checked       {report['doctors_checked']}")
+    print(f"  doctors moved         {report['doctors_moved']}")
+    print(f"  patients moved        {report['patients_moved']}")
+    print(f"  patients indexed      {report['patients_indexed']}")
+
+@click.command()
+@click.option('--archive-after-days', type=int, default=None,
+              help='Archive finished entries older than this (default QUEUE_ARCHIVE_AFTER_DAYS).')
+@click.option('--batch-size', default=1000, show_default=True, help='Entries per bulk remove/archive batch.')
+@with_appcontext
+def sweep_queues(archive_after_days, batch_size):
+    """Closes queue entries left from previous days and archives old finished ones."""
+    from services import QueueService, sweep_queues as sweep
+
+    if archive_after_days is None:
+        archive_after_days = app.config['QUEUE_ARCHIVE_AFTER_DAYS']
+    report = sweep(QueueService(), archive_after_days=archive_after_days, batch_size=batch_size)
+    print(f"Queue backend: {report['backend']}")
+    for label, key in [
+        ('unqueued', 'unqueued'),
+        ('dangling keys dropped', 'dangling'),
+        ('waiting cancelled', 'cancelled'),
+        ('consults closed', 'closed'),
+        ('archived', 'archived'),
+    ]:
+        print(f"  {label:<21} {report[key]}")
+    print(f"Done in {report['elapsed_ms']} ms.")
+
+def _csv(value, cast=str):
+    return [cast(item.strip()) for item in value.split(',') if item.strip()]
+
+@click.command()
+@click.option('--backends', default=','.join(('memory', 'memory-journal', 'redis', 'redis-sharded', 'database')),
+              show_default=True, help='Comma-separated queue backends; Redis ones run on fakeredis.')
+@click.option('--sizes', default='100,10000,100000', show_default=True, help='Comma-separated queue sizes.')
+@click.option('--callers', default='1,4,16,64', show_default=True, help='Comma-separated concurrent caller counts.')
+@click.option('--ops', default='get_position,get_queue,enqueue,dequeue,remove,reorder', show_default=True,
+              help='Comma-separated operations to time.')
+@click.option('--samples', default=200, show_default=True, help='Timed calls per operation, size and caller count.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the JSON results here instead of stdout.')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False),
+              help='Earlier results to compare p50 latencies against.')
+@with_appcontext
+def bench_queue(backends, sizes, callers, ops, samples, output, baseline):
+    """Benchmarks queue operations across backends, sizes and concurrency, as JSON."""
+    import json
+    from bench import compare_results, run_benchmark
+
+    report = run_benchmark(
+        backends=_csv(backends),
+        sizes=_csv(sizes, int),
+        callers=_csv(callers, int),
+        operations=_csv(ops),
+        samples=samples,
+        progress=lambda message: click.echo(message, err=True)
+    )
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        click.echo(f"Results written to {output}", err=True)
+    else:
+        click.echo(json.dumps(report, indent=2))
+
+    if baseline:
+        with open(baseline) as f:
+            rows = compare_results(json.load(f), report)
+        click.echo(f"p50 against {baseline} (ratio > 1 is slower):", err=True)
+        for row in rows:
+            flag = '  <- slower' if row['ratio'] >= 1.2 else ''
+            click.echo(f"  {row['backend']:<15} n={row['size']:<7} callers={row['callers']:<3} {row['op']:<13}"
+                       f"{row['baseline_p50_us']:>10}us -> {row['p50_us']:>10}us  x{row['ratio']}{flag}", err=True)
+
 cli.add_command(recreate_db)
+cli.add_command(rebuild_queues)
+cli.add_command(rebalance_queues)
+cli.add_command(sweep_queues)
+cli.add_command(bench_queue)
 
 if __name__ == '__main__':
     cli()
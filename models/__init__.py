@@ -87,6 +87,15 @@ class Appointment(db.Model):
 
 class QueueEntry(db.Model):
     __tablename__ = 'queue_entries'
+    __table_args__ = (
+        # Covers "waiting entries of a doctor in serving order" and the lookups
+        # by patient, so queue reads never scan the whole table
+        db.Index('ix_queue_entries_doctor_status_priority_joined', 'doctor_id', 'status', 'priority', 'joined_at'),
+        db.Index('ix_queue_entries_patient_status', 'patient_id', 'status'),
+        # "Completed today" counts are range scans on completed_at
+        db.Index('ix_queue_entries_doctor_status_completed', 'doctor_id', 'status', 'completed_at'),
+        db.Index('ix_queue_entries_status_completed', 'status', 'completed_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -106,6 +115,45 @@ class QueueEntry(db.Model):
     doctor = db.relationship('User', foreign_keys=[doctor_id], backref='doctor_queue')
     appointment = db.relationship('Appointment', backref='queue_entry')
 
+class QueueEntryArchive(db.Model):
+    """
+    Finished queue entries moved out of queue_entries by the nightly sweep,
+    so the live table only holds recent data. Ids are the original ones;
+    there are no foreign keys, so archived rows never block deleting users.
+    """
+    __tablename__ = 'queue_entries_archive'
+    __table_args__ = (
+        db.Index('ix_queue_entries_archive_doctor_joined', 'doctor_id', 'joined_at'),
+        db.Index('ix_queue_entries_archive_patient', 'patient_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    patient_id = db.Column(db.Integer, nullable=False)
+    doctor_id = db.Column(db.Integer, nullable=False)
+    appointment_id = db.Column(db.Integer)
+    
+    queue_position = db.Column(db.Integer)
+    queue_number = db.Column(db.Integer)
+    status = db.Column(db.String(20))
+    priority = db.Column(db.Integer)
+    
+    joined_at = db.Column(db.DateTime)
+    called_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+class QueueCounter(db.Model):
+    """Last ticket number issued per doctor per day, when Redis is not there to count."""
+    __tablename__ = 'queue_counters'
+    __table_args__ = (
+        db.UniqueConstraint('doctor_id', 'day', name='uq_queue_counters_doctor_day'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    last_number = db.Column(db.Integer, nullable=False, default=0)
+
 class MedicalRecord(db.Model):
     __tablename__ = 'medical_records'
     
@@ -36,7 +36,7 @@ def dashboard():
     today = datetime.utcnow().date()
     patients_served_today = QueueEntry.query.filter(
         QueueEntry.status == 'completed',
-        func.date(QueueEntry.completed_at) == today
+        QueueEntry.completed_at >= datetime.combine(today, datetime.min.time())
     ).count()
     
     active_queues = db.session.query(
@@ -694,7 +694,7 @@ def analytics():
         func.count(QueueEntry.id).label('patients_served')
     ).join(QueueEntry, User.id == QueueEntry.doctor_id).filter(
         QueueEntry.status == 'completed',
-        func.date(QueueEntry.completed_at) == today
+        QueueEntry.completed_at >= datetime.combine(today, datetime.min.time())
     ).group_by(User.id, User.full_name).all()
     
     # Appointment statistics
@@ -13,7 +13,7 @@ from models import (
     db, User, Appointment, QueueEntry, MedicalRecord, 
     Prescription, Department, DoctorAvailability, Report
 )
-from services import QueueService
+from services import QueueService, broadcasts, consult_time_estimator
 
 # Initialize queue service
 queue_service = QueueService()
@@ -338,7 +338,7 @@ class DoctorDashboard(Resource):
         patients_served_today = QueueEntry.query.filter(
             QueueEntry.doctor_id == current_user.id,
             QueueEntry.status == 'completed',
-            db.func.date(QueueEntry.completed_at) == today
+            QueueEntry.completed_at >= datetime.combine(today, datetime.min.time())
         ).count()
         
         active_queue_entries = []
@@ -507,30 +507,118 @@ class GetMedicalRecord(Resource):
 
 # ==================== QUEUE API ENDPOINTS ====================
 
+def tag_response(data, etag, status=200):
+    """Response carrying a queue_etag; data=None gives an empty 304."""
+    if data is None:
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(data)
+        response.status_code = status
+    if etag:
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 @queue_ns.route('/status')
 class QueueStatus(Resource):
     @login_required
     @api.doc(security='Bearer')
+    @api.param('offset', 'Doctors only: rank of the first queue entry to return', type=int)
+    @api.param('limit', 'Doctors only: maximum number of queue entries to return', type=int)
     def get(self):
-        """Get queue status for current user"""
+        """Get queue status for current user (honours If-None-Match while the queue is unchanged)"""
         if current_user.is_patient():
+            # A queued patient's position only changes with their doctor's
+            # queue, so the tag names that doctor and one version read checks it
+            etag, etag_doctor = None, None
+            for tag in request.if_none_match.as_set(include_weak=True):
+                etag_doctor = queue_service.etag_doctor(tag)
+                if etag_doctor is not None:
+                    etag = queue_service.queue_etag(etag_doctor, 'p', current_user.id)
+                    if etag == tag:
+                        return tag_response(None, etag)
+                    break
+
             position = queue_service.get_position(current_user.id)
-            return {
+            if position and position['doctor_id'] != etag_doctor:
+                # The tag has to be read before the position it describes
+                etag_doctor = position['doctor_id']
+                etag = queue_service.queue_etag(etag_doctor, 'p', current_user.id)
+                position = queue_service.get_position(current_user.id)
+            if not position or position['doctor_id'] != etag_doctor:
+                # Not queued: joining changes a queue we cannot name in advance
+                etag = None
+            return tag_response({
                 'success': True,
                 'user_type': 'patient',
                 'position': position
-            }, 200
+            }, etag)
         elif current_user.is_doctor():
-            queue_list = queue_service.get_queue(current_user.id)
-            return {
+            offset = max(request.args.get('offset', 0, type=int), 0)
+            limit = request.args.get('limit', type=int)
+            etag = queue_service.queue_etag(current_user.id, offset, limit)
+            if etag and request.if_none_match.contains_weak(etag):
+                return tag_response(None, etag)
+
+            queue_list = queue_service.get_queue(current_user.id, offset=offset, limit=limit)
+            return tag_response({
                 'success': True,
                 'user_type': 'doctor',
                 'queue': queue_list,
-                'queue_length': len(queue_list)
-            }, 200
+                'queue_length': queue_service.get_queue_length(current_user.id),
+                'offset': offset,
+                'limit': limit
+            }, etag)
         else:
             return {'message': 'Invalid user type'}, 400
 
+@queue_ns.route('/positions')
+class QueuePositions(Resource):
+    MAX_PATIENTS = 500
+
+    @login_required
+    @api.doc(security='Bearer')
+    @api.param('patient_ids', 'Comma-separated patient IDs, e.g. 4,8,15', required=True)
+    def get(self):
+        """Get queue positions for many patients at once (display boards, kiosks)"""
+        if not (current_user.is_admin() or current_user.is_doctor()):
+            return {'message': 'Access denied'}, 403
+
+        try:
+            patient_ids = [int(pid) for pid in request.args.get('patient_ids', '').split(',') if pid.strip()]
+        except ValueError:
+            return {'message': 'patient_ids must be a comma-separated list of integers'}, 400
+        if not patient_ids:
+            return {'message': 'patient_ids is required'}, 400
+        if len(patient_ids) > self.MAX_PATIENTS:
+            return {'message': f'At most {self.MAX_PATIENTS} patient_ids per request'}, 400
+
+        positions = queue_service.get_positions(patient_ids)
+        return {
+            'success': True,
+            'positions': [
+                {'patient_id': patient_id, **(info or {'position': None})}
+                for patient_id, info in positions.items()
+            ]
+        }, 200
+
+@queue_ns.route('/metrics')
+class QueueMetrics(Resource):
+    @login_required
+    @api.doc(security='Bearer')
+    def get(self):
+        """Queue broadcast, read-cache, Redis failover and connection pool counters for this worker (admin only)"""
+        if not current_user.is_admin():
+            return {'message': 'Access denied'}, 403
+        return {
+            'success': True,
+            'backend': queue_service.backend.name,
+            'broadcasts': broadcasts.metrics(),
+            'queue_cache': dict(queue_service.cache_stats),
+            'failover': queue_service.failover_metrics(),
+            'redis_pool': queue_service.pool_metrics()
+        }, 200
+
 @queue_ns.route('/status/<int:ticket_id>')
 class QueueTicketStatus(Resource):
     @login_required
@@ -549,10 +637,8 @@ class QueueTicketStatus(Resource):
         
         if position_info and position_info['doctor_id'] == ticket.doctor_id:
             current_position = position_info['position']
-            # Calculate estimated wait
-            doctor = User.query.get(ticket.doctor_id)
-            avg_time = doctor.avg_consultation_time if doctor else 15
-            estimated_wait = (current_position - 1) * avg_time
+            # Calculate estimated wait from the doctor's learned consult times
+            estimated_wait = consult_time_estimator().estimated_wait(ticket.doctor_id, current_position)
         
         return {
             'success': True,
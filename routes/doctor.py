@@ -1,7 +1,7 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, send_file, current_app
 from flask_login import login_required, current_user
 from models import db, User, Appointment, QueueEntry, MedicalRecord, Prescription, Department, DoctorAvailability
-from services import QueueService
+from services import QueueService, consult_time_estimator, position_before_change, publish_queue_delta
 from datetime import datetime, timedelta, time as dt_time
 from functools import wraps
 import io
@@ -32,7 +32,8 @@ def doctor_required(f):
 @login_required
 @doctor_required
 def dashboard():
-    queue_list = queue_service.get_queue(current_user.id)
+    queue_list = queue_service.get_queue(current_user.id, limit=current_app.config['QUEUE_PAGE_SIZE'])
+    queue_length = queue_service.get_queue_length(current_user.id)
     
     today = datetime.utcnow().date()
     appointments_today = Appointment.query.filter(
@@ -43,7 +44,7 @@ def dashboard():
     patients_served_today = QueueEntry.query.filter(
         QueueEntry.doctor_id == current_user.id,
         QueueEntry.status == 'completed',
-        db.func.date(QueueEntry.completed_at) == today
+        QueueEntry.completed_at >= datetime.combine(today, dt_time.min)
     ).count()
     
     active_queue_entries = []
@@ -58,7 +59,8 @@ def dashboard():
         queue=active_queue_entries,
         appointments=appointments_today,
         patients_served=patients_served_today,
-        queue_length=len(queue_list)
+        queue_length=queue_length,
+        consult_minutes=round(consult_time_estimator().minutes_per_patient(current_user.id))
     )
 
 @doctor_bp.route('/select-patient', methods=['GET', 'POST'])
@@ -165,19 +167,24 @@ def consult_patient(patient_id):
             )
             db.session.add(prescription)
         
-        queue_service.remove_from_queue(patient_id)
-        
-        queue_entry = QueueEntry.query.filter_by(
-            patient_id=patient_id,
-            doctor_id=current_user.id,
-            status='waiting'
-        ).first()
+        # The patient was either called (in_consultation) or seen straight from the queue
+        queue_entry = QueueEntry.query.filter(
+            QueueEntry.patient_id == patient_id,
+            QueueEntry.doctor_id == current_user.id,
+            QueueEntry.status.in_(['in_consultation', 'waiting'])
+        ).order_by(QueueEntry.called_at.is_(None), QueueEntry.joined_at.desc()).first()
         
         if queue_entry:
             queue_entry.status = 'completed'
             queue_entry.completed_at = datetime.utcnow()
         
+        position, base_version = position_before_change(queue_service, patient_id)
+        # Complete the entry first so the database backend's removal does not cancel it
+        queue_service.remove_from_queue(patient_id)
+        
         db.session.commit()
+        if queue_entry:
+            consult_time_estimator().record(current_user.id, queue_entry.called_at, queue_entry.completed_at)
         # notify patient and update doctor queue in real-time
         try:
             socketio.emit('consultation:completed', {
@@ -186,8 +193,9 @@ def consult_patient(patient_id):
                 'medical_record_id': medical_record.id
             }, room=f'user_{patient_id}')
 
-            # update doctor queue
-            socketio.emit('queue:update', {'doctor_id': current_user.id, 'queue': queue_service.get_queue(current_user.id)}, room=f'doctor_{current_user.id}')
+            # update doctor queue, unless call-next had already taken the patient off it
+            if position and position['doctor_id'] == current_user.id:
+                publish_queue_delta(queue_service, current_user.id, base_version, 'removed', patient_id, position['position'])
         except Exception:
             pass
 
@@ -206,10 +214,28 @@ def consult_patient(patient_id):
 @login_required
 @doctor_required
 def queue_data():
-    queue_list = queue_service.get_queue(current_user.id)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = request.args.get('limit', type=int)
+    
+    # An unchanged queue answers a dashboard poll with an empty 304
+    version = queue_service.get_version(current_user.id)
+    etag = queue_service.queue_etag(current_user.id, offset, limit, version=version)
+    if etag and request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    
+    queue_list = queue_service.get_queue(current_user.id, offset=offset, limit=limit)
+    total = queue_service.get_queue_length(current_user.id)
+    
+    # One query for the whole page instead of one per queue entry
+    patient_ids = [queue_item['patient_id'] for queue_item in queue_list]
+    patients = {p.id: p for p in User.query.filter(User.id.in_(patient_ids)).all()} if patient_ids else {}
+    
     active_queue_entries = []
     for queue_item in queue_list:
-        patient = User.query.get(queue_item['patient_id'])
+        patient = patients.get(queue_item['patient_id'])
         if patient:
             # Convert to dict for JSON serialization
             item = queue_item.copy()
@@ -218,28 +244,42 @@ def queue_data():
             item['patient_phone'] = patient.phone or 'N/A'
             active_queue_entries.append(item)
             
-    return jsonify({'queue': active_queue_entries})
+    response = jsonify({
+        'queue': active_queue_entries,
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'version': version
+    })
+    if etag:
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 @doctor_bp.route('/call-next')
 @login_required
 @doctor_required
 def call_next_patient():
+    base_version = queue_service.get_version(current_user.id)
     next_patient = queue_service.dequeue(current_user.id)
     
     if next_patient:
-        queue_entry = QueueEntry.query.filter_by(
-            patient_id=next_patient['patient_id'],
-            doctor_id=current_user.id,
-            status='waiting'
-        ).first()
-        
-        if queue_entry:
-            queue_entry.status = 'in_consultation'
-            queue_entry.called_at = datetime.utcnow()
-            db.session.commit()
-        # notify the patient that they have been called
+        # The database backend already marked the entry in_consultation when dequeuing
+        if not queue_service.stores_entries:
+            queue_entry = QueueEntry.query.filter_by(
+                patient_id=next_patient['patient_id'],
+                doctor_id=current_user.id,
+                status='waiting'
+            ).first()
+            
+            if queue_entry:
+                queue_entry.status = 'in_consultation'
+                queue_entry.called_at = datetime.utcnow()
+                db.session.commit()
+        # notify the doctor's room and the patient that they have been called
         try:
             pid = next_patient['patient_id']
+            publish_queue_delta(queue_service, current_user.id, base_version, 'removed', pid, 1)
             socketio.emit('patient:called', {
                 'patient_id': pid,
                 'doctor_id': current_user.id
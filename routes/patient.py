@@ -1,8 +1,8 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, send_file, current_app
 from flask_login import login_required, current_user
 from models import db, User, Appointment, QueueEntry, MedicalRecord, Prescription, Department, DoctorAvailability
-from services import QueueService
-from datetime import datetime, timedelta, time as dt_time
+from services import QueueService, consult_time_estimator, queue_number_counter, fastest_doctor, position_before_change, publish_queue_delta
+from datetime import datetime, timedelta
 from extensions import socketio
 from functools import wraps
 import qrcode
@@ -27,6 +27,8 @@ def patient_required(f):
 @patient_required
 def dashboard():
     queue_position = queue_service.get_position(current_user.id)
+    # Version the page's position is at, so queue:update deltas can follow on from it
+    queue_version = queue_service.get_version(queue_position['doctor_id']) if queue_position else None
     
     upcoming_appointments = Appointment.query.filter(
         Appointment.patient_id == current_user.id,
@@ -40,10 +42,12 @@ def dashboard():
     
     estimated_wait = None
     doctor_name = None
+    minutes_per_patient = None
     if queue_position:
         doctor = User.query.get(queue_position['doctor_id'])
         if doctor:
-            estimated_wait = (queue_position['position'] - 1) * doctor.avg_consultation_time
+            minutes_per_patient = round(consult_time_estimator().minutes_per_patient(doctor), 1)
+            estimated_wait = round((queue_position['position'] - 1) * minutes_per_patient)
             doctor_name = doctor.full_name
         
         # Get the QueueEntry ID for the API
@@ -61,7 +65,9 @@ def dashboard():
         estimated_wait=estimated_wait,
         appointments=upcoming_appointments,
         medical_records=medical_records,
-        doctor_name=doctor_name
+        doctor_name=doctor_name,
+        queue_version=queue_version,
+        minutes_per_patient=minutes_per_patient
     )
 
 @patient_bp.route('/book-appointment', methods=['GET', 'POST'])
@@ -195,37 +201,26 @@ def join_queue(doctor_id):
         flash('You are already in a queue. Please complete that consultation first.', 'warning')
         return redirect(url_for('patient.dashboard'))
     
-    queue_entry = QueueEntry(
-        patient_id=current_user.id,
-        doctor_id=doctor_id,
-        status='waiting',
-        priority=0
-    )
-    
-    # Calculate queue number for today
-    today_start = datetime.combine(datetime.utcnow().date(), dt_time.min)
-    today_end = datetime.combine(datetime.utcnow().date(), dt_time.max)
-    
-    last_entry = QueueEntry.query.filter(
-        QueueEntry.doctor_id == doctor_id,
-        QueueEntry.joined_at >= today_start,
-        QueueEntry.joined_at <= today_end
-    ).order_by(QueueEntry.queue_number.desc()).first()
-    
-    next_number = 1
-    if last_entry and last_entry.queue_number:
-        next_number = last_entry.queue_number + 1
+    # Today's ticket number, issued atomically across workers
+    next_number = queue_number_counter().next_number(doctor_id)
         
-    queue_entry.queue_number = next_number
-    
-    db.session.add(queue_entry)
-    db.session.commit()
+    if not queue_service.stores_entries:
+        queue_entry = QueueEntry(
+            patient_id=current_user.id,
+            doctor_id=doctor_id,
+            status='waiting',
+            priority=0,
+            queue_number=next_number
+        )
+        db.session.add(queue_entry)
+        db.session.commit()
     
+    base_version = queue_service.get_version(doctor_id)
+    # With the database backend this is the only write: the backend inserts the entry
     queue_service.enqueue(current_user.id, doctor_id, priority=0, queue_number=next_number)
     # notify doctor and patient about queue update
     try:
-        current_queue = queue_service.get_queue(doctor_id)
-        socketio.emit('queue:update', {'doctor_id': doctor_id, 'queue': current_queue}, room=f'doctor_{doctor_id}')
+        publish_queue_delta(queue_service, doctor_id, base_version, 'inserted', current_user.id)
         # notify the patient specifically
         position_info = queue_service.get_position(current_user.id)
         socketio.emit('queue:joined', {'position': position_info}, room=f'user_{current_user.id}')
@@ -235,25 +230,42 @@ def join_queue(doctor_id):
     flash(f'You have joined Dr. {doctor.full_name}\'s queue.', 'success')
     return redirect(url_for('patient.dashboard'))
 
+@patient_bp.route('/join-fastest-queue/<int:department_id>')
+@login_required
+@patient_required
+def join_fastest_queue(department_id):
+    """Walk-in check-in to whichever doctor in the department has the shortest predicted wait."""
+    department = Department.query.get_or_404(department_id)
+    doctors = User.query.filter_by(department_id=department.id, role='doctor', is_active=True).all()
+    
+    doctor = fastest_doctor(queue_service, doctors)
+    if doctor is None:
+        flash(f'No doctors are available in {department.name}.', 'warning')
+        return redirect(url_for('patient.dashboard'))
+    return join_queue(doctor.id)
+
 @patient_bp.route('/leave-queue')
 @login_required
 @patient_required
 def leave_queue():
-    queue_service.remove_from_queue(current_user.id)
-    
     queue_entry = QueueEntry.query.filter_by(
         patient_id=current_user.id,
         status='waiting'
     ).first()
+    position, base_version = position_before_change(queue_service, current_user.id)
+    
+    # The database backend cancels the entry itself as part of the removal
+    queue_service.remove_from_queue(current_user.id)
     
-    if queue_entry:
+    if queue_entry and not queue_service.stores_entries:
         queue_entry.status = 'cancelled'
         db.session.commit()
     # emit update to doctor and patient
     try:
-        # if we stored doctor_id in queue_entry earlier, use it; else attempt to fetch position
-        if queue_entry:
-            socketio.emit('queue:update', {'doctor_id': queue_entry.doctor_id, 'queue': queue_service.get_queue(queue_entry.doctor_id)}, room=f'doctor_{queue_entry.doctor_id}')
+        if position:
+            publish_queue_delta(
+                queue_service, position['doctor_id'], base_version, 'removed', current_user.id, position['position']
+            )
         socketio.emit('queue:left', {'patient_id': current_user.id}, room=f'user_{current_user.id}')
     except Exception:
         pass
@@ -0,0 +1,51 @@
+import sqlite3
+import os
+
+# Database path
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'mediqueue.db')
+
+# Indexes declared on QueueEntry.__table_args__; existing databases created
+# before they were added only get them through this script
+INDEXES = {
+    'ix_queue_entries_doctor_status_priority_joined':
+        "CREATE INDEX ix_queue_entries_doctor_status_priority_joined "
+        "ON queue_entries (doctor_id, status, priority, joined_at)",
+    'ix_queue_entries_patient_status':
+        "CREATE INDEX ix_queue_entries_patient_status ON queue_entries (patient_id, status)",
+    'ix_queue_entries_doctor_status_completed':
+        "CREATE INDEX ix_queue_entries_doctor_status_completed "
+        "ON queue_entries (doctor_id, status, completed_at)",
+    'ix_queue_entries_status_completed':
+        "CREATE INDEX ix_queue_entries_status_completed ON queue_entries (status, completed_at)",
+}
+
+def add_indexes():
+    if not os.path.exists(DB_PATH):
+        print(f"Database not found at {DB_PATH}")
+        return
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+
+    try:
+        # Check which indexes already exist
+        cursor.execute("PRAGMA index_list(queue_entries)")
+        existing = {info[1] for info in cursor.fetchall()}
+
+        for name, statement in INDEXES.items():
+            if name in existing:
+                print(f"Index '{name}' already exists on 'queue_entries' table.")
+            else:
+                print(f"Creating index '{name}' on 'queue_entries' table...")
+                cursor.execute(statement)
+        conn.commit()
+        print("Indexes are up to date.")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    add_indexes()
@@ -1 +1,10 @@
 from .queue_service import QueueService
+from .redis_pool import InstrumentedConnectionPool, PoolTimeoutError
+from .queue_entries import create_queue_entries
+from .queue_rebuild import rebuild_queues
+from .queue_sweeper import archive_entries, run_scheduled_sweeps, sweep_queues
+from .queue_numbers import QueueNumberCounter, queue_number_counter
+from .consult_times import ConsultTimeEstimator, consult_time_estimator
+from .queue_routing import fastest_doctor, predicted_waits
+from .queue_events import broadcasts, position_before_change, publish_queue_delta, queue_snapshot
+from .async_queue_service import AsyncQueueService
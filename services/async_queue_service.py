@@ -0,0 +1,106 @@
+import redis.asyncio as aioredis
+
+from .queue_backends.async_redis import AsyncRedisQueueBackend
+from .queue_service import QueueService
+
+
+class AsyncQueueService:
+    """
+    asyncio counterpart of QueueService for an ASGI deployment of the API and
+    Socket.IO layers. Same methods and return values, but every call is a
+    coroutine on a redis.asyncio pool, so concurrent requests await Redis
+    instead of each holding a greenlet and a pooled connection.
+
+    Unlike QueueService this is not a process singleton: asyncio clients are
+    bound to the event loop that created them, so build one per loop (e.g.
+    in the ASGI lifespan handler) and close it with aclose(). Nor does it
+    cache get_queue pages; queue_etag still lets handlers answer unchanged
+    polls with a 304, and its tags match the ones QueueService makes.
+    """
+
+    def __init__(self, redis_url=None, client=None, max_connections=None):
+        if client is None:
+            # Same settings QueueService is built from (app.config once configured)
+            if redis_url is None:
+                redis_url = QueueService.config['REDIS_URL']
+            if max_connections is None:
+                max_connections = QueueService.config['ASYNC_REDIS_MAX_CONNECTIONS']
+            client = aioredis.Redis(connection_pool=aioredis.ConnectionPool.from_url(
+                redis_url,
+                decode_responses=True,
+                max_connections=max_connections,
+                socket_timeout=5,
+                socket_connect_timeout=5,
+                health_check_interval=30,
+                retry_on_timeout=True
+            ))
+        self.backend = AsyncRedisQueueBackend(client)
+
+    @property
+    def use_redis(self):
+        return True
+
+    @property
+    def stores_entries(self):
+        return self.backend.stores_entries
+
+    @property
+    def redis_client(self):
+        return self.backend.redis_client
+
+    async def aclose(self):
+        await self.backend.redis_client.aclose()
+
+    async def enqueue(self, patient_id, doctor_id, priority=0, appointment_id=None, queue_number=None):
+        return await self.backend.enqueue(patient_id, doctor_id, priority, appointment_id, queue_number)
+
+    async def bulk_enqueue(self, entries):
+        return await self.backend.bulk_enqueue(list(entries))
+
+    async def dequeue(self, doctor_id):
+        return await self.backend.dequeue(doctor_id)
+
+    async def get_position(self, patient_id):
+        return await self.backend.get_position(patient_id)
+
+    async def get_positions(self, patient_ids):
+        return await self.backend.get_positions(patient_ids)
+
+    async def get_queue(self, doctor_id, offset=0, limit=None):
+        return await self.backend.get_queue(doctor_id, offset, limit)
+
+    async def remove_from_queue(self, patient_id):
+        return await self.backend.remove_from_queue(patient_id)
+
+    async def bulk_remove(self, patient_ids):
+        return await self.backend.bulk_remove(list(patient_ids))
+
+    async def reorder_queue(self, doctor_id, new_order):
+        return await self.backend.reorder_queue(doctor_id, new_order)
+
+    async def queued_patients(self):
+        return await self.backend.queued_patients()
+
+    async def get_queue_length(self, doctor_id):
+        return await self.backend.get_queue_length(doctor_id)
+
+    async def get_queue_lengths(self, doctor_ids):
+        return await self.backend.get_queue_lengths(doctor_ids)
+
+    async def get_version(self, doctor_id):
+        return await self.backend.get_version(doctor_id)
+
+    async def queue_etag(self, doctor_id, *parts, version=None):
+        """Same tag QueueService.queue_etag makes for the same queue."""
+        if version is None:
+            version = await self.backend.get_version(doctor_id)
+        return '-'.join(str(part) for part in ('q', await self.backend.get_epoch(doctor_id), doctor_id, version) + parts)
+
+    etag_doctor = staticmethod(QueueService.etag_doctor)
+
+    async def clear_queue(self, doctor_id):
+        return await self.backend.clear_queue(doctor_id)
+
+    async def clear_all(self):
+        """Clear all queues - used for testing"""
+        await self.backend.clear_all()
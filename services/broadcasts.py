@@ -0,0 +1,92 @@
+import threading
+import time
+
+
+class BroadcastCoalescer:
+    """
+    Holds Socket.IO broadcasts briefly and sends each room one merged event
+    per burst instead of one per change.
+
+    The first event for an (event, room) pair opens a window. Every further
+    event pushes the send back by `window` seconds, but never past
+    `max_delay` seconds after the first, so a steady stream still goes out
+    at least that often. Events are merged by the function registered for
+    their name, or else only the latest one is sent. window <= 0 sends
+    every event immediately.
+
+    Sends run in a Socket.IO background task, so they work under eventlet
+    and threading alike; flush() sends everything pending at once.
+    """
+
+    def __init__(self, socketio, window=0.15, max_delay=0.25):
+        self.socketio = socketio
+        self.configure(window, max_delay)
+        self._lock = threading.Lock()
+        self._pending = {}  # (event, room) -> {'events': [...], 'first': t, 'last': t}
+        self._mergers = {}  # event name -> merge(list of payloads) -> payload
+        self.stats = {'events_in': 0, 'events_out': 0, 'largest_batch': 0}
+
+    def configure(self, window, max_delay):
+        """Set the window and the longest delay, in seconds."""
+        self.window = window
+        self.max_delay = max(max_delay, window)
+
+    def register(self, event, merge):
+        """Merge pending `event` payloads with merge(payloads) instead of keeping the latest."""
+        self._mergers[event] = merge
+
+    def emit(self, event, data, room):
+        key = (event, room)
+        now = time.monotonic()
+        with self._lock:
+            self.stats['events_in'] += 1
+            if self.window > 0:
+                pending = self._pending.get(key)
+                if pending is not None:
+                    pending['events'].append(data)
+                    pending['last'] = now
+                    return
+                self._pending[key] = {'events': [data], 'first': now, 'last': now}
+        if self.window > 0:
+            self.socketio.start_background_task(self._send_when_due, key)
+        else:
+            self._send(key, [data])
+
+    def _send_when_due(self, key):
+        while True:
+            with self._lock:
+                pending = self._pending.get(key)
+                if pending is None:
+                    return  # taken by flush()
+                due = min(pending['last'] + self.window, pending['first'] + self.max_delay)
+                delay = due - time.monotonic()
+                if delay <= 0:
+                    del self._pending[key]
+                    break
+            self.socketio.sleep(delay)
+        self._send(key, pending['events'])
+
+    def _send(self, key, events):
+        event, room = key
+        merge = self._mergers.get(event)
+        data = merge(events) if merge else events[-1]
+        with self._lock:
+            self.stats['events_out'] += 1
+            self.stats['largest_batch'] = max(self.stats['largest_batch'], len(events))
+        self.socketio.emit(event, data, room=room)
+
+    def flush(self):
+        """Send everything pending now."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for key, batch in pending.items():
+            self._send(key, batch['events'])
+
+    def metrics(self):
+        with self._lock:
+            metrics = dict(self.stats, pending_rooms=len(self._pending))
+        events_in = metrics['events_in']
+        metrics['window_ms'] = round(self.window * 1000)
+        metrics['max_delay_ms'] = round(self.max_delay * 1000)
+        metrics['coalesced_ratio'] = round(metrics['events_out'] / events_in, 3) if events_in else None
+        return metrics
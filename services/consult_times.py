@@ -0,0 +1,209 @@
+import threading
+from datetime import datetime
+
+from models import db, QueueEntry, User
+from .queue_backends.failover import REDIS_ERRORS
+from .queue_service import QueueService
+
+# Weight of the newest consult in the moving average; about the last
+# 2 / ALPHA consults carry most of it
+ALPHA = 0.2
+
+# Consults are averaged per doctor and per block of this many hours of the
+# day (UTC, like the timestamps), since clinics run slower at busy times
+BUCKET_HOURS = 3
+
+# A bucket is trusted once it has this many consults; until then the
+# doctor's all-day average is used, and before any consult at all the
+# configured avg_consultation_time
+MIN_BUCKET_SAMPLES = 3
+
+# Consults are learned from the doctor's last HISTORY_SIZE completed
+# entries the first time the doctor is looked up
+HISTORY_SIZE = 50
+
+# Durations outside this range (minutes) are a consult left open or closed
+# by mistake, not a real visit, and are ignored
+MIN_MINUTES, MAX_MINUTES = 0.5, 240
+
+DEFAULT_MINUTES = 15
+
+KEY_PREFIX = 'consult_time:doctor:'
+
+# Folds one duration into the averages named in ARGV[3..].
+# KEYS[1] = the doctor's hash, ARGV[1] = alpha, ARGV[2] = minutes.
+# Fields are <name> = average and <name>:n = consults seen.
+RECORD_SCRIPT = """
+local alpha, minutes = tonumber(ARGV[1]), tonumber(ARGV[2])
+for i = 3, #ARGV do
+    local current = tonumber(redis.call('HGET', KEYS[1], ARGV[i]))
+    if current then
+        current = alpha * minutes + (1 - alpha) * current
+    else
+        current = minutes
+    end
+    redis.call('HSET', KEYS[1], ARGV[i], tostring(current))
+    redis.call('HINCRBY', KEYS[1], ARGV[i] .. ':n', 1)
+end
+return 1
+"""
+
+
+class ConsultTimeEstimator:
+    """
+    Expected consultation length per doctor, learned from how long their
+    consults actually take (called_at to completed_at) instead of the static
+    avg_consultation_time column.
+
+    Each doctor keeps an exponentially weighted moving average for the whole
+    day and one per BUCKET_HOURS block of the day, updated in O(1) as each
+    consult completes. Averages live in a Redis hash per doctor when a
+    client is given, so every worker shares them, or in this process
+    otherwise. A doctor seen for the first time is seeded from their recent
+    completed entries. While Redis cannot be reached nothing is learned and
+    estimates fall back to avg_consultation_time.
+    """
+
+    def __init__(self, redis_client=None, alpha=ALPHA, bucket_hours=BUCKET_HOURS):
+        self.redis_client = redis_client
+        self.alpha = alpha
+        self.bucket_hours = bucket_hours
+        self._states = {}  # doctor_id -> {field: value} when there is no Redis
+        self._lock = threading.Lock()
+        self._script = redis_client.register_script(RECORD_SCRIPT) if redis_client is not None else None
+
+    def _key(self, doctor_id):
+        return f"{KEY_PREFIX}{doctor_id}"
+
+    def _fields(self, when):
+        return ['all', str(when.hour // self.bucket_hours)]
+
+    def _read(self, doctor_ids):
+        """{doctor_id: {field: float} or None if never seeded}."""
+        if self.redis_client is None:
+            with self._lock:
+                return {doctor_id: dict(self._states[doctor_id]) if doctor_id in self._states else None
+                        for doctor_id in doctor_ids}
+        with self.redis_client.pipeline(transaction=False) as pipe:
+            for doctor_id in doctor_ids:
+                pipe.hgetall(self._key(doctor_id))
+            rows = pipe.execute()
+        return {doctor_id: {field: float(value) for field, value in row.items()} if row else None
+                for doctor_id, row in zip(doctor_ids, rows)}
+
+    def _apply(self, state, fields, minutes):
+        for field in fields:
+            current = state.get(field)
+            state[field] = minutes if current is None else self.alpha * minutes + (1 - self.alpha) * current
+            state[f"{field}:n"] = state.get(f"{field}:n", 0) + 1
+
+    def _duration(self, called_at, completed_at):
+        if called_at is None or completed_at is None:
+            return None
+        minutes = (completed_at - called_at).total_seconds() / 60
+        return minutes if MIN_MINUTES <= minutes <= MAX_MINUTES else None
+
+    def _seed(self, doctor_id):
+        """Learn a doctor's averages from their recent history; returns the state."""
+        rows = db.session.query(QueueEntry.called_at, QueueEntry.completed_at).filter(
+            QueueEntry.doctor_id == doctor_id,
+            QueueEntry.status == 'completed',
+            QueueEntry.called_at.isnot(None),
+            QueueEntry.completed_at.isnot(None)
+        ).order_by(QueueEntry.completed_at.desc()).limit(HISTORY_SIZE).all()
+
+        state = {'seeded': 1}
+        for called_at, completed_at in reversed(rows):
+            minutes = self._duration(called_at, completed_at)
+            if minutes is not None:
+                self._apply(state, self._fields(called_at), minutes)
+
+        if self.redis_client is None:
+            with self._lock:
+                self._states[doctor_id] = state
+        else:
+            self.redis_client.hset(self._key(doctor_id), mapping={field: repr(value) for field, value in state.items()})
+        return state
+
+    def record(self, doctor_id, called_at, completed_at):
+        """
+        Fold a completed consult into the doctor's averages. Call it once the
+        entry is committed: a doctor not seen before is seeded from history,
+        which already includes it. Returns the minutes learned, or None.
+        """
+        minutes = self._duration(called_at, completed_at)
+        if minutes is None:
+            return None
+        try:
+            if self._read([doctor_id])[doctor_id] is None:
+                self._seed(doctor_id)
+                return minutes
+
+            fields = self._fields(called_at)
+            if self.redis_client is None:
+                with self._lock:
+                    self._apply(self._states[doctor_id], fields, minutes)
+            else:
+                self._script(keys=[self._key(doctor_id)], args=[self.alpha, minutes] + fields)
+        except REDIS_ERRORS:
+            return None
+        return minutes
+
+    def minutes_for(self, doctors, when=None):
+        """
+        {doctor_id: expected minutes per patient} for consults starting at
+        `when` (default now), from one batched read of the averages.
+        """
+        bucket = self._fields(when or datetime.utcnow())[1]
+        try:
+            states = self._read([doctor.id for doctor in doctors])
+            for doctor in doctors:
+                if states[doctor.id] is None:
+                    states[doctor.id] = self._seed(doctor.id)
+        except REDIS_ERRORS:
+            states = {doctor.id: {} for doctor in doctors}
+        estimates = {}
+        for doctor in doctors:
+            state = states[doctor.id]
+            if state.get(f"{bucket}:n", 0) >= MIN_BUCKET_SAMPLES:
+                estimates[doctor.id] = state[bucket]
+            elif state.get('all:n', 0) > 0:
+                estimates[doctor.id] = state['all']
+            else:
+                estimates[doctor.id] = doctor.avg_consultation_time or DEFAULT_MINUTES
+        return estimates
+
+    def minutes_per_patient(self, doctor, when=None):
+        """Expected consult length for one doctor (a User or their id)."""
+        if not isinstance(doctor, User):
+            doctor = db.session.get(User, doctor)
+            if doctor is None:
+                return DEFAULT_MINUTES
+        return self.minutes_for([doctor], when)[doctor.id]
+
+    def estimated_wait(self, doctor, position, when=None):
+        """Whole minutes until the patient at `position` (1-based) is called."""
+        return round((position - 1) * self.minutes_per_patient(doctor, when))
+
+    def clear(self):
+        """Forget every learned average - used for testing."""
+        with self._lock:
+            self._states.clear()
+        if self.redis_client is not None:
+            keys = list(self.redis_client.scan_iter(match=f"{KEY_PREFIX}*", count=1000))
+            if keys:
+                self.redis_client.delete(*keys)
+
+
+_estimator = None
+_estimator_lock = threading.Lock()
+
+
+def consult_time_estimator():
+    """The process-wide estimator, sharing the queue backend's Redis when there is one."""
+    global _estimator
+    if _estimator is None:
+        with _estimator_lock:
+            if _estimator is None:
+                _estimator = ConsultTimeEstimator(QueueService().redis_client)
+    return _estimator
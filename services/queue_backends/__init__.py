@@ -0,0 +1,8 @@
+from .base import QueueBackend
+from .journal import QueueJournal
+from .memory import MemoryQueueBackend
+from .redis_backend import RedisQueueBackend
+from .sharded_redis import HashRing, ShardedRedisQueueBackend
+from .database import DatabaseQueueBackend
+from .async_redis import AsyncRedisQueueBackend
+from .failover import FailoverQueueBackend
@@ -0,0 +1,170 @@
+import json
+
+from .base import QueueBackend
+from .redis_backend import (
+    CLEAR_SCRIPT,
+    DEQUEUE_SCRIPT,
+    ENQUEUE_SCRIPT,
+    EPOCH_KEY,
+    POSITION_KEY_PREFIX,
+    POSITIONS_SCRIPT,
+    QUEUE_KEY_PREFIX,
+    REMOVE_SCRIPT,
+    REORDER_SCRIPT,
+    RedisQueueLayout,
+)
+
+
+class AsyncRedisQueueBackend(RedisQueueLayout):
+    """
+    asyncio twin of RedisQueueBackend on a redis.asyncio client. Same keys,
+    same Lua scripts and same return values; every operation is a coroutine,
+    so one event loop can keep thousands of queue calls in flight at once.
+    """
+
+    name = 'redis'
+    stores_entries = False
+
+    # Offset/limit to rank range, shared with the blocking backends
+    _paging = QueueBackend._paging
+
+    def __init__(self, client):
+        self.redis_client = client
+        self._scripts = {}  # name -> AsyncScript registered with redis_client
+        self._epoch = None  # EPOCH_KEY as last read with a version
+
+    def _get_script(self, name, source):
+        script = self._scripts.get(name)
+        if script is None or script.registered_client is not self.redis_client:
+            script = self.redis_client.register_script(source)
+            self._scripts[name] = script
+        return script
+
+    async def _run_batched(self, name, source, args, group=1):
+        script = self._get_script(name, source)
+        chunks = self._chunks(args, group)
+        if len(chunks) == 1:
+            return [await script(args=chunks[0])]
+        async with self.redis_client.pipeline() as pipe:
+            for chunk in chunks:
+                await script(args=chunk, client=pipe)
+            return await pipe.execute()
+
+    async def enqueue(self, patient_id, doctor_id, priority=0, appointment_id=None, queue_number=None):
+        return await self.bulk_enqueue([{
+            'patient_id': patient_id,
+            'doctor_id': doctor_id,
+            'priority': priority,
+            'appointment_id': appointment_id,
+            'queue_number': queue_number
+        }]) == 1
+
+    async def bulk_enqueue(self, entries):
+        args = self._enqueue_args(entries)
+        if not args:
+            return 0
+        return int(sum(await self._run_batched('enqueue', ENQUEUE_SCRIPT, args, group=4)))
+
+    async def dequeue(self, doctor_id):
+        entry_json = await self._get_script('dequeue', DEQUEUE_SCRIPT)(
+            keys=self._queue_keys(doctor_id),
+            args=[POSITION_KEY_PREFIX]
+        )
+        if not entry_json:
+            return None
+        return json.loads(entry_json)
+
+    async def get_position(self, patient_id):
+        return (await self.get_positions([patient_id]))[patient_id]
+
+    async def get_positions(self, patient_ids):
+        patient_ids = list(dict.fromkeys(patient_ids))
+        if not patient_ids:
+            return {}
+        rows = await self._get_script('positions', POSITIONS_SCRIPT)(args=self._positions_args(patient_ids))
+        return self._decode_positions(patient_ids, rows)
+
+    async def get_queue(self, doctor_id, offset=0, limit=None):
+        if limit is not None and limit <= 0:
+            return []
+        offset, stop = self._paging(offset, limit)
+        queue_key = self._get_queue_key(doctor_id)
+        entries_key = self._get_entries_key(doctor_id)
+
+        if stop is None and offset == 0:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.zrange(queue_key, 0, -1)
+                pipe.hgetall(entries_key)
+                members, payloads = await pipe.execute()
+            payloads = [payloads.get(member) for member in members]
+        else:
+            members = await self.redis_client.zrange(queue_key, offset, -1 if stop is None else stop - 1)
+            payloads = await self.redis_client.hmget(entries_key, members) if members else []
+
+        return self._decode_queue(payloads, offset)
+
+    async def queued_patients(self):
+        keys = [key async for key in self.redis_client.scan_iter(match=f"{POSITION_KEY_PREFIX}*", count=1000)]
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for i in range(0, len(keys), self.BATCH_SIZE):
+                pipe.mget(keys[i:i + self.BATCH_SIZE])
+            values = [value for batch in await pipe.execute() for value in batch]
+        return self._decode_queued(keys, values)
+
+    async def get_queue_length(self, doctor_id):
+        return await self.redis_client.zcard(self._get_queue_key(doctor_id))
+
+    async def get_queue_lengths(self, doctor_ids):
+        doctor_ids = list(dict.fromkeys(doctor_ids))
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for doctor_id in doctor_ids:
+                pipe.zcard(self._get_queue_key(doctor_id))
+            return dict(zip(doctor_ids, await pipe.execute()))
+
+    async def get_version(self, doctor_id):
+        # Read with the epoch, exactly as RedisQueueBackend does
+        version, epoch = await self.redis_client.mget(self._get_version_key(doctor_id), EPOCH_KEY)
+        self._epoch = epoch or await self._create_epoch()
+        return int(version or 0)
+
+    async def get_epoch(self, doctor_id):
+        if self._epoch is None:
+            self._epoch = await self.redis_client.get(EPOCH_KEY) or await self._create_epoch()
+        return self._epoch
+
+    async def _create_epoch(self):
+        await self.redis_client.set(EPOCH_KEY, self._new_epoch(), nx=True)
+        return await self.redis_client.get(EPOCH_KEY)
+
+    async def remove_from_queue(self, patient_id):
+        return await self.bulk_remove([patient_id]) == 1
+
+    async def bulk_remove(self, patient_ids):
+        args = self._remove_args(patient_ids)
+        if not args:
+            return 0
+        return int(sum(await self._run_batched('remove', REMOVE_SCRIPT, args)))
+
+    async def reorder_queue(self, doctor_id, new_order):
+        await self._get_script('reorder', REORDER_SCRIPT)(
+            keys=self._queue_keys(doctor_id),
+            args=self._reorder_args(doctor_id, new_order)
+        )
+        return True
+
+    async def clear_queue(self, doctor_id):
+        cleared = await self._get_script('clear', CLEAR_SCRIPT)(
+            keys=self._queue_keys(doctor_id),
+            args=[POSITION_KEY_PREFIX, str(doctor_id)]
+        )
+        return bool(cleared)
+
+    async def clear_all(self):
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for pattern in (f"{QUEUE_KEY_PREFIX}*", f"{POSITION_KEY_PREFIX}*"):
+                async for key in self.redis_client.scan_iter(match=pattern, count=1000):
+                    if key.endswith(':version'):
+                        pipe.incr(key)
+                    else:
+                        pipe.delete(key)
+            await pipe.execute()
@@ -0,0 +1,155 @@
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+
+
+class QueueBackend(ABC):
+    """
+    Storage for per-doctor patient queues.
+
+    Every backend keeps the same ordering rules so routes can switch between
+    them freely: priority entries (priority > 0) sort first, highest priority
+    first; everyone else is served in join order; an explicit reorder places
+    its entries after priority joiners and before later regular joiners.
+    A patient is in at most one queue - enqueueing again moves them.
+    """
+
+    name = None
+
+    # True when the backend persists QueueEntry rows itself, so callers must
+    # not write their own row for an enqueue or status change
+    stores_entries = False
+
+    # Part of every queue version tag. Backends whose counters start over
+    # on restart set a per-instance value so old tags cannot match again
+    version_epoch = '0'
+
+    @staticmethod
+    def build_entry(patient_id, doctor_id, priority=0, appointment_id=None, queue_number=None, joined_at=None):
+        """
+        Payload stored for a queued patient and the score it sorts by.
+        joined_at defaults to now; rebuilds pass the original join time so
+        restored patients keep their place. Priority scores are the join time
+        less priority * 1e10 (seconds, past any join time before 2286), so
+        they sort below every regular score, highest priority first, and
+        equal priorities stay first come, first served on backends that
+        sort by score alone.
+        """
+        joined_at = joined_at or datetime.utcnow()
+        entry_data = {
+            'patient_id': patient_id,
+            'doctor_id': doctor_id,
+            'priority': priority,
+            'appointment_id': appointment_id,
+            'queue_number': queue_number,
+            'joined_at': joined_at.isoformat()
+        }
+        score = joined_at.timestamp() - priority * 1e10 if priority > 0 else joined_at.timestamp()
+        return entry_data, score
+
+    @staticmethod
+    def stamp_joins(entries):
+        """
+        Copies of entries each with a joined_at, for backends that sort by
+        join time alone: entries without one get the current time, moved a
+        microsecond past the one before if the clock has not advanced, so
+        a batch keeps its order.
+        """
+        stamped, last = [], None
+        for entry in entries:
+            joined_at = entry.get('joined_at')
+            if joined_at is None:
+                joined_at = datetime.utcnow()
+                if last is not None and joined_at <= last:
+                    joined_at = last + timedelta(microseconds=1)
+                last = joined_at
+            stamped.append(dict(entry, joined_at=joined_at))
+        return stamped
+
+    @staticmethod
+    def strip_entry(entry):
+        """Payload to store for an entry handed back by get_queue."""
+        return {key: value for key, value in entry.items() if key != 'position'}
+
+    @abstractmethod
+    def enqueue(self, patient_id, doctor_id, priority=0, appointment_id=None, queue_number=None):
+        """Add a patient to a doctor's queue. Returns True."""
+
+    @abstractmethod
+    def bulk_enqueue(self, entries):
+        """
+        Enqueue many entry dicts at once. Returns the number enqueued.
+        An entry may carry the datetime it originally joined as 'joined_at'.
+        """
+
+    @abstractmethod
+    def dequeue(self, doctor_id):
+        """Atomically pop and return the head of a doctor's queue, or None."""
+
+    @abstractmethod
+    def get_position(self, patient_id):
+        """{'position', 'total', 'doctor_id', 'entry'} for a queued patient, or None."""
+
+    @abstractmethod
+    def get_positions(self, patient_ids):
+        """{patient_id: get_position(patient_id)} resolved in one batch."""
+
+    @abstractmethod
+    def get_queue(self, doctor_id, offset=0, limit=None):
+        """Entries from rank offset (0-based) onwards, each with a 1-based 'position'."""
+
+    @abstractmethod
+    def queued_patients(self):
+        """{patient_id: doctor_id} for every queued patient, across all doctors."""
+
+    @abstractmethod
+    def get_queue_length(self, doctor_id):
+        """Number of patients waiting for a doctor."""
+
+    def get_queue_lengths(self, doctor_ids):
+        """{doctor_id: get_queue_length(doctor_id)}; backends batch it where a lookup costs a round trip."""
+        return {doctor_id: self.get_queue_length(doctor_id) for doctor_id in doctor_ids}
+
+    @abstractmethod
+    def remove_from_queue(self, patient_id):
+        """Remove a patient from whichever queue they are in. Returns True if removed."""
+
+    @abstractmethod
+    def bulk_remove(self, patient_ids):
+        """Remove many patients. Returns the number actually removed."""
+
+    @abstractmethod
+    def reorder_queue(self, doctor_id, new_order):
+        """Replace a doctor's queue with new_order; patients left out leave the queue."""
+
+    def get_version(self, doctor_id):
+        """
+        Counter bumped by every change to a doctor's queue, so readers can
+        tell whether a queue they already hold is still current. None when
+        the backend keeps no counter, which disables version-based caching.
+        """
+        return None
+
+    def get_epoch(self, doctor_id):
+        """
+        Tag of the run of counters get_version last read for a doctor: it
+        changes whenever they may have started over, so a version is only
+        comparable with one of the same epoch.
+        """
+        return self.version_epoch
+
+    def ping(self):
+        """Raise if the storage cannot be reached; backends in this process always can."""
+        return True
+
+    @abstractmethod
+    def clear_queue(self, doctor_id):
+        """Empty a doctor's queue. Returns True if it had any entries."""
+
+    @abstractmethod
+    def clear_all(self):
+        """Empty every queue - used for testing."""
+
+    def _paging(self, offset, limit):
+        offset = max(offset or 0, 0)
+        stop = None if limit is None else offset + limit
+        return offset, stop
@@ -0,0 +1,243 @@
+from datetime import datetime
+
+from models import db, QueueEntry
+from .base import QueueBackend
+
+
+class DatabaseQueueBackend(QueueBackend):
+    """
+    Queues derived straight from the queue_entries table: a patient is
+    queued while their QueueEntry is 'waiting'. The table is the single
+    source of truth, so queues survive restarts without Redis and every
+    operation is one transaction. Ranks come from window functions over
+    the (doctor_id, status, priority, joined_at) index.
+
+    Order: priority joiners by priority desc, then entries placed by
+    reorder_queue (queue_position), then everyone else by joined_at.
+    Requires an application context.
+    """
+
+    name = 'database'
+    stores_entries = True
+
+    # Attempts at claiming the queue head before giving up under contention
+    DEQUEUE_RETRIES = 5
+
+    # Patient ids per IN (...) list, well below SQLite's 32766 bound parameters
+    IN_CHUNK = 5000
+
+    def _order_by(self):
+        return (
+            QueueEntry.priority.desc(),
+            QueueEntry.queue_position.is_(None),
+            QueueEntry.queue_position,
+            QueueEntry.joined_at,
+            QueueEntry.id
+        )
+
+    def _waiting(self):
+        return QueueEntry.query.filter(QueueEntry.status == 'waiting')
+
+    def _entry(self, row):
+        return {
+            'id': row.id,
+            'patient_id': row.patient_id,
+            'doctor_id': row.doctor_id,
+            'priority': row.priority,
+            'appointment_id': row.appointment_id,
+            'queue_number': row.queue_number,
+            'joined_at': row.joined_at.isoformat() if row.joined_at else None
+        }
+
+    def _cancel_waiting(self, *criteria):
+        # Bulk UPDATE; returns the number of rows that left the queue
+        return self._waiting().filter(*criteria).update(
+            {QueueEntry.status: 'cancelled'}, synchronize_session='fetch'
+        )
+
+    def _cancel_patients(self, patient_ids, *criteria):
+        # _cancel_waiting for these patients, one UPDATE per IN_CHUNK ids
+        patient_ids = list(patient_ids)
+        return sum(
+            self._cancel_waiting(QueueEntry.patient_id.in_(patient_ids[i:i + self.IN_CHUNK]), *criteria)
+            for i in range(0, len(patient_ids), self.IN_CHUNK)
+        )
+
+    def _commit(self):
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def enqueue(self, patient_id, doctor_id, priority=0, appointment_id=None, queue_number=None):
+        return self.bulk_enqueue([{
+            'patient_id': patient_id,
+            'doctor_id': doctor_id,
+            'priority': priority,
+            'appointment_id': appointment_id,
+            'queue_number': queue_number
+        }]) == 1
+
+    def bulk_enqueue(self, entries):
+        entries = list(entries)
+        if not entries:
+            return 0
+        # A patient is in at most one queue: joining again replaces the old entry
+        self._cancel_patients({entry['patient_id'] for entry in entries})
+        db.session.add_all([
+            QueueEntry(
+                patient_id=entry['patient_id'],
+                doctor_id=entry['doctor_id'],
+                appointment_id=entry.get('appointment_id'),
+                queue_number=entry.get('queue_number'),
+                priority=entry.get('priority', 0),
+                joined_at=entry.get('joined_at') or datetime.utcnow(),
+                status='waiting'
+            )
+            for entry in entries
+        ])
+        self._commit()
+        return len(entries)
+
+    def dequeue(self, doctor_id):
+        for _ in range(self.DEQUEUE_RETRIES):
+            head = self._waiting().filter(QueueEntry.doctor_id == doctor_id).order_by(*self._order_by()).first()
+            if head is None:
+                return None
+
+            # Conditional claim: only one concurrent caller can flip the row
+            claimed = QueueEntry.query.filter(
+                QueueEntry.id == head.id,
+                QueueEntry.status == 'waiting'
+            ).update(
+                {QueueEntry.status: 'in_consultation', QueueEntry.called_at: datetime.utcnow()},
+                synchronize_session='fetch'
+            )
+            self._commit()
+            if claimed:
+                return self._entry(head)
+        return None
+
+    def get_position(self, patient_id):
+        return self.get_positions([patient_id])[patient_id]
+
+    def get_positions(self, patient_ids):
+        patient_ids = list(dict.fromkeys(patient_ids))
+        positions = {patient_id: None for patient_id in patient_ids}
+        if not patient_ids:
+            return positions
+
+        # Rank every waiting entry of the doctors involved in one query
+        doctor_ids = db.session.query(QueueEntry.doctor_id).filter(
+            QueueEntry.status == 'waiting',
+            QueueEntry.patient_id.in_(patient_ids)
+        )
+        ranked = db.session.query(
+            QueueEntry.id.label('id'),
+            QueueEntry.patient_id.label('patient_id'),
+            db.func.row_number().over(partition_by=QueueEntry.doctor_id, order_by=self._order_by()).label('position'),
+            db.func.count(QueueEntry.id).over(partition_by=QueueEntry.doctor_id).label('total')
+        ).filter(
+            QueueEntry.status == 'waiting',
+            QueueEntry.doctor_id.in_(doctor_ids)
+        ).subquery()
+
+        rows = db.session.query(QueueEntry, ranked.c.position, ranked.c.total).join(
+            ranked, ranked.c.id == QueueEntry.id
+        ).filter(ranked.c.patient_id.in_(patient_ids)).all()
+
+        for row, position, total in rows:
+            positions[row.patient_id] = {
+                'position': position,
+                'total': total,
+                'doctor_id': row.doctor_id,
+                'entry': self._entry(row)
+            }
+        return positions
+
+    def get_queue(self, doctor_id, offset=0, limit=None):
+        if limit is not None and limit <= 0:
+            return []
+        offset, stop = self._paging(offset, limit)
+        query = self._waiting().filter(QueueEntry.doctor_id == doctor_id).order_by(*self._order_by()).offset(offset)
+        if limit is not None:
+            query = query.limit(limit)
+
+        queue_list = []
+        for idx, row in enumerate(query.all()):
+            entry = self._entry(row)
+            entry['position'] = offset + idx + 1
+            queue_list.append(entry)
+        return queue_list
+
+    def queued_patients(self):
+        rows = db.session.query(QueueEntry.patient_id, QueueEntry.doctor_id).filter(
+            QueueEntry.status == 'waiting'
+        ).order_by(QueueEntry.joined_at, QueueEntry.id).all()
+        return {patient_id: doctor_id for patient_id, doctor_id in rows}
+
+    def get_queue_length(self, doctor_id):
+        # Plain COUNT answered from the covering index; Query.count() would wrap a subquery
+        return db.session.query(db.func.count(QueueEntry.id)).filter(
+            QueueEntry.doctor_id == doctor_id,
+            QueueEntry.status == 'waiting'
+        ).scalar()
+
+    def get_queue_lengths(self, doctor_ids):
+        doctor_ids = list(dict.fromkeys(doctor_ids))
+        lengths = {doctor_id: 0 for doctor_id in doctor_ids}
+        if doctor_ids:
+            lengths.update(db.session.query(QueueEntry.doctor_id, db.func.count(QueueEntry.id)).filter(
+                QueueEntry.doctor_id.in_(doctor_ids),
+                QueueEntry.status == 'waiting'
+            ).group_by(QueueEntry.doctor_id).all())
+        return lengths
+
+    def remove_from_queue(self, patient_id):
+        return self.bulk_remove([patient_id]) == 1
+
+    def bulk_remove(self, patient_ids):
+        patient_ids = list(dict.fromkeys(patient_ids))
+        if not patient_ids:
+            return 0
+        removed = self._cancel_patients(patient_ids)
+        self._commit()
+        return removed
+
+    def reorder_queue(self, doctor_id, new_order):
+        ordered_ids = {entry['patient_id'] for entry in new_order}
+        self._cancel_patients(ordered_ids, QueueEntry.doctor_id != doctor_id)
+
+        # Compared here rather than with NOT IN, which would bind every id at once
+        rows = {}
+        for row in self._waiting().filter(QueueEntry.doctor_id == doctor_id):
+            if row.patient_id in ordered_ids:
+                rows[row.patient_id] = row
+            else:
+                row.status = 'cancelled'
+        for idx, entry in enumerate(new_order):
+            row = rows.get(entry['patient_id'])
+            if row is None:
+                row = QueueEntry(
+                    patient_id=entry['patient_id'],
+                    doctor_id=doctor_id,
+                    appointment_id=entry.get('appointment_id'),
+                    queue_number=entry.get('queue_number'),
+                    status='waiting'
+                )
+                db.session.add(row)
+            # An explicit order overrides priority for the entries it places
+            row.priority = 0
+            row.queue_position = idx
+        self._commit()
+        return True
+
+    def clear_queue(self, doctor_id):
+        cleared = self._cancel_waiting(QueueEntry.doctor_id == doctor_id)
+        self._commit()
+        return bool(cleared)
+
+    def clear_all(self):
+        self._cancel_waiting()
+        self._commit()
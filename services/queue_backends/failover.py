@@ -0,0 +1,252 @@
+import threading
+import time
+from collections import deque
+
+import redis
+
+from .base import QueueBackend
+from .memory import MemoryQueueBackend
+
+# Errors meaning Redis could not be reached, as opposed to a bad command
+REDIS_ERRORS = (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError)
+
+
+class FailoverQueueBackend(QueueBackend):
+    """
+    A Redis backend behind a circuit breaker, with an in-memory backend
+    standing in while Redis is unreachable.
+
+    Closed (healthy): every call goes to Redis. After failure_threshold
+    calls in a row fail to reach it, the circuit opens and the failing call
+    and all that follow are served by the fallback. The fallback is first
+    seeded through `seed(fallback)` (e.g. from the waiting queue_entries
+    rows); a seed returning false is tried again on the next call.
+
+    Open (degraded): changes are applied to the fallback and buffered, as
+    effects rather than calls, so replaying them gives the same result: a
+    dequeue is buffered as the removal of the patient it popped, a join
+    keeps the time it happened. Every retry_after seconds a call pings
+    Redis; once it answers the buffer is replayed onto the queues Redis
+    still holds, in order, and the circuit closes. A Redis that came back
+    without its data only gets the buffered changes, so run rebuild-queues
+    (or QUEUE_REBUILD_ON_STARTUP) after such a restart.
+
+    While degraded get_version returns None: the fallback's counters could
+    meet Redis's again after failback, so clients resync instead.
+    """
+
+    def __init__(self, primary, fallback=None, seed=None, failure_threshold=1, retry_after=5.0,
+                 max_buffered=100000, available=True, clock=time.monotonic):
+        self.primary = primary
+        self.fallback = fallback if fallback is not None else MemoryQueueBackend()
+        self.seed = seed
+        self.failure_threshold = failure_threshold
+        self.retry_after = retry_after
+        self.max_buffered = max_buffered
+        self._clock = clock
+        # Held for every degraded call and for failing over and back, so no
+        # change can land in the fallback after its buffer was replayed
+        self._lock = threading.RLock()
+        self._buffer = deque()  # (method, args) to replay onto Redis
+        self._failures = 0
+        self._seeded = False
+        self._dropping = False  # the buffer filled up during this outage
+        self._opened_at = None  # clock time the circuit opened; None while closed
+        self._next_probe = 0
+        self.stats = {
+            'failovers': 0,
+            'failbacks': 0,
+            'failed_probes': 0,
+            'replayed': 0,
+            'dropped': 0,
+            'degraded_seconds': 0.0,
+            'last_error': None
+        }
+        if not available:
+            self._open('unreachable at startup')
+
+    @property
+    def name(self):
+        return self.primary.name
+
+    @property
+    def redis_client(self):
+        return getattr(self.primary, 'redis_client', None)
+
+    @property
+    def degraded(self):
+        return self._opened_at is not None
+
+    def __getattr__(self, name):
+        # Anything else the primary offers (shards, rebalance) is reached as before
+        if name == 'primary':
+            raise AttributeError(name)
+        return getattr(self.primary, name)
+
+    def _open(self, error):
+        # Caller must hold the lock, or be the constructor
+        self._opened_at = self._clock()
+        self._next_probe = self._opened_at + self.retry_after
+        self.stats['failovers'] += 1
+        self.stats['last_error'] = str(error)
+        self._dropping = False
+        print(f"[WARN] Redis unavailable ({error}); serving queues from memory until it answers again.")
+
+    def _close(self):
+        # Caller must hold the lock
+        self.stats['degraded_seconds'] += self._clock() - self._opened_at
+        self.stats['failbacks'] += 1
+        self._opened_at = None
+        self._failures = 0
+        # Reseeded afresh on the next outage
+        self.fallback.clear_all()
+        self._seeded = False
+        print(f"[OK] Redis is back; replayed {self.stats['replayed']} buffered queue changes so far.")
+
+    def _failed(self, error):
+        with self._lock:
+            self._failures += 1
+            self.stats['last_error'] = str(error)
+            if self._failures < self.failure_threshold:
+                raise error
+            if self._opened_at is None:
+                self._open(error)
+
+    def _try_failback(self):
+        """Ping Redis if a probe is due and, if it answers, replay the buffer and close."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._clock() < self._next_probe:
+                return False
+            self._next_probe = self._clock() + self.retry_after
+            try:
+                self.primary.ping()
+                while self._buffer:
+                    method, args = self._buffer[0]
+                    getattr(self.primary, method)(*args)
+                    self._buffer.popleft()
+                    self.stats['replayed'] += 1
+            except REDIS_ERRORS as e:
+                # What was replayed is off the buffer; the rest waits for the next probe
+                self.stats['failed_probes'] += 1
+                self.stats['last_error'] = str(e)
+                return False
+            self._close()
+            return True
+
+    def _run(self, call, replay=None):
+        """
+        call(backend) on Redis while it is reachable, otherwise on the
+        fallback; replay(result) then names the change to buffer for Redis
+        as (method, args), or None if nothing changed.
+        """
+        while True:
+            if self._opened_at is None or self._try_failback():
+                try:
+                    result = call(self.primary)
+                    self._failures = 0
+                    return result
+                except REDIS_ERRORS as e:
+                    self._failed(e)
+            with self._lock:
+                if self._opened_at is None:
+                    continue  # recovered while this call waited for the lock
+                if not self._seeded:
+                    self._seeded = self.seed is None or bool(self.seed(self.fallback))
+                result = call(self.fallback)
+                change = replay(result) if replay is not None else None
+                if change is not None:
+                    if len(self._buffer) < self.max_buffered:
+                        self._buffer.append(change)
+                    else:
+                        self.stats['dropped'] += 1
+                        if not self._dropping:
+                            self._dropping = True
+                            print(f"[WARN] Failover buffer is full ({self.max_buffered} changes); later queue changes "
+                                  f"will not reach Redis. Run rebuild-queues once it is back.")
+                return result
+
+    def metrics(self):
+        """Circuit state and time spent degraded, for the metrics endpoint."""
+        with self._lock:
+            outage = self._clock() - self._opened_at if self._opened_at is not None else 0.0
+            return dict(
+                self.stats,
+                state='degraded' if self._opened_at is not None else 'healthy',
+                current_outage_seconds=round(outage, 3),
+                degraded_seconds=round(self.stats['degraded_seconds'] + outage, 3),
+                buffered=len(self._buffer)
+            )
+
+    def ping(self):
+        return self.primary.ping()
+
+    def enqueue(self, patient_id, doctor_id, priority=0, appointment_id=None, queue_number=None):
+        return self.bulk_enqueue([{
+            'patient_id': patient_id,
+            'doctor_id': doctor_id,
+            'priority': priority,
+            'appointment_id': appointment_id,
+            'queue_number': queue_number
+        }]) == 1
+
+    def bulk_enqueue(self, entries):
+        # Join times are fixed now, one per entry, so a replayed join keeps its
+        # place and a batch keeps its order on either backend
+        entries = self.stamp_joins(entries)
+        return self._run(lambda backend: backend.bulk_enqueue(entries), lambda result: ('bulk_enqueue', (entries,)))
+
+    def dequeue(self, doctor_id):
+        return self._run(
+            lambda backend: backend.dequeue(doctor_id),
+            lambda entry: ('bulk_remove', ([entry['patient_id']],)) if entry else None
+        )
+
+    def get_position(self, patient_id):
+        return self._run(lambda backend: backend.get_position(patient_id))
+
+    def get_positions(self, patient_ids):
+        return self._run(lambda backend: backend.get_positions(patient_ids))
+
+    def get_queue(self, doctor_id, offset=0, limit=None):
+        return self._run(lambda backend: backend.get_queue(doctor_id, offset, limit))
+
+    def queued_patients(self):
+        return self._run(lambda backend: backend.queued_patients())
+
+    def get_queue_length(self, doctor_id):
+        return self._run(lambda backend: backend.get_queue_length(doctor_id))
+
+    def get_queue_lengths(self, doctor_ids):
+        return self._run(lambda backend: backend.get_queue_lengths(doctor_ids))
+
+    def get_version(self, doctor_id):
+        return self._run(lambda backend: backend.get_version(doctor_id) if backend is self.primary else None)
+
+    def get_epoch(self, doctor_id):
+        return self._run(lambda backend: backend.get_epoch(doctor_id))
+
+    def remove_from_queue(self, patient_id):
+        return self.bulk_remove([patient_id]) == 1
+
+    def bulk_remove(self, patient_ids):
+        patient_ids = list(patient_ids)
+        # Buffered even when the fallback did not hold them: Redis may still hold
+        # them from before the outage
+        return self._run(lambda backend: backend.bulk_remove(patient_ids), lambda result: ('bulk_remove', (patient_ids,)))
+
+    def reorder_queue(self, doctor_id, new_order):
+        return self._run(
+            lambda backend: backend.reorder_queue(doctor_id, new_order),
+            lambda result: ('reorder_queue', (doctor_id, new_order))
+        )
+
+    def clear_queue(self, doctor_id):
+        return self._run(lambda backend: backend.clear_queue(doctor_id), lambda result: ('clear_queue', (doctor_id,)))
+
+    def clear_all(self):
+        with self._lock:
+            # Nothing buffered before a reset matters any more
+            self._buffer.clear()
+        return self._run(lambda backend: backend.clear_all(), lambda result: ('clear_all', ()))
@@ -0,0 +1,391 @@
+import itertools
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from .base import QueueBackend
+from ..skiplist import IndexableSkipList
+
+
+class MemoryQueueBackend(QueueBackend):
+    """
+    Process-local queues: one order-statistic skip list per doctor keyed by
+    (score, seq), each guarded by its own lock so unrelated doctors never
+    contend. Data does not survive a restart unless a QueueJournal is given,
+    in which case every change is logged and the queues are restored from
+    the journal on construction.
+    """
+
+    name = 'memory'
+
+    def __init__(self, journal=None):
+        # Guards creation of per-doctor locks and whole-store resets only;
+        # queue operations lock just the doctor queue they touch
+        self._lock = threading.Lock()
+        self._memory_queues = defaultdict(IndexableSkipList)  # doctor_id -> (score, seq) -> entry_data
+        self._memory_positions = {}  # patient_id -> doctor_id
+        self._memory_keys = {}  # patient_id -> (score, seq) skip list key
+        self._memory_locks = {}  # doctor_id -> lock for that doctor's queue
+        self._versions = defaultdict(int)  # doctor_id -> change counter, bumped under the doctor's lock
+        self.version_epoch = uuid.uuid4().hex[:8]  # counters restart with the process
+        self._counter = itertools.count()  # Counter for unique tuple ordering
+        self._journal = journal
+        self._snapshot_lock = threading.Lock()  # one snapshot at a time
+        self._snapshot_thread = None
+        if journal is not None:
+            self._restore()
+            journal.open()
+
+    def _get_doctor_lock(self, doctor_id):
+        lock = self._memory_locks.get(doctor_id)
+        if lock is None:
+            with self._lock:
+                lock = self._memory_locks.setdefault(doctor_id, threading.Lock())
+        return lock
+
+    @contextmanager
+    def _doctor_locks(self, *doctor_ids):
+        # Several doctors' locks, always taken in doctor_id order so two
+        # moves in opposite directions cannot deadlock. The lock objects are
+        # fetched first: _get_doctor_lock may need self._lock, which must
+        # never be waited for while a doctor lock is held
+        doctor_ids = sorted({doctor_id for doctor_id in doctor_ids if doctor_id is not None})
+        locks = [self._get_doctor_lock(doctor_id) for doctor_id in doctor_ids]
+        with ExitStack() as stack:
+            for lock in locks:
+                stack.enter_context(lock)
+            yield
+
+    @contextmanager
+    def _move_locks(self, doctor_id, patient_ids):
+        # Holds doctor_id's lock and those of the doctors the patients are
+        # queued with now, so taking them out of one queue and into another
+        # is one step. Taken again if a patient moved elsewhere meanwhile
+        while True:
+            sources = {self._memory_positions.get(patient_id) for patient_id in patient_ids}
+            with self._doctor_locks(doctor_id, *sources):
+                if all(
+                    self._memory_positions.get(patient_id) in sources | {None, doctor_id}
+                    for patient_id in patient_ids
+                ):
+                    yield
+                    return
+
+    def _insert(self, entry_data, score):
+        # Caller must hold the doctor's lock.
+        # Counter breaks score ties so keys are unique and FIFO within a score
+        key = (score, next(self._counter))
+        self._memory_queues[entry_data['doctor_id']].insert(key, entry_data)
+        self._memory_positions[entry_data['patient_id']] = entry_data['doctor_id']
+        self._memory_keys[entry_data['patient_id']] = key
+        self._versions[entry_data['doctor_id']] += 1
+        self._log(['put', key[0], key[1], entry_data])
+
+    def _discard(self, patient_id, doctor_id):
+        # Caller must hold the doctor's lock
+        if self._memory_positions.get(patient_id) != doctor_id:
+            return False
+        del self._memory_positions[patient_id]
+        key = self._memory_keys.pop(patient_id, None)
+        if key is None:
+            return False
+        try:
+            self._memory_queues[doctor_id].remove(key)
+        except KeyError:
+            return False
+        self._versions[doctor_id] += 1
+        self._log(['del', patient_id])
+        return True
+
+    def _log(self, record):
+        # Caller holds the lock of the queue it changed, so records of one
+        # doctor's queue reach the journal in the order they were applied
+        if self._journal is not None and self._journal.append(record):
+            thread = self._snapshot_thread
+            if thread is None or not thread.is_alive():
+                self._snapshot_thread = threading.Thread(target=self._background_snapshot, daemon=True)
+                self._snapshot_thread.start()
+
+    def _background_snapshot(self):
+        if self._snapshot_lock.acquire(blocking=False):
+            try:
+                self._write_snapshot()
+            finally:
+                self._snapshot_lock.release()
+
+    def snapshot(self):
+        """Write a snapshot now and return the journal's timing stats."""
+        with self._snapshot_lock:
+            self._write_snapshot()
+        return dict(self._journal.stats)
+
+    def _write_snapshot(self):
+        # Rotate first: anything the capture below misses is in the new log.
+        # Each queue is captured under its own lock only, and entries are never
+        # mutated once queued, so the list copy shares them instead of cloning.
+        # A patient moved mid-capture can land in two queues; _restore keeps
+        # the later copy
+        generation = self._journal.rotate()
+        captured = {}
+        for doctor_id in list(self._memory_queues):
+            with self._get_doctor_lock(doctor_id):
+                queue = self._memory_queues.get(doctor_id)
+                captured[doctor_id] = list(queue) if queue else []
+        self._journal.write_snapshot(generation, next(self._counter), captured)
+
+    def _restore(self):
+        started = time.perf_counter()
+        queues, seq, records = self._journal.load()
+        # Where a snapshot holds a patient twice, the copy with the higher
+        # sequence number was queued last and is the one they are in
+        latest = {}  # patient_id -> (seq, doctor_id)
+        for doctor_id, rows in queues.items():
+            for key, entry in rows:
+                latest[entry['patient_id']] = max(latest.get(entry['patient_id'], (-1, None)), (key[1], doctor_id))
+        for doctor_id, rows in queues.items():
+            queue = IndexableSkipList.from_sorted(
+                (tuple(key), entry) for key, entry in rows if latest[entry['patient_id']] == (key[1], doctor_id)
+            )
+            self._memory_queues[doctor_id] = queue
+            for key, entry in queue:
+                self._memory_positions[entry['patient_id']] = doctor_id
+                self._memory_keys[entry['patient_id']] = key
+        for record in records:
+            seq = max(seq, self._replay(record))
+        self._counter = itertools.count(seq + 1)
+        self._journal.stats['restore_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        self._journal.stats['restored_entries'] = len(self._memory_positions)
+
+    def _replay_drop(self, patient_id):
+        doctor_id = self._memory_positions.pop(patient_id, None)
+        key = self._memory_keys.pop(patient_id, None)
+        if doctor_id is not None and key is not None:
+            try:
+                self._memory_queues[doctor_id].remove(key)
+            except KeyError:
+                pass
+
+    def _replay(self, record):
+        # Single-threaded, before the backend is shared. Returns the highest
+        # sequence number the record used so the counter resumes above it
+        op = record[0]
+        if op == 'put':
+            score, seq, entry = record[1], record[2], record[3]
+            self._replay_drop(entry['patient_id'])
+            key = (score, seq)
+            self._memory_queues[entry['doctor_id']].insert(key, entry)
+            self._memory_positions[entry['patient_id']] = entry['doctor_id']
+            self._memory_keys[entry['patient_id']] = key
+            return seq
+        if op == 'del':
+            self._replay_drop(record[1])
+        elif op == 'reorder':
+            doctor_id, rows = record[1], record[2]
+            for key, entry in self._memory_queues.pop(doctor_id, []):
+                self._memory_positions.pop(entry['patient_id'], None)
+                self._memory_keys.pop(entry['patient_id'], None)
+            for score, seq, entry in rows:
+                self._replay_drop(entry['patient_id'])
+            queue = IndexableSkipList.from_sorted(((score, seq), entry) for score, seq, entry in rows)
+            self._memory_queues[doctor_id] = queue
+            for key, entry in queue:
+                self._memory_positions[entry['patient_id']] = doctor_id
+                self._memory_keys[entry['patient_id']] = key
+            return max([0] + [seq for score, seq, entry in rows])
+        elif op == 'clear':
+            for key, entry in self._memory_queues.pop(record[1], []):
+                self._memory_positions.pop(entry['patient_id'], None)
+                self._memory_keys.pop(entry['patient_id'], None)
+        elif op == 'clear_all':
+            self._memory_queues.clear()
+            self._memory_positions.clear()
+            self._memory_keys.clear()
+        return 0
+
+    def _locate(self, patient_id, doctor_id):
+        # Caller must hold the doctor's lock
+        if self._memory_positions.get(patient_id) != doctor_id:
+            return None
+        queue = self._memory_queues[doctor_id]
+        key = self._memory_keys.get(patient_id)
+        rank = queue.rank(key) if key is not None else None
+        if rank is None:
+            return None
+        return {
+            'position': rank + 1,
+            'total': len(queue),
+            'doctor_id': doctor_id,
+            'entry': queue[rank][1].copy()
+        }
+
+    def _move_out(self, patient_id):
+        # Caller must hold _move_locks for the patient
+        current = self._memory_positions.get(patient_id)
+        if current is not None:
+            self._discard(patient_id, current)
+
+    def enqueue(self, patient_id, doctor_id, priority=0, appointment_id=None, queue_number=None):
+        entry_data, score = self.build_entry(patient_id, doctor_id, priority, appointment_id, queue_number)
+        with self._move_locks(doctor_id, [patient_id]):
+            self._move_out(patient_id)
+            self._insert(entry_data, score)
+        return True
+
+    def bulk_enqueue(self, entries):
+        by_doctor = defaultdict(list)
+        count = 0
+        for entry in entries:
+            entry_data, score = self.build_entry(
+                entry['patient_id'],
+                entry['doctor_id'],
+                entry.get('priority', 0),
+                entry.get('appointment_id'),
+                entry.get('queue_number'),
+                entry.get('joined_at')
+            )
+            by_doctor[entry_data['doctor_id']].append((entry_data, score))
+            count += 1
+        for doctor_id, doctor_entries in by_doctor.items():
+            with self._move_locks(doctor_id, [entry_data['patient_id'] for entry_data, score in doctor_entries]):
+                for entry_data, score in doctor_entries:
+                    self._move_out(entry_data['patient_id'])
+                    self._insert(entry_data, score)
+        return count
+
+    def dequeue(self, doctor_id):
+        with self._get_doctor_lock(doctor_id):
+            head = self._memory_queues[doctor_id].pop_first()
+            if head is None:
+                return None
+
+            key, entry = head
+            self._memory_positions.pop(entry['patient_id'], None)
+            self._memory_keys.pop(entry['patient_id'], None)
+            self._versions[doctor_id] += 1
+            self._log(['del', entry['patient_id']])
+            return entry
+
+    def get_position(self, patient_id):
+        doctor_id = self._memory_positions.get(patient_id)
+        if doctor_id is None:
+            return None
+
+        with self._get_doctor_lock(doctor_id):
+            # The patient may have left or moved while we waited for the lock
+            return self._locate(patient_id, doctor_id)
+
+    def get_positions(self, patient_ids):
+        patient_ids = list(dict.fromkeys(patient_ids))
+        positions = {patient_id: None for patient_id in patient_ids}
+
+        # One lock acquisition per doctor involved
+        by_doctor = defaultdict(list)
+        for patient_id in patient_ids:
+            doctor_id = self._memory_positions.get(patient_id)
+            if doctor_id is not None:
+                by_doctor[doctor_id].append(patient_id)
+
+        for doctor_id, doctor_patients in by_doctor.items():
+            with self._get_doctor_lock(doctor_id):
+                for patient_id in doctor_patients:
+                    positions[patient_id] = self._locate(patient_id, doctor_id)
+        return positions
+
+    def get_queue(self, doctor_id, offset=0, limit=None):
+        if limit is not None and limit <= 0:
+            return []
+        offset, stop = self._paging(offset, limit)
+        with self._get_doctor_lock(doctor_id):
+            queue_list = []
+            for idx, (key, entry) in enumerate(self._memory_queues[doctor_id].items(offset, stop)):
+                entry_copy = entry.copy()
+                entry_copy['position'] = offset + idx + 1
+                queue_list.append(entry_copy)
+
+            return queue_list
+
+    def queued_patients(self):
+        # dict() copies in one step under the GIL, so no doctor lock is needed
+        return dict(self._memory_positions)
+
+    def get_queue_length(self, doctor_id):
+        with self._get_doctor_lock(doctor_id):
+            return len(self._memory_queues[doctor_id])
+
+    def get_version(self, doctor_id):
+        return self._versions.get(doctor_id, 0)
+
+    def remove_from_queue(self, patient_id):
+        doctor_id = self._memory_positions.get(patient_id)
+        if doctor_id is None:
+            return False
+
+        with self._get_doctor_lock(doctor_id):
+            return self._discard(patient_id, doctor_id)
+
+    def bulk_remove(self, patient_ids):
+        by_doctor = defaultdict(list)
+        for patient_id in patient_ids:
+            doctor_id = self._memory_positions.get(patient_id)
+            if doctor_id is not None:
+                by_doctor[doctor_id].append(patient_id)
+
+        removed = 0
+        for doctor_id, doctor_patients in by_doctor.items():
+            with self._get_doctor_lock(doctor_id):
+                for patient_id in doctor_patients:
+                    if self._discard(patient_id, doctor_id):
+                        removed += 1
+        return removed
+
+    def reorder_queue(self, doctor_id, new_order):
+        new_entries = [self.strip_entry(entry) for entry in new_order]
+        with self._move_locks(doctor_id, [entry['patient_id'] for entry in new_entries]):
+            for entry in new_entries:
+                if self._memory_positions.get(entry['patient_id']) != doctor_id:
+                    self._move_out(entry['patient_id'])
+            for key, entry in self._memory_queues[doctor_id]:
+                self._memory_positions.pop(entry['patient_id'], None)
+                self._memory_keys.pop(entry['patient_id'], None)
+
+            new_queue = IndexableSkipList()
+            self._memory_queues[doctor_id] = new_queue
+            for idx, entry in enumerate(new_entries):
+                key = (idx, next(self._counter))
+                new_queue.insert(key, entry)
+                self._memory_positions[entry['patient_id']] = doctor_id
+                self._memory_keys[entry['patient_id']] = key
+            self._versions[doctor_id] += 1
+            self._log(['reorder', doctor_id, [[key[0], key[1], entry] for key, entry in new_queue]])
+        return True
+
+    def clear_queue(self, doctor_id):
+        with self._get_doctor_lock(doctor_id):
+            queue = self._memory_queues.pop(doctor_id, None)
+            if not queue:
+                return False
+            # Remove position entries for patients in this queue
+            for key, entry in queue:
+                self._memory_positions.pop(entry['patient_id'], None)
+                self._memory_keys.pop(entry['patient_id'], None)
+            self._versions[doctor_id] += 1
+            self._log(['clear', doctor_id])
+            return True
+
+    def clear_all(self):
+        # No doctor lock can be created while self._lock is held, so these
+        # are all of them; taken in the same order as _doctor_locks
+        with self._lock, ExitStack() as stack:
+            for doctor_id in sorted(self._memory_locks):
+                stack.enter_context(self._memory_locks[doctor_id])
+            self._memory_queues.clear()
+            self._memory_positions.clear()
+            self._memory_keys.clear()
+            # Versions keep counting rather than reset, so a queue cached
+            # before the reset can never match a later version
+            for doctor_id in list(self._versions):
+                self._versions[doctor_id] += 1
+            self._counter = itertools.count()
+            self._log(['clear_all'])
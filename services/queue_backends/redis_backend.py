@@ -0,0 +1,429 @@
+import json
+import uuid
+
+from .base import QueueBackend
+
+# Key layout, per doctor and per patient:
+#   queue:doctor:{doctor_id}          sorted set, member = patient_id, score = sort score
+#   queue:doctor:{doctor_id}:entries  hash, patient_id -> JSON payload
+#   queue:doctor:{doctor_id}:version  integer, bumped by every change to the queue
+#   position:patient:{patient_id}     string, doctor_id the patient is queued with
+# and once per instance:
+#   queue:epoch                       string, random tag set when the instance first holds queues
+QUEUE_KEY_PREFIX = 'queue:doctor:'
+POSITION_KEY_PREFIX = 'position:patient:'
+EPOCH_KEY = 'queue:epoch'
+
+# Scripts build per-patient key names from the prefixes passed in ARGV, so
+# each one runs as a single atomic round trip however many patients it touches.
+
+# ARGV[1] = position prefix, ARGV[2] = queue prefix, then repeated
+# (patient_id, doctor_id, score, payload). A patient already queued with
+# another doctor is moved. Returns the number of entries written.
+ENQUEUE_SCRIPT = """
+for i = 3, #ARGV, 4 do
+    local patient_id, doctor_id = ARGV[i], ARGV[i + 1]
+    local position_key = ARGV[1] .. patient_id
+    local current = redis.call('GET', position_key)
+    if current and current ~= doctor_id then
+        redis.call('ZREM', ARGV[2] .. current, patient_id)
+        redis.call('HDEL', ARGV[2] .. current .. ':entries', patient_id)
+        redis.call('INCR', ARGV[2] .. current .. ':version')
+    end
+    local queue_key = ARGV[2] .. doctor_id
+    redis.call('ZADD', queue_key, ARGV[i + 2], patient_id)
+    redis.call('HSET', queue_key .. ':entries', patient_id, ARGV[i + 3])
+    redis.call('INCR', queue_key .. ':version')
+    redis.call('SET', position_key, doctor_id)
+end
+return (#ARGV - 2) / 4
+"""
+
+# Pops the head of a doctor's queue, drops its payload and the patient's
+# position key, and returns the payload - all in one atomic round trip so
+# concurrent call-next requests can never hand out the same patient.
+# KEYS[1] = queue sorted set, KEYS[2] = entries hash, KEYS[3] = version,
+# ARGV[1] = position key prefix
+DEQUEUE_SCRIPT = """
+local members = redis.call('ZRANGE', KEYS[1], 0, 0)
+if #members == 0 then
+    return false
+end
+local member = members[1]
+local payload = redis.call('HGET', KEYS[2], member)
+redis.call('ZREM', KEYS[1], member)
+redis.call('HDEL', KEYS[2], member)
+redis.call('DEL', ARGV[1] .. member)
+redis.call('INCR', KEYS[3])
+return payload
+"""
+
+# Resolves doctor, rank, queue size and payload for many patients in one
+# round trip. ARGV[1] = position key prefix, ARGV[2] = queue key prefix,
+# ARGV[3..] = patient ids. Returns {patient_id, doctor_id, rank, total, payload}
+# for every patient that is currently queued.
+POSITIONS_SCRIPT = """
+local result = {}
+for i = 3, #ARGV do
+    local patient_id = ARGV[i]
+    local doctor_id = redis.call('GET', ARGV[1] .. patient_id)
+    if doctor_id then
+        local queue_key = ARGV[2] .. doctor_id
+        local rank = redis.call('ZRANK', queue_key, patient_id)
+        if rank then
+            result[#result + 1] = {
+                patient_id, doctor_id, rank,
+                redis.call('ZCARD', queue_key),
+                redis.call('HGET', queue_key .. ':entries', patient_id)
+            }
+        end
+    end
+end
+return result
+"""
+
+# Removes patients from whichever queue they are in.
+# ARGV[1] = position prefix, ARGV[2] = queue prefix, ARGV[3..] = patient ids.
+# Returns the number of patients removed.
+REMOVE_SCRIPT = """
+local removed = 0
+for i = 3, #ARGV do
+    local patient_id = ARGV[i]
+    local position_key = ARGV[1] .. patient_id
+    local doctor_id = redis.call('GET', position_key)
+    if doctor_id then
+        local queue_key = ARGV[2] .. doctor_id
+        if redis.call('ZREM', queue_key, patient_id) == 1 then
+            removed = removed + 1
+            redis.call('INCR', queue_key .. ':version')
+        end
+        redis.call('HDEL', queue_key .. ':entries', patient_id)
+        redis.call('DEL', position_key)
+    end
+end
+return removed
+"""
+
+# Replaces a doctor's queue with the given order. Position keys of patients
+# dropped from the queue are cleared; patients pulled in from another
+# doctor's queue are moved. KEYS[1] = queue, KEYS[2] = entries, KEYS[3] = version,
+# ARGV[1] = position prefix, ARGV[2] = queue prefix, ARGV[3] = doctor_id,
+# then repeated (patient_id, payload) in the new order.
+REORDER_SCRIPT = """
+local doctor_id = ARGV[3]
+for _, member in ipairs(redis.call('ZRANGE', KEYS[1], 0, -1)) do
+    if redis.call('GET', ARGV[1] .. member) == doctor_id then
+        redis.call('DEL', ARGV[1] .. member)
+    end
+end
+redis.call('DEL', KEYS[1], KEYS[2])
+local rank = 0
+for i = 4, #ARGV, 2 do
+    local patient_id = ARGV[i]
+    local position_key = ARGV[1] .. patient_id
+    local current = redis.call('GET', position_key)
+    if current and current ~= doctor_id then
+        redis.call('ZREM', ARGV[2] .. current, patient_id)
+        redis.call('HDEL', ARGV[2] .. current .. ':entries', patient_id)
+        redis.call('INCR', ARGV[2] .. current .. ':version')
+    end
+    redis.call('ZADD', KEYS[1], rank, patient_id)
+    redis.call('HSET', KEYS[2], patient_id, ARGV[i + 1])
+    redis.call('SET', position_key, doctor_id)
+    rank = rank + 1
+end
+redis.call('INCR', KEYS[3])
+return rank
+"""
+
+# Empties a doctor's queue together with its patients' position keys.
+# KEYS[1] = queue, KEYS[2] = entries, KEYS[3] = version,
+# ARGV[1] = position prefix, ARGV[2] = doctor_id
+CLEAR_SCRIPT = """
+local members = redis.call('ZRANGE', KEYS[1], 0, -1)
+for _, member in ipairs(members) do
+    if redis.call('GET', ARGV[1] .. member) == ARGV[2] then
+        redis.call('DEL', ARGV[1] .. member)
+    end
+end
+redis.call('DEL', KEYS[1], KEYS[2])
+if #members > 0 then
+    redis.call('INCR', KEYS[3])
+end
+return #members
+"""
+
+
+class RedisQueueLayout:
+    """
+    Key names, script arguments and reply decoding shared by the blocking
+    and asyncio Redis backends, so both read and write the same layout.
+    """
+
+    # Entries per ENQUEUE/REMOVE script call when batching large bulk operations
+    BATCH_SIZE = 500
+
+    def _get_queue_key(self, doctor_id):
+        return f"{QUEUE_KEY_PREFIX}{doctor_id}"
+
+    def _get_entries_key(self, doctor_id):
+        # Hash of patient_id -> JSON payload; the sorted set only holds patient ids
+        return f"{QUEUE_KEY_PREFIX}{doctor_id}:entries"
+
+    def _get_version_key(self, doctor_id):
+        return f"{QUEUE_KEY_PREFIX}{doctor_id}:version"
+
+    @staticmethod
+    def _new_epoch():
+        return uuid.uuid4().hex[:8]
+
+    def _queue_keys(self, doctor_id):
+        """KEYS for the scripts that work on one doctor's queue."""
+        return [self._get_queue_key(doctor_id), self._get_entries_key(doctor_id), self._get_version_key(doctor_id)]
+
+    def _get_position_key(self, patient_id):
+        return f"{POSITION_KEY_PREFIX}{patient_id}"
+
+    def _chunks(self, args, group=1):
+        """Prefix-style script arguments split into BATCH_SIZE groups of `group` arguments."""
+        prefixes = [POSITION_KEY_PREFIX, QUEUE_KEY_PREFIX]
+        step = self.BATCH_SIZE * group
+        return [prefixes + args[i:i + step] for i in range(0, len(args), step)]
+
+    def _enqueue_args(self, entries):
+        args = []
+        # Equal scores would fall back to ordering by patient id string
+        for entry in QueueBackend.stamp_joins(entries):
+            entry_data, score = QueueBackend.build_entry(
+                entry['patient_id'],
+                entry['doctor_id'],
+                entry.get('priority', 0),
+                entry.get('appointment_id'),
+                entry.get('queue_number'),
+                entry.get('joined_at')
+            )
+            args.extend([
+                str(entry_data['patient_id']),
+                str(entry_data['doctor_id']),
+                repr(score),
+                json.dumps(entry_data)
+            ])
+        return args
+
+    def _remove_args(self, patient_ids):
+        return [str(patient_id) for patient_id in dict.fromkeys(patient_ids)]
+
+    def _positions_args(self, patient_ids):
+        return [POSITION_KEY_PREFIX, QUEUE_KEY_PREFIX] + [str(pid) for pid in patient_ids]
+
+    def _reorder_args(self, doctor_id, new_order):
+        args = [POSITION_KEY_PREFIX, QUEUE_KEY_PREFIX, str(doctor_id)]
+        for entry in new_order:
+            args.extend([str(entry['patient_id']), json.dumps(QueueBackend.strip_entry(entry))])
+        return args
+
+    def _decode_position(self, row):
+        patient_id, doctor_id, rank, total, entry_json = row
+        if not entry_json:
+            return None
+        try:
+            doctor_id = int(doctor_id)
+        except (ValueError, TypeError):
+            return None
+        return {
+            'position': rank + 1,
+            'total': total,
+            'doctor_id': doctor_id,
+            'entry': json.loads(entry_json)
+        }
+
+    def _decode_positions(self, patient_ids, rows):
+        positions = {patient_id: None for patient_id in patient_ids}
+        by_member = {str(patient_id): patient_id for patient_id in patient_ids}
+        for row in rows:
+            positions[by_member[row[0]]] = self._decode_position(row)
+        return positions
+
+    def _decode_queue(self, payloads, offset):
+        queue_list = []
+        for entry_json in payloads:
+            if not entry_json:
+                continue
+            entry = json.loads(entry_json)
+            entry['position'] = offset + len(queue_list) + 1
+            queue_list.append(entry)
+        return queue_list
+
+    def _decode_queued(self, keys, values):
+        patients = {}
+        for key, doctor_id in zip(keys, values):
+            try:
+                patients[int(key[len(POSITION_KEY_PREFIX):])] = int(doctor_id)
+            except (ValueError, TypeError):
+                continue
+        return patients
+
+
+class RedisQueueBackend(RedisQueueLayout, QueueBackend):
+    """
+    Queues shared by every worker through Redis. Patient ids are the sorted
+    set members so rank lookups are O(log n); multi-key updates run as Lua
+    scripts so each operation is atomic and costs one round trip.
+    """
+
+    name = 'redis'
+
+    def __init__(self, client):
+        self.redis_client = client
+        self._scripts = {}  # name -> Script registered with redis_client
+        self._epoch = None  # EPOCH_KEY as last read with a version
+
+    def _get_script(self, name, source):
+        # Registered lazily against the current client; EVALSHA falls back to EVAL on a cache miss
+        script = self._scripts.get(name)
+        if script is None or script.registered_client is not self.redis_client:
+            script = self.redis_client.register_script(source)
+            self._scripts[name] = script
+        return script
+
+    def _run_batched(self, name, source, args, group=1):
+        """
+        Run a prefix-style script over args in chunks of BATCH_SIZE groups of
+        `group` arguments each, pipelined together into one round trip.
+        """
+        script = self._get_script(name, source)
+        chunks = self._chunks(args, group)
+        if len(chunks) == 1:
+            return [script(args=chunks[0])]
+        with self.redis_client.pipeline() as pipe:
+            for chunk in chunks:
+                script(args=chunk, client=pipe)
+            return pipe.execute()
+
+    def enqueue(self, patient_id, doctor_id, priority=0, appointment_id=None, queue_number=None):
+        return self.bulk_enqueue([{
+            'patient_id': patient_id,
+            'doctor_id': doctor_id,
+            'priority': priority,
+            'appointment_id': appointment_id,
+            'queue_number': queue_number
+        }]) == 1
+
+    def bulk_enqueue(self, entries):
+        args = self._enqueue_args(entries)
+        if not args:
+            return 0
+        return int(sum(self._run_batched('enqueue', ENQUEUE_SCRIPT, args, group=4)))
+
+    def dequeue(self, doctor_id):
+        entry_json = self._get_script('dequeue', DEQUEUE_SCRIPT)(
+            keys=self._queue_keys(doctor_id),
+            args=[POSITION_KEY_PREFIX]
+        )
+        if not entry_json:
+            return None
+        return json.loads(entry_json)
+
+    def get_position(self, patient_id):
+        return self.get_positions([patient_id])[patient_id]
+
+    def get_positions(self, patient_ids):
+        patient_ids = list(dict.fromkeys(patient_ids))
+        if not patient_ids:
+            return {}
+        rows = self._get_script('positions', POSITIONS_SCRIPT)(args=self._positions_args(patient_ids))
+        return self._decode_positions(patient_ids, rows)
+
+    def get_queue(self, doctor_id, offset=0, limit=None):
+        if limit is not None and limit <= 0:
+            return []
+        offset, stop = self._paging(offset, limit)
+        queue_key = self._get_queue_key(doctor_id)
+        entries_key = self._get_entries_key(doctor_id)
+
+        if stop is None and offset == 0:
+            with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.zrange(queue_key, 0, -1)
+                pipe.hgetall(entries_key)
+                members, payloads = pipe.execute()
+            payloads = [payloads.get(member) for member in members]
+        else:
+            members = self.redis_client.zrange(queue_key, offset, -1 if stop is None else stop - 1)
+            payloads = self.redis_client.hmget(entries_key, members) if members else []
+
+        return self._decode_queue(payloads, offset)
+
+    def queued_patients(self):
+        # Position keys hold each patient's doctor; read them back in pipelined MGET batches
+        keys = list(self.redis_client.scan_iter(match=f"{POSITION_KEY_PREFIX}*", count=1000))
+        with self.redis_client.pipeline(transaction=False) as pipe:
+            for i in range(0, len(keys), self.BATCH_SIZE):
+                pipe.mget(keys[i:i + self.BATCH_SIZE])
+            values = [value for batch in pipe.execute() for value in batch]
+        return self._decode_queued(keys, values)
+
+    def get_queue_length(self, doctor_id):
+        return self.redis_client.zcard(self._get_queue_key(doctor_id))
+
+    def get_queue_lengths(self, doctor_ids):
+        doctor_ids = list(dict.fromkeys(doctor_ids))
+        with self.redis_client.pipeline(transaction=False) as pipe:
+            for doctor_id in doctor_ids:
+                pipe.zcard(self._get_queue_key(doctor_id))
+            return dict(zip(doctor_ids, pipe.execute()))
+
+    def get_version(self, doctor_id):
+        # The epoch comes along in the same round trip. A Redis that lost its
+        # data has no epoch and restarts its counters, so it gets a new one
+        version, epoch = self.redis_client.mget(self._get_version_key(doctor_id), EPOCH_KEY)
+        self._epoch = epoch or self._create_epoch()
+        return int(version or 0)
+
+    def get_epoch(self, doctor_id):
+        if self._epoch is None:
+            self._epoch = self.redis_client.get(EPOCH_KEY) or self._create_epoch()
+        return self._epoch
+
+    def _create_epoch(self):
+        # SET NX: every worker ends up with whichever epoch was set first
+        self.redis_client.set(EPOCH_KEY, self._new_epoch(), nx=True)
+        return self.redis_client.get(EPOCH_KEY)
+
+    def ping(self):
+        return self.redis_client.ping()
+
+    def remove_from_queue(self, patient_id):
+        return self.bulk_remove([patient_id]) == 1
+
+    def bulk_remove(self, patient_ids):
+        args = self._remove_args(patient_ids)
+        if not args:
+            return 0
+        return int(sum(self._run_batched('remove', REMOVE_SCRIPT, args)))
+
+    def reorder_queue(self, doctor_id, new_order):
+        self._get_script('reorder', REORDER_SCRIPT)(
+            keys=self._queue_keys(doctor_id),
+            args=self._reorder_args(doctor_id, new_order)
+        )
+        return True
+
+    def clear_queue(self, doctor_id):
+        cleared = self._get_script('clear', CLEAR_SCRIPT)(
+            keys=self._queue_keys(doctor_id),
+            args=[POSITION_KEY_PREFIX, str(doctor_id)]
+        )
+        return bool(cleared)
+
+    def clear_all(self):
+        # Only queue state - other data sharing the database is left alone.
+        # Version counters are bumped rather than deleted so that no worker's
+        # cached queue can match a version reached again after the reset
+        with self.redis_client.pipeline(transaction=False) as pipe:
+            for pattern in (f"{QUEUE_KEY_PREFIX}*", f"{POSITION_KEY_PREFIX}*"):
+                for key in self.redis_client.scan_iter(match=pattern, count=1000):
+                    if key.endswith(':version'):
+                        pipe.incr(key)
+                    else:
+                        pipe.delete(key)
+            pipe.execute()
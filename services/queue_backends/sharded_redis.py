@@ -0,0 +1,347 @@
+import bisect
+import hashlib
+
+from .base import QueueBackend
+from .redis_backend import POSITION_KEY_PREFIX, QUEUE_KEY_PREFIX, RedisQueueBackend
+
+# Empties one doctor's queue on the shard it is leaving and hands back what
+# was in it. KEYS[1] = queue, KEYS[2] = entries, KEYS[3] = version,
+# ARGV[1] = position prefix, ARGV[2] = doctor_id.
+# Returns {version, {patient_id, score, ...}, {payload, ...}}.
+TAKE_QUEUE_SCRIPT = """
+local members = redis.call('ZRANGE', KEYS[1], 0, -1, 'WITHSCORES')
+local payloads = {}
+for i = 1, #members, 2 do
+    local member = members[i]
+    payloads[#payloads + 1] = redis.call('HGET', KEYS[2], member) or ''
+    if redis.call('GET', ARGV[1] .. member) == ARGV[2] then
+        redis.call('DEL', ARGV[1] .. member)
+    end
+end
+local version = redis.call('GET', KEYS[3]) or '0'
+redis.call('DEL', KEYS[1], KEYS[2], KEYS[3])
+return {version, members, payloads}
+"""
+
+# Writes a taken queue into the shard that now owns the doctor. Patients
+# who joined a queue on this shard since routing switched keep that newer
+# place. The version ends above both shards' counters so no cached copy of
+# the queue can match it. KEYS as above, ARGV[1] = position prefix,
+# ARGV[2] = doctor_id, ARGV[3] = version taken, then repeated
+# (patient_id, score, payload). Returns the number of patients written.
+PUT_QUEUE_SCRIPT = """
+local written = 0
+for i = 4, #ARGV, 3 do
+    local position_key = ARGV[1] .. ARGV[i]
+    if ARGV[i + 2] ~= '' and not redis.call('GET', position_key) then
+        redis.call('ZADD', KEYS[1], ARGV[i + 1], ARGV[i])
+        redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 2])
+        redis.call('SET', position_key, ARGV[2])
+        written = written + 1
+    end
+end
+local version = math.max(tonumber(redis.call('GET', KEYS[3]) or '0'), tonumber(ARGV[3])) + 1
+redis.call('SET', KEYS[3], version)
+return written
+"""
+
+# Deletes patients' entries in the patient index where they still name the
+# doctor the patient left, so a newer entry written by a concurrent move
+# survives. ARGV[1] = index prefix, then repeated (patient_id, doctor_id).
+# Returns the number deleted.
+UNINDEX_SCRIPT = """
+local dropped = 0
+for i = 2, #ARGV, 2 do
+    local key = ARGV[1] .. ARGV[i]
+    if redis.call('GET', key) == ARGV[i + 1] then
+        redis.call('DEL', key)
+        dropped = dropped + 1
+    end
+end
+return dropped
+"""
+
+# On the index shard only:
+#   shard:patient:{patient_id}  string, doctor_id the patient was last queued with
+PATIENT_INDEX_PREFIX = 'shard:patient:'
+
+
+class HashRing:
+    """
+    Consistent hash ring over named nodes. Each node owns `vnodes` points
+    on the ring and a key belongs to the first point at or after its hash,
+    so adding a node only takes keys over from the others (about 1/N of
+    them) and never moves keys between nodes already there.
+    """
+
+    VNODES = 160
+
+    def __init__(self, nodes=(), vnodes=VNODES):
+        self.vnodes = vnodes
+        self._points = []  # sorted point hashes
+        self._owners = {}  # point hash -> node
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(key):
+        # md5 rather than hash(): every worker must place keys identically
+        return int.from_bytes(hashlib.md5(str(key).encode()).digest()[:8], 'big')
+
+    def add(self, node):
+        for i in range(self.vnodes):
+            point = self._hash(f"{node}#{i}")
+            if point not in self._owners:
+                bisect.insort(self._points, point)
+                self._owners[point] = node
+
+    def remove(self, node):
+        self._points = [point for point in self._points if self._owners[point] != node]
+        self._owners = {point: owner for point, owner in self._owners.items() if owner != node}
+
+    def get(self, key):
+        if not self._points:
+            raise LookupError('hash ring has no nodes')
+        index = bisect.bisect_left(self._points, self._hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+
+class ShardedRedisQueueBackend(QueueBackend):
+    """
+    Queues spread over several Redis instances. Each doctor is placed on a
+    shard by consistent hashing of their id, and everything about their
+    queue lives there: the sorted set, entries, version and the position
+    keys of the patients in it. Per-doctor operations therefore run the
+    single-instance scripts unchanged on one shard.
+
+    Lookups by patient (positions, removal) do not know the doctor, so the
+    first shard in `clients` - the index shard, which every worker must
+    list first - also maps each queued patient to their doctor. A lookup
+    reads that index in one round trip and then asks only the shard the
+    doctor is on. The doctor's shard stays the authority: an index entry
+    left behind by a patient who was called only points at a queue that
+    no longer has them. Moving a patient to a doctor on another shard
+    removes them from the old shard first; the two steps are not atomic
+    with each other, unlike a move within one shard.
+    """
+
+    name = 'redis-sharded'
+
+    def __init__(self, clients, vnodes=HashRing.VNODES):
+        """clients maps a stable shard name (e.g. its URL) to a Redis client."""
+        self.shards = {}  # name -> RedisQueueBackend
+        self.ring = HashRing(vnodes=vnodes)
+        for name, client in dict(clients).items():
+            self.shards[name] = RedisQueueBackend(client)
+            self.ring.add(name)
+        # Added shards come after it, so the index never moves
+        self.index = next(iter(self.shards.values()))
+
+    def shard_name(self, doctor_id):
+        return self.ring.get(f"doctor:{doctor_id}")
+
+    def _shard(self, doctor_id):
+        return self.shards[self.shard_name(doctor_id)]
+
+    def add_shard(self, name, client):
+        """Add a shard and move over only the doctors the ring now places on it."""
+        self.shards[name] = RedisQueueBackend(client)
+        self.ring.add(name)
+        return self.rebalance()
+
+    def rebalance(self):
+        """
+        Move every doctor's queue that is not on the shard the ring places it
+        on, and index any queued patient the index is missing (queues written
+        before it existed). Run it once after all workers route with a
+        changed shard list; until then moved doctors look empty to workers
+        on the new list.
+        """
+        # Listed up front so doctors moved in this pass are not checked again
+        found = [(name, doctor_id) for name, shard in self.shards.items() for doctor_id in self._doctors_on(shard)]
+        report = {'doctors_checked': len(found), 'doctors_moved': 0, 'patients_moved': 0}
+        for name, doctor_id in found:
+            owner = self.shard_name(doctor_id)
+            if owner != name:
+                report['doctors_moved'] += 1
+                report['patients_moved'] += self._move_queue(doctor_id, self.shards[name], self.shards[owner])
+        report['patients_indexed'] = self._index_missing(self.queued_patients())
+        return report
+
+    def _doctors_on(self, shard):
+        doctor_ids = set()
+        for key in shard.redis_client.scan_iter(match=f"{QUEUE_KEY_PREFIX}*", count=1000):
+            doctor_ids.add(key[len(QUEUE_KEY_PREFIX):].split(':', 1)[0])
+        return sorted(doctor_ids)
+
+    def _move_queue(self, doctor_id, source, target):
+        version, members, payloads = source._get_script('take', TAKE_QUEUE_SCRIPT)(
+            keys=source._queue_keys(doctor_id),
+            args=[POSITION_KEY_PREFIX, str(doctor_id)]
+        )
+        args = [POSITION_KEY_PREFIX, str(doctor_id), version]
+        for patient_id, score, payload in zip(members[0::2], members[1::2], payloads):
+            args.extend([patient_id, score, payload])
+        return int(target._get_script('put', PUT_QUEUE_SCRIPT)(keys=target._queue_keys(doctor_id), args=args))
+
+    def _indexed_doctors(self, patient_ids):
+        """{patient_id: doctor_id the index has them with, or None}, in one MGET."""
+        if not patient_ids:
+            return {}
+        keys = [f"{PATIENT_INDEX_PREFIX}{patient_id}" for patient_id in patient_ids]
+        return {
+            patient_id: None if doctor_id is None else int(doctor_id)
+            for patient_id, doctor_id in zip(patient_ids, self.index.redis_client.mget(keys))
+        }
+
+    def _by_shard(self, doctors):
+        """Group {patient_id: doctor_id} into {shard name: [patient_id, ...]}, skipping None."""
+        by_shard = {}
+        for patient_id, doctor_id in doctors.items():
+            if doctor_id is not None:
+                by_shard.setdefault(self.shard_name(doctor_id), []).append(patient_id)
+        return by_shard
+
+    def _index(self, doctors):
+        """Point the index at each patient's new doctor, {patient_id: doctor_id}."""
+        if doctors:
+            self.index.redis_client.mset({f"{PATIENT_INDEX_PREFIX}{patient_id}": doctor_id
+                                          for patient_id, doctor_id in doctors.items()})
+
+    def _unindex(self, doctors):
+        """Drop index entries {patient_id: doctor_id} that still name that doctor."""
+        pairs = [str(part) for patient_id, doctor_id in doctors.items() if doctor_id is not None
+                 for part in (patient_id, doctor_id)]
+        if not pairs:
+            return
+        script = self.index._get_script('unindex', UNINDEX_SCRIPT)
+        step = self.index.BATCH_SIZE * 2
+        with self.index.redis_client.pipeline(transaction=False) as pipe:
+            for i in range(0, len(pairs), step):
+                script(args=[PATIENT_INDEX_PREFIX] + pairs[i:i + step], client=pipe)
+            pipe.execute()
+
+    def _index_missing(self, doctors):
+        """Index patients {patient_id: doctor_id} the index has no entry for. Returns how many."""
+        with self.index.redis_client.pipeline(transaction=False) as pipe:
+            for patient_id, doctor_id in doctors.items():
+                pipe.set(f"{PATIENT_INDEX_PREFIX}{patient_id}", doctor_id, nx=True)
+            return sum(1 for written in pipe.execute() if written)
+
+    def _evict_elsewhere(self, placements):
+        """Remove patients from any shard other than the one in placements {patient_id: shard name}."""
+        if len(self.shards) == 1 or not placements:
+            return
+        for name, patient_ids in self._by_shard(self._indexed_doctors(list(placements))).items():
+            queued_here = [patient_id for patient_id in patient_ids if placements[patient_id] != name]
+            if queued_here:
+                self.shards[name].bulk_remove(queued_here)
+
+    def enqueue(self, patient_id, doctor_id, priority=0, appointment_id=None, queue_number=None):
+        return self.bulk_enqueue([{
+            'patient_id': patient_id,
+            'doctor_id': doctor_id,
+            'priority': priority,
+            'appointment_id': appointment_id,
+            'queue_number': queue_number
+        }]) == 1
+
+    def bulk_enqueue(self, entries):
+        # A patient listed more than once ends up where their last entry puts them
+        placements = {entry['patient_id']: self.shard_name(entry['doctor_id']) for entry in entries}
+        self._evict_elsewhere(placements)
+        by_shard = {}
+        for entry in entries:
+            name = self.shard_name(entry['doctor_id'])
+            if placements[entry['patient_id']] == name:
+                by_shard.setdefault(name, []).append(entry)
+        for name, shard_entries in by_shard.items():
+            self.shards[name].bulk_enqueue(shard_entries)
+        self._index({entry['patient_id']: entry['doctor_id'] for entry in entries})
+        return len(entries)
+
+    def dequeue(self, doctor_id):
+        entry = self._shard(doctor_id).dequeue(doctor_id)
+        if entry is not None:
+            self._unindex({entry['patient_id']: doctor_id})
+        return entry
+
+    def get_position(self, patient_id):
+        return self.get_positions([patient_id])[patient_id]
+
+    def get_positions(self, patient_ids):
+        patient_ids = list(dict.fromkeys(patient_ids))
+        positions = {patient_id: None for patient_id in patient_ids}
+        for name, shard_patients in self._by_shard(self._indexed_doctors(patient_ids)).items():
+            positions.update(self.shards[name].get_positions(shard_patients))
+        return positions
+
+    def get_queue(self, doctor_id, offset=0, limit=None):
+        return self._shard(doctor_id).get_queue(doctor_id, offset, limit)
+
+    def queued_patients(self):
+        patients = {}
+        for shard in self.shards.values():
+            patients.update(shard.queued_patients())
+        return patients
+
+    def get_queue_length(self, doctor_id):
+        return self._shard(doctor_id).get_queue_length(doctor_id)
+
+    def get_queue_lengths(self, doctor_ids):
+        by_shard = {}
+        for doctor_id in doctor_ids:
+            by_shard.setdefault(self.shard_name(doctor_id), []).append(doctor_id)
+        lengths = {}
+        for name, shard_doctors in by_shard.items():
+            lengths.update(self.shards[name].get_queue_lengths(shard_doctors))
+        return lengths
+
+    def get_version(self, doctor_id):
+        return self._shard(doctor_id).get_version(doctor_id)
+
+    def get_epoch(self, doctor_id):
+        # Each shard restarts on its own, so each has its own epoch
+        return self._shard(doctor_id).get_epoch(doctor_id)
+
+    def remove_from_queue(self, patient_id):
+        return self.bulk_remove([patient_id]) == 1
+
+    def bulk_remove(self, patient_ids):
+        doctors = self._indexed_doctors(list(dict.fromkeys(patient_ids)))
+        removed = sum(
+            self.shards[name].bulk_remove(shard_patients)
+            for name, shard_patients in self._by_shard(doctors).items()
+        )
+        self._unindex(doctors)
+        return removed
+
+    def reorder_queue(self, doctor_id, new_order):
+        name = self.shard_name(doctor_id)
+        shard = self.shards[name]
+        self._evict_elsewhere({entry['patient_id']: name for entry in new_order})
+        before = shard.redis_client.zrange(shard._get_queue_key(doctor_id), 0, -1)
+        shard.reorder_queue(doctor_id, new_order)
+        # Patients left out of new_order have left the queue
+        kept = {str(entry['patient_id']) for entry in new_order}
+        self._unindex({patient_id: doctor_id for patient_id in before if patient_id not in kept})
+        self._index({entry['patient_id']: doctor_id for entry in new_order})
+        return True
+
+    def ping(self):
+        return all(shard.ping() for shard in self.shards.values())
+
+    def clear_queue(self, doctor_id):
+        shard = self._shard(doctor_id)
+        patient_ids = shard.redis_client.zrange(shard._get_queue_key(doctor_id), 0, -1)
+        cleared = shard.clear_queue(doctor_id)
+        self._unindex({patient_id: doctor_id for patient_id in patient_ids})
+        return cleared
+
+    def clear_all(self):
+        for shard in self.shards.values():
+            shard.clear_all()
+        with self.index.redis_client.pipeline(transaction=False) as pipe:
+            for key in self.index.redis_client.scan_iter(match=f"{PATIENT_INDEX_PREFIX}*", count=1000):
+                pipe.delete(key)
+            pipe.execute()
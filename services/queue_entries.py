@@ -0,0 +1,29 @@
+from models import db, QueueEntry
+
+
+def create_queue_entries(entries):
+    """
+    Insert the QueueEntry rows matching a QueueService.bulk_enqueue batch in
+    a single transaction. Takes the same entry dicts; returns the new rows.
+    """
+    rows = [
+        QueueEntry(
+            patient_id=entry['patient_id'],
+            doctor_id=entry['doctor_id'],
+            appointment_id=entry.get('appointment_id'),
+            queue_number=entry.get('queue_number'),
+            priority=entry.get('priority', 0),
+            status='waiting'
+        )
+        for entry in entries
+    ]
+    if not rows:
+        return rows
+    
+    try:
+        db.session.add_all(rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return rows
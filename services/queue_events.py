@@ -0,0 +1,155 @@
+from flask_login import current_user
+from flask_socketio import emit
+
+from extensions import socketio
+from .broadcasts import BroadcastCoalescer
+from .consult_times import consult_time_estimator
+from .queue_service import QueueService
+
+# Attempts at reading a queue between two equal version reads before
+# settling for a snapshot that may already include the next change
+SNAPSHOT_RETRIES = 3
+
+
+def merge_queue_updates(events):
+    """
+    One queue:update for a burst of them. Consecutive versions become a
+    'batch' carrying each change in order; anything else (a resync among
+    them, a version missing from this worker's burst) becomes one resync.
+    """
+    if len(events) == 1:
+        return events[0]
+    events = sorted(events, key=lambda event: event['version'] if event['version'] is not None else -1)
+    versions = [event['version'] for event in events]
+    consecutive = (
+        all(event['op'] != 'resync' for event in events)
+        and None not in versions
+        and versions == list(range(versions[0], versions[0] + len(versions)))
+    )
+    if consecutive:
+        return {'doctor_id': events[0]['doctor_id'], 'op': 'batch', 'version': versions[-1], 'changes': events}
+    return {'doctor_id': events[0]['doctor_id'], 'op': 'resync', 'version': versions[-1]}
+
+
+# Check-in bursts reach each doctor room as one event per window; app.py
+# sets the window from QUEUE_BROADCAST_WINDOW_MS and QUEUE_BROADCAST_MAX_DELAY_MS
+broadcasts = BroadcastCoalescer(socketio)
+broadcasts.register('queue:update', merge_queue_updates)
+
+
+def doctor_room(doctor_id):
+    return f'doctor_{doctor_id}'
+
+
+def waiting_room(doctor_id):
+    """Room patients in a doctor's queue follow it in; deltas there carry no entries."""
+    return f'waiting_{doctor_id}'
+
+
+def position_before_change(queue_service, patient_id):
+    """
+    (position, version) of a patient about to leave their queue, with the
+    version read first so a later publish_queue_delta can tell whether the
+    position was still current. (None, None) if they are not queued.
+    """
+    position = queue_service.get_position(patient_id)
+    if position is None:
+        return None, None
+    version = queue_service.get_version(position['doctor_id'])
+    current = queue_service.get_position(patient_id)
+    if current is None or current['doctor_id'] != position['doctor_id']:
+        return None, None
+    return current, version
+
+
+def publish_queue_delta(queue_service, doctor_id, base_version, op, patient_id, position=None):
+    """
+    Emit one change to a doctor's queue as a compact `queue:update` event
+    instead of the whole queue.
+
+    base_version is the queue version read before the change. The event
+    carries the version after it as its sequence number; clients apply it
+    only when it is exactly one past the last version they hold, and ask
+    for a `queue:resync` otherwise. op is:
+
+      inserted  patient joined; carries their entry, position and the new total
+      moved     patient already in this queue changed place; same fields
+      removed   patient left or was called; position is where they were
+
+    When anything else changed the queue in between (the version moved by
+    more than one) the positions read here could be off, so a bare
+    'resync' event is sent instead. Backends without versions always send
+    'resync'. Deltas also carry the doctor's learned minutes_per_patient.
+    Events go out through the room's broadcast coalescer, to the doctor's
+    room and, without the entry, to their waiting room.
+    """
+    event = {'doctor_id': doctor_id, 'op': op, 'patient_id': patient_id}
+    if op in ('inserted', 'moved'):
+        info = queue_service.get_position(patient_id)
+        if info is None or info['doctor_id'] != doctor_id:
+            event['op'] = 'resync'
+        else:
+            event.update(position=info['position'], total=info['total'], entry=info['entry'])
+    else:
+        event.update(position=position, total=queue_service.get_queue_length(doctor_id))
+
+    event['version'] = queue_service.get_version(doctor_id)
+    if base_version is None or event['version'] != base_version + 1:
+        event = {'doctor_id': doctor_id, 'op': 'resync', 'version': event['version']}
+    else:
+        # Lets watching patients re-estimate their wait as the doctor's pace changes
+        event['minutes_per_patient'] = round(consult_time_estimator().minutes_per_patient(doctor_id), 1)
+    broadcasts.emit('queue:update', event, doctor_room(doctor_id))
+    broadcasts.emit('queue:update', {key: value for key, value in event.items() if key != 'entry'}, waiting_room(doctor_id))
+    return event
+
+
+def queue_snapshot(queue_service, doctor_id):
+    """
+    (version, queue) for a doctor where the queue reflects at least that
+    version. Reads are retried while the queue changes underneath them;
+    deltas are idempotent, so a snapshot a change ahead of its version
+    only means that change is applied twice.
+    """
+    for _ in range(SNAPSHOT_RETRIES):
+        version = queue_service.get_version(doctor_id)
+        queue = queue_service.get_queue(doctor_id)
+        if version is None or queue_service.get_version(doctor_id) == version:
+            break
+    return version, queue
+
+
+@socketio.on('queue:resync')
+def handle_queue_resync(data):
+    """
+    A client that missed a queue:update asks for the current state. The
+    doctor (and admins) get the whole queue; a patient gets their own
+    position, and only for the queue they are in.
+    """
+    if not current_user.is_authenticated:
+        return
+    try:
+        doctor_id = int((data or {}).get('doctor_id'))
+    except (TypeError, ValueError):
+        return
+
+    queue_service = QueueService()
+    if current_user.is_admin() or current_user.id == doctor_id:
+        version, queue = queue_snapshot(queue_service, doctor_id)
+        emit('queue:snapshot', {'doctor_id': doctor_id, 'version': version, 'total': len(queue), 'queue': queue})
+        return
+
+    for _ in range(SNAPSHOT_RETRIES):
+        version = queue_service.get_version(doctor_id)
+        position = queue_service.get_position(current_user.id)
+        if version is None or queue_service.get_version(doctor_id) == version:
+            break
+    if position is not None and position['doctor_id'] != doctor_id:
+        position = None
+    emit('queue:snapshot', {
+        'doctor_id': doctor_id,
+        'version': version,
+        'total': position['total'] if position else None,
+        'position': position,
+        'minutes_per_patient': round(consult_time_estimator().minutes_per_patient(doctor_id), 1)
+    })
@@ -0,0 +1,150 @@
+import threading
+from datetime import datetime, time as dt_time
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, QueueCounter, QueueEntry
+from .queue_backends.failover import REDIS_ERRORS
+from .queue_service import QueueService
+
+KEY_PREFIX = 'queue_number:doctor:'
+
+# A day's counter is kept a day longer than the day itself, then expires
+COUNTER_TTL = 2 * 24 * 3600
+
+# Issues the next number if today's counter exists; false means it has to
+# be seeded first. KEYS[1] = the doctor's counter for the day.
+NEXT_NUMBER_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return false
+end
+return redis.call('INCR', KEYS[1])
+"""
+
+# Raises an existing counter to a floor (the last number the database issued
+# while Redis was down) so it carries on after it; a missing one is left to
+# be seeded. KEYS[1] = the doctor's counter for the day, ARGV = floor, TTL seconds.
+RAISE_NUMBER_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current and tonumber(current) < tonumber(ARGV[1]) then
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+end
+"""
+
+
+class QueueNumberCounter:
+    """
+    Issues each doctor's ticket numbers for the day, 1, 2, 3, ... without
+    duplicates however many workers hand them out at once.
+
+    With Redis the number is one atomic INCR on a per-doctor, per-day key.
+    A missing key (first join of the day, or Redis lost its data) is seeded
+    with SET NX from the highest number already on that day's queue entries,
+    so numbering carries on where it was. Without Redis a queue_counters row
+    per doctor and day is incremented with a single UPDATE, whose row lock
+    orders concurrent joins. If Redis cannot be reached the database counter
+    takes over, starting above any number Redis already issued that day.
+    The worker that issued those numbers raises the Redis counters past them
+    on its first call once Redis is back, so joins in between on other
+    workers are the only ones that can repeat a number; the database is not
+    read on the way to an ordinary Redis INCR.
+    """
+
+    def __init__(self, redis_client=None):
+        self.redis_client = redis_client
+        self._script = redis_client.register_script(NEXT_NUMBER_SCRIPT) if redis_client is not None else None
+        self._raise_script = redis_client.register_script(RAISE_NUMBER_SCRIPT) if redis_client is not None else None
+        self._numbered_by_database = set()  # (doctor_id, day) numbered from the database while Redis was down
+        self._numbered_lock = threading.Lock()
+
+    def _key(self, doctor_id, day):
+        return f"{KEY_PREFIX}{doctor_id}:{day.isoformat()}"
+
+    def _issued_max(self, doctor_id, day):
+        """Highest number already on the doctor's entries for the day."""
+        return db.session.query(db.func.max(QueueEntry.queue_number)).filter(
+            QueueEntry.doctor_id == doctor_id,
+            QueueEntry.joined_at >= datetime.combine(day, dt_time.min),
+            QueueEntry.joined_at <= datetime.combine(day, dt_time.max)
+        ).scalar() or 0
+
+    def _database_floor(self, doctor_id, day):
+        """Last number the database counter issued for the day; 0 if it never has."""
+        return db.session.query(QueueCounter.last_number).filter_by(doctor_id=doctor_id, day=day).scalar() or 0
+
+    def next_number(self, doctor_id, day=None):
+        """
+        The next ticket number for a doctor on `day` (default today, UTC).
+        Without Redis this commits the session, so call it before adding
+        the entry the number is for.
+        """
+        day = day or datetime.utcnow().date()
+        if self.redis_client is None:
+            return self._next_from_database(doctor_id, day)
+
+        key = self._key(doctor_id, day)
+        try:
+            if self._numbered_by_database:
+                self._raise_to_database()
+            number = self._script(keys=[key])
+            if number is None:
+                # Whoever seeds first wins; every worker seeds the same value anyway
+                seed = max(self._issued_max(doctor_id, day), self._database_floor(doctor_id, day))
+                self.redis_client.set(key, seed, nx=True, ex=COUNTER_TTL)
+                number = self.redis_client.incr(key)
+        except REDIS_ERRORS:
+            with self._numbered_lock:
+                self._numbered_by_database.add((doctor_id, day))
+            return self._next_from_database(doctor_id, day, catch_up=True)
+        return int(number)
+
+    def _raise_to_database(self):
+        """Move Redis counters past the numbers this worker issued from the database."""
+        with self._numbered_lock:
+            numbered, self._numbered_by_database = self._numbered_by_database, set()
+        try:
+            for doctor_id, day in numbered:
+                self._raise_script(keys=[self._key(doctor_id, day)],
+                                   args=[self._database_floor(doctor_id, day), COUNTER_TTL])
+        except REDIS_ERRORS:
+            with self._numbered_lock:
+                self._numbered_by_database |= numbered
+            raise
+
+    def _next_from_database(self, doctor_id, day, catch_up=False):
+        """catch_up moves the counter past numbers issued by Redis since it was last used."""
+        counter = db.session.query(QueueCounter).filter_by(doctor_id=doctor_id, day=day)
+        for _ in range(3):
+            if counter.update({QueueCounter.last_number: QueueCounter.last_number + 1}, synchronize_session=False):
+                # Read back inside the same transaction, which still holds the row
+                number = db.session.query(QueueCounter.last_number).filter_by(doctor_id=doctor_id, day=day).scalar()
+                if catch_up:
+                    issued = self._issued_max(doctor_id, day)
+                    if number <= issued:
+                        number = issued + 1
+                        counter.update({QueueCounter.last_number: number}, synchronize_session=False)
+                db.session.commit()
+                return number
+            try:
+                number = self._issued_max(doctor_id, day) + 1
+                db.session.add(QueueCounter(doctor_id=doctor_id, day=day, last_number=number))
+                db.session.commit()
+                return number
+            except IntegrityError:
+                # Another worker created the day's row first; increment theirs
+                db.session.rollback()
+        raise RuntimeError(f"Could not issue a queue number for doctor {doctor_id}")
+
+
+_counter = None
+_counter_lock = threading.Lock()
+
+
+def queue_number_counter():
+    """The process-wide counter, on the queue backend's Redis when there is one."""
+    global _counter
+    if _counter is None:
+        with _counter_lock:
+            if _counter is None:
+                _counter = QueueNumberCounter(QueueService().redis_client)
+    return _counter
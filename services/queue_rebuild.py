@@ -0,0 +1,141 @@
+import time
+
+from flask import has_app_context
+
+from models import db, QueueEntry, User
+
+
+def rebuild_queues(queue_service, dry_run=False, batch_size=5000):
+    """
+    Reconcile the queue backend with the 'waiting' rows of queue_entries,
+    which are the durable record of who is queued:
+
+    - waiting rows missing from the backend (e.g. after Redis was flushed)
+      are enqueued again with their original join time, so they keep their
+      place, in bulk batches of batch_size;
+    - patients queued with a different doctor than their row says are moved;
+    - patients queued in the backend without a waiting row are removed;
+    - waiting rows that can never be served (doctor gone, or a duplicate row
+      for a patient who is queued through a newer one) are cancelled.
+
+    Returns a report of how far the two had drifted. With dry_run nothing
+    is changed. Needs an application context.
+    """
+    started = time.perf_counter()
+    report = {
+        'backend': queue_service.backend.name,
+        'db_waiting': 0,
+        'queued_before': 0,
+        'in_sync': 0,
+        'restored': 0,
+        'moved': 0,
+        'removed': 0,
+        'cancelled': 0,
+        'dry_run': dry_run
+    }
+
+    if queue_service.stores_entries:
+        # The backend reads queue_entries directly; there is nothing to drift
+        report['db_waiting'] = report['queued_before'] = report['in_sync'] = len(queue_service.queued_patients())
+        report['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        return report
+
+    rows, expected, stale_ids = _waiting_rows()
+    report['db_waiting'] = len(rows)
+
+    queued = queue_service.queued_patients()
+    report['queued_before'] = len(queued)
+
+    to_enqueue = []
+    for patient_id, row in expected.items():
+        current = queued.get(patient_id)
+        if current == row.doctor_id:
+            report['in_sync'] += 1
+            continue
+        if current is None:
+            report['restored'] += 1
+        else:
+            report['moved'] += 1
+        to_enqueue.append(_entry(row))
+
+    orphans = [patient_id for patient_id in queued if patient_id not in expected]
+    report['removed'] = len(orphans)
+    report['cancelled'] = len(stale_ids)
+
+    if not dry_run:
+        for i in range(0, len(orphans), batch_size):
+            queue_service.bulk_remove(orphans[i:i + batch_size])
+        for i in range(0, len(to_enqueue), batch_size):
+            queue_service.bulk_enqueue(to_enqueue[i:i + batch_size])
+        if stale_ids:
+            try:
+                for i in range(0, len(stale_ids), batch_size):
+                    QueueEntry.query.filter(QueueEntry.id.in_(stale_ids[i:i + batch_size])).update(
+                        {QueueEntry.status: 'cancelled'}, synchronize_session=False
+                    )
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+    report['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return report
+
+
+def seed_queues(backend, batch_size=5000):
+    """
+    Load every patient with a waiting row into an empty backend, such as
+    the in-memory stand-in used while Redis is down. Returns False when
+    there is no application context to read the rows in, so the caller
+    can try again later.
+    """
+    if not has_app_context():
+        return False
+    _, expected, _ = _waiting_rows()
+    entries = [_entry(row) for row in expected.values()]
+    for i in range(0, len(entries), batch_size):
+        backend.bulk_enqueue(entries[i:i + batch_size])
+    return True
+
+
+def _waiting_rows():
+    """
+    (rows, expected, stale_ids) from the waiting rows: all of them in join
+    order, the latest row per patient {patient_id: row}, and the ids of the
+    rest - older duplicates and rows for doctors that no longer exist.
+    """
+    doctor_ids = {doctor_id for (doctor_id,) in db.session.query(User.id).filter(User.role == 'doctor')}
+    rows = db.session.query(
+        QueueEntry.id,
+        QueueEntry.patient_id,
+        QueueEntry.doctor_id,
+        QueueEntry.priority,
+        QueueEntry.appointment_id,
+        QueueEntry.queue_number,
+        QueueEntry.joined_at
+    ).filter(QueueEntry.status == 'waiting').order_by(QueueEntry.joined_at, QueueEntry.id).all()
+
+    # Latest waiting row per patient wins; older duplicates and rows for
+    # missing doctors are stale
+    expected = {}
+    stale_ids = []
+    for row in rows:
+        if row.doctor_id not in doctor_ids:
+            stale_ids.append(row.id)
+            continue
+        previous = expected.get(row.patient_id)
+        if previous is not None:
+            stale_ids.append(previous.id)
+        expected[row.patient_id] = row
+    return rows, expected, stale_ids
+
+
+def _entry(row):
+    return {
+        'patient_id': row.patient_id,
+        'doctor_id': row.doctor_id,
+        'priority': row.priority or 0,
+        'appointment_id': row.appointment_id,
+        'queue_number': row.queue_number,
+        'joined_at': row.joined_at
+    }
@@ -0,0 +1,24 @@
+from .consult_times import consult_time_estimator
+
+
+def predicted_waits(queue_service, doctors, minutes=None):
+    """
+    {doctor_id: (minutes, queue_length)} for a patient joining each doctor's
+    queue now: everyone already waiting times that doctor's expected consult
+    length. Queue lengths come from one batched backend read.
+    """
+    minutes = minutes or consult_time_estimator().minutes_for(doctors)
+    lengths = queue_service.get_queue_lengths([doctor.id for doctor in doctors])
+    return {doctor.id: (lengths[doctor.id] * minutes[doctor.id], lengths[doctor.id]) for doctor in doctors}
+
+
+def fastest_doctor(queue_service, doctors):
+    """
+    The doctor a walk-in patient would see soonest, or None without doctors.
+    Ties go to the shorter queue, then to the lower id so every worker
+    picks the same doctor for the same state.
+    """
+    if not doctors:
+        return None
+    waits = predicted_waits(queue_service, doctors)
+    return min(doctors, key=lambda doctor: waits[doctor.id] + (doctor.id,))
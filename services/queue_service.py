@@ -1,325 +1,277 @@
 import redis
-import json
-from datetime import datetime
-import os
 import threading
-from collections import defaultdict
-import heapq
-import itertools
+from config import Config
+from .queue_backends import (
+    DatabaseQueueBackend, FailoverQueueBackend, MemoryQueueBackend, QueueJournal, RedisQueueBackend,
+    ShardedRedisQueueBackend
+)
+from .queue_backends.failover import REDIS_ERRORS
+from .redis_pool import InstrumentedConnectionPool
 
 class QueueService:
+    """
+    Process-wide entry point for queue operations. Routes only ever talk to
+    this class; the storage itself lives in a QueueBackend chosen at first
+    construction, so new backends can be added without touching the routes.
+    """
     _instance = None
     _redis_pool = None
+    _redis_pools = {}  # URL -> connection pool, one per Redis instance
     _lock = threading.Lock()
-    
+
+    # Settings the backend is built from: the Config defaults until app.py
+    # hands over app.config through configure()
+    config = {name: getattr(Config, name) for name in dir(Config) if name.isupper()}
+
+    # Decoded get_queue pages kept per process; a full cache is simply dropped
+    QUEUE_CACHE_SIZE = 1024
+
     def __new__(cls, redis_url=None):
         if cls._instance is None:
             cls._instance = super(QueueService, cls).__new__(cls)
+            # A list of URLs (or REDIS_SHARD_URLS) spreads doctors' queues over several instances
+            config = cls.config
+            shard_urls = [url.strip() for url in (config['REDIS_SHARD_URLS'] or '').split(',') if url.strip()]
+            if isinstance(redis_url, (list, tuple)):
+                shard_urls, redis_url = list(redis_url), None
             if redis_url is None:
-                redis_url = os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/0')
-            
+                redis_url = shard_urls[0] if shard_urls else config['REDIS_URL']
+
             # Check if Redis should be used
-            use_redis = os.environ.get('USE_REDIS', 'True').lower() == 'true'
-            
+            use_redis = config['USE_REDIS']
+            backend_name = config['QUEUE_BACKEND']
+
             # Try to connect to Redis, but fall back to in-memory if unavailable or disabled
-            cls._instance.redis_client = None
-            cls._instance.use_redis = False
-            
-            if use_redis:
+            cls._instance.backend = None
+            cls._instance._queue_cache = {}  # (doctor_id, offset, limit) -> (backend, (epoch, version), entries)
+            cls._instance.cache_stats = {'hits': 0, 'misses': 0}
+
+            if backend_name == 'database':
+                print("Using the queue_entries table as queue storage.")
+                cls._instance.backend = DatabaseQueueBackend()
+            elif backend_name == 'redis' and use_redis:
                 try:
-                    print(f"Attempting to connect to Redis at {redis_url}")
-                    # Allow more time for initial connection and simpler retry logic
-                    cls._redis_pool = redis.ConnectionPool.from_url(
-                        redis_url,
-                        decode_responses=True,
-                        max_connections=10,
-                        socket_timeout=5,
-                        socket_connect_timeout=5,
-                        health_check_interval=30,
-                        retry_on_timeout=True
+                    if len(shard_urls) > 1:
+                        clients = {url: cls._client(url) for url in shard_urls}
+                        primary = ShardedRedisQueueBackend(clients)
+                    else:
+                        redis_client = cls._client(redis_url)
+                        cls._redis_pool = redis_client.connection_pool
+                        primary = RedisQueueBackend(redis_client)
+                    try:
+                        primary.ping()
+                        print(f"[OK] Redis connection successful ({len(shard_urls) or 1} instance(s))")
+                        available = True
+                    except REDIS_ERRORS as e:
+                        # Served from memory until Redis answers, then switched back
+                        print(f"[WARN] Redis at {redis_url} is not answering yet: {str(e)}")
+                        available = False
+                    cls._instance.backend = FailoverQueueBackend(
+                        primary,
+                        MemoryQueueBackend(),
+                        seed=cls._seed_fallback,
+                        retry_after=config['QUEUE_FAILOVER_RETRY_SECONDS'],
+                        max_buffered=config['QUEUE_FAILOVER_BUFFER'],
+                        available=available
                     )
-                    # Test the connection
-                    redis_client = redis.Redis(connection_pool=cls._redis_pool)
-                    response = redis_client.ping()
-                    print(f"[OK] Redis connection successful, ping response: {response}")
-                    cls._instance.redis_client = redis_client
-                    cls._instance.use_redis = True
-                    
-                except (redis.ConnectionError, ConnectionRefusedError, Exception) as e:
+
+                except Exception as e:
                     print(f"[WARN] Warning: Could not connect to Redis at {redis_url}")
                     print(f"   Error: {str(e)}")
                     print(f"   Falling back to in-memory queue storage.")
-                    print(f"   Note: Queue data will not persist across server restarts.")
-                    cls._instance.redis_client = None
-                    cls._instance.use_redis = False
+                    print(f"   Note: Queue data will not persist across server restarts unless QUEUE_SNAPSHOT_DIR is set.")
             else:
                 print("Redis is disabled via configuration. Using in-memory queue storage.")
-                print("Note: Queue data will not persist across server restarts.")
-                # Initialize in-memory storage
-                cls._instance._memory_queues = defaultdict(list)  # doctor_id -> list of (score, entry_data)
-                cls._instance._memory_positions = {}  # patient_id -> doctor_id
-                cls._instance._counter = itertools.count()  # Counter for unique tuple ordering
-                
+                print("Note: Queue data will not persist across server restarts unless QUEUE_SNAPSHOT_DIR is set.")
+
+            if cls._instance.backend is None:
+                cls._instance.backend = cls._memory_backend()
+
         return cls._instance
 
+    @classmethod
+    def configure(cls, config):
+        """Build the backend from `config` (app.config); call before the first QueueService()."""
+        cls.config = config
+
+    @classmethod
+    def _client(cls, redis_url):
+        """Client for one Redis instance; nothing is sent until it is used."""
+        print(f"Attempting to connect to Redis at {redis_url}")
+        # Greenlets beyond REDIS_MAX_CONNECTIONS wait up to REDIS_POOL_TIMEOUT
+        # for a connection instead of failing straight away
+        pool = InstrumentedConnectionPool.from_url(
+            redis_url,
+            decode_responses=True,
+            max_connections=cls.config['REDIS_MAX_CONNECTIONS'],
+            timeout=cls.config['REDIS_POOL_TIMEOUT'],
+            socket_timeout=5,
+            socket_connect_timeout=5,
+            health_check_interval=30,
+            retry_on_timeout=True
+        )
+        cls._redis_pools[redis_url] = pool
+        return redis.Redis(connection_pool=pool)
+
+    @staticmethod
+    def _seed_fallback(fallback):
+        # Degraded queues start from the waiting rows, the durable record of who is queued
+        from .queue_rebuild import seed_queues
+        return seed_queues(fallback)
+
+    @classmethod
+    def _memory_backend(cls):
+        # With QUEUE_SNAPSHOT_DIR set, in-memory queues are journaled to disk
+        # and restored from it, so a restarted worker keeps its patients
+        snapshot_dir = cls.config['QUEUE_SNAPSHOT_DIR']
+        if not snapshot_dir:
+            return MemoryQueueBackend()
+        journal = QueueJournal(
+            snapshot_dir,
+            snapshot_every=cls.config['QUEUE_SNAPSHOT_EVERY'],
+            snapshot_interval=cls.config['QUEUE_SNAPSHOT_INTERVAL'],
+            fsync=cls.config['QUEUE_SNAPSHOT_FSYNC']
+        )
+        backend = MemoryQueueBackend(journal)
+        print(f"Restored {journal.stats['restored_entries']} queued patients from {snapshot_dir} "
+              f"in {journal.stats['restore_ms']} ms")
+        return backend
+
     def __init__(self, redis_url=None):
         # initialization is handled in __new__
-        if not hasattr(self, 'use_redis'):
-            self.use_redis = False
-        if not hasattr(self, '_memory_queues'):
-            self._memory_queues = defaultdict(list)
-        if not hasattr(self, '_memory_positions'):
-            self._memory_positions = {}
-        if not hasattr(self, '_counter'):
-            self._counter = itertools.count()
-    
-    def _get_queue_key(self, doctor_id):
-        return f"queue:doctor:{doctor_id}"
-    
-    def _get_position_key(self, patient_id):
-        return f"position:patient:{patient_id}"
-    
+        pass
+
+    @property
+    def use_redis(self):
+        backend = getattr(self.backend, 'primary', self.backend)
+        return isinstance(backend, (RedisQueueBackend, ShardedRedisQueueBackend))
+
+    def pool_metrics(self):
+        """{url: connection pool counters} for each Redis instance, or None without Redis."""
+        if not self.use_redis:
+            return None
+        return {url: pool.metrics() for url, pool in self._redis_pools.items()}
+
+    def failover_metrics(self):
+        """Circuit breaker state and time spent degraded, or None without failover."""
+        metrics = getattr(self.backend, 'metrics', None)
+        return metrics() if metrics is not None else None
+
+    @property
+    def stores_entries(self):
+        """True when the backend writes QueueEntry rows itself."""
+        return self.backend.stores_entries
+
+    @property
+    def redis_client(self):
+        return getattr(self.backend, 'redis_client', None)
+
     def enqueue(self, patient_id, doctor_id, priority=0, appointment_id=None, queue_number=None):
-        if self.use_redis and self.redis_client:
-            queue_key = self._get_queue_key(doctor_id)
-            position_key = self._get_position_key(patient_id)
-            
-            entry_data = {
-                'patient_id': patient_id,
-                'doctor_id': doctor_id,
-                'priority': priority,
-                'appointment_id': appointment_id,
-                'queue_number': queue_number,
-                'joined_at': datetime.utcnow().isoformat()
-            }
-            
-            score = -priority if priority > 0 else datetime.utcnow().timestamp()
-            
-            self.redis_client.zadd(queue_key, {json.dumps(entry_data): score})
-            self.redis_client.set(position_key, str(doctor_id))
-            return True
-        else:
-            # In-memory fallback
-            with self._lock:
-                entry_data = {
-                    'patient_id': patient_id,
-                    'doctor_id': doctor_id,
-                    'priority': priority,
-                    'appointment_id': appointment_id,
-                    'queue_number': queue_number,
-                    'joined_at': datetime.utcnow().isoformat()
-                }
-                
-                score = -priority if priority > 0 else datetime.utcnow().timestamp()
-                
-                # Add to sorted list (maintain sorted order)
-                # Use counter to ensure unique tuples for heapq (dicts can't be compared)
-                queue = self._memory_queues[doctor_id]
-                heapq.heappush(queue, (score, next(self._counter), entry_data))
-                self._memory_positions[patient_id] = doctor_id
-            return True
-    
+        return self.backend.enqueue(patient_id, doctor_id, priority, appointment_id, queue_number)
+
+    def bulk_enqueue(self, entries):
+        """
+        Enqueue many patients at once. Each entry is a dict with patient_id and
+        doctor_id plus optional priority, appointment_id and queue_number.
+        Returns the number enqueued.
+        """
+        return self.backend.bulk_enqueue(list(entries))
+
     def dequeue(self, doctor_id):
-        if self.use_redis and self.redis_client:
-            queue_key = self._get_queue_key(doctor_id)
-            
-            entries = self.redis_client.zrange(queue_key, 0, 0)
-            if not entries:
-                return None
-            
-            entry = json.loads(entries[0])
-            self.redis_client.zrem(queue_key, entries[0])
-            
-            position_key = self._get_position_key(entry['patient_id'])
-            self.redis_client.delete(position_key)
-            
-            return entry
-        else:
-            # In-memory fallback
-            with self._lock:
-                queue = self._memory_queues[doctor_id]
-                if not queue:
-                    return None
-                
-                score, counter, entry = heapq.heappop(queue)
-                if entry['patient_id'] in self._memory_positions:
-                    del self._memory_positions[entry['patient_id']]
-                return entry
-    
+        return self.backend.dequeue(doctor_id)
+
     def get_position(self, patient_id):
-        if self.use_redis and self.redis_client:
-            position_key = self._get_position_key(patient_id)
-            doctor_id = self.redis_client.get(position_key)
-            
-            if not doctor_id:
-                return None
-            
-            # Convert doctor_id to int if it's a string
-            try:
-                doctor_id = int(doctor_id)
-            except (ValueError, TypeError):
-                return None
-            
-            queue_key = self._get_queue_key(doctor_id)
-            all_entries = self.redis_client.zrange(queue_key, 0, -1)
-            
-            for idx, entry_json in enumerate(all_entries):
-                entry = json.loads(entry_json)
-                if entry['patient_id'] == patient_id:
-                    return {
-                        'position': idx + 1,
-                        'total': len(all_entries),
-                        'doctor_id': doctor_id,
-                        'entry': entry
-                    }
-            
-            return None
-        else:
-            # In-memory fallback
-            with self._lock:
-                if patient_id not in self._memory_positions:
-                    return None
-                
-                doctor_id = self._memory_positions[patient_id]
-                queue = self._memory_queues[doctor_id]
-                
-                # Find position in sorted queue
-                sorted_queue = sorted(queue, key=lambda x: (x[0], x[1]))
-                for idx, (score, counter, entry) in enumerate(sorted_queue):
-                    if entry['patient_id'] == patient_id:
-                        return {
-                            'position': idx + 1,
-                            'total': len(sorted_queue),
-                            'doctor_id': doctor_id,
-                            'entry': entry
-                        }
-                
-                return None
-    
-    def get_queue(self, doctor_id):
-        if self.use_redis and self.redis_client:
-            queue_key = self._get_queue_key(doctor_id)
-            all_entries = self.redis_client.zrange(queue_key, 0, -1)
-            
-            queue_list = []
-            for idx, entry_json in enumerate(all_entries):
-                entry = json.loads(entry_json)
-                entry['position'] = idx + 1
-                queue_list.append(entry)
-            
-            return queue_list
+        return self.backend.get_position(patient_id)
+
+    def get_positions(self, patient_ids):
+        """
+        Positions for many patients at once, as {patient_id: info} with the
+        same info dict get_position returns, or None for patients not queued.
+        """
+        return self.backend.get_positions(patient_ids)
+
+    def get_queue(self, doctor_id, offset=0, limit=None):
+        """
+        Entries of a doctor's queue in order, each with its 1-based 'position'.
+        offset/limit select a rank range so a page costs O(log n + limit)
+        rather than reading the whole queue; limit=None reads to the end.
+
+        Pages are cached per process against the doctor's queue version, so
+        a repeat read while the queue is unchanged costs one version lookup.
+        """
+        version = self.backend.get_version(doctor_id)
+        if version is None:
+            return self.backend.get_queue(doctor_id, offset, limit)
+        # Counters that started over (a Redis that lost its data) come with a new epoch
+        version = (self.backend.get_epoch(doctor_id), version)
+
+        cache_key = (doctor_id, offset, limit)
+        cached = self._queue_cache.get(cache_key)
+        if cached is not None and cached[0] is self.backend and cached[1] == version:
+            self.cache_stats['hits'] += 1
         else:
-            # In-memory fallback
-            with self._lock:
-                queue = self._memory_queues[doctor_id]
-                sorted_queue = sorted(queue, key=lambda x: (x[0], x[1]))
-                
-                queue_list = []
-                for idx, (score, counter, entry) in enumerate(sorted_queue):
-                    entry_copy = entry.copy()
-                    entry_copy['position'] = idx + 1
-                    queue_list.append(entry_copy)
-                
-                return queue_list
-    
+            self.cache_stats['misses'] += 1
+            # Read after the version: a change in between only makes the
+            # cached page newer than its version, and the next read refetches
+            cached = (self.backend, version, self.backend.get_queue(doctor_id, offset, limit))
+            if len(self._queue_cache) >= self.QUEUE_CACHE_SIZE:
+                self._queue_cache.clear()
+            self._queue_cache[cache_key] = cached
+        # Callers get their own dicts so they cannot alter the cached page
+        return [entry.copy() for entry in cached[2]]
+
+    def get_version(self, doctor_id):
+        """Change counter of a doctor's queue, or None if the backend keeps none."""
+        return self.backend.get_version(doctor_id)
+
+    def queue_etag(self, doctor_id, *parts, version=None):
+        """
+        Tag for a response built from a doctor's queue, changing whenever the
+        queue does; parts tell apart views of the same queue (a page, a
+        patient). Read it before reading the data it tags, or pass a version
+        read that way. None when the backend keeps no versions.
+        """
+        if version is None:
+            version = self.backend.get_version(doctor_id)
+        if version is None:
+            return None
+        return '-'.join(str(part) for part in ('q', self.backend.get_epoch(doctor_id), doctor_id, version) + parts)
+
+    @staticmethod
+    def etag_doctor(etag):
+        """Doctor id a queue_etag was made for, or None if etag is not one."""
+        parts = etag.split('-')
+        if len(parts) < 4 or parts[0] != 'q':
+            return None
+        try:
+            return int(parts[2])
+        except ValueError:
+            return None
+
     def remove_from_queue(self, patient_id):
-        if self.use_redis and self.redis_client:
-            position_key = self._get_position_key(patient_id)
-            doctor_id = self.redis_client.get(position_key)
-            
-            if not doctor_id:
-                return False
-            
-            # Convert doctor_id to int if it's a string
-            try:
-                doctor_id = int(doctor_id)
-            except (ValueError, TypeError):
-                return False
-            
-            queue_key = self._get_queue_key(doctor_id)
-            all_entries = self.redis_client.zrange(queue_key, 0, -1)
-            
-            for entry_json in all_entries:
-                entry = json.loads(entry_json)
-                if entry['patient_id'] == patient_id:
-                    self.redis_client.zrem(queue_key, entry_json)
-                    self.redis_client.delete(position_key)
-                    return True
-            
-            return False
-        else:
-            # In-memory fallback
-            with self._lock:
-                if patient_id not in self._memory_positions:
-                    return False
-                
-                doctor_id = self._memory_positions[patient_id]
-                queue = self._memory_queues[doctor_id]
-                
-                # Remove entry from queue
-                new_queue = [(score, counter, entry) for score, counter, entry in queue if entry['patient_id'] != patient_id]
-                self._memory_queues[doctor_id] = new_queue
-                del self._memory_positions[patient_id]
-                return True
-    
+        return self.backend.remove_from_queue(patient_id)
+
+    def bulk_remove(self, patient_ids):
+        """Remove many patients from whichever queues they are in. Returns the number removed."""
+        return self.backend.bulk_remove(list(patient_ids))
+
     def reorder_queue(self, doctor_id, new_order):
-        if self.use_redis and self.redis_client:
-            queue_key = self._get_queue_key(doctor_id)
-            
-            with self.redis_client.pipeline() as pipe:
-                pipe.delete(queue_key)
-                for idx, entry in enumerate(new_order):
-                    pipe.zadd(queue_key, {json.dumps(entry): idx})
-                pipe.execute()
-            
-            return True
-        else:
-            # In-memory fallback
-            with self._lock:
-                new_queue = []
-                for idx, entry in enumerate(new_order):
-                    score = entry.get('priority', 0)
-                    score = -score if score > 0 else datetime.utcnow().timestamp() + idx
-                    new_queue.append((score, next(self._counter), entry))
-                self._memory_queues[doctor_id] = new_queue
-                # Update positions
-                for entry in new_order:
-                    if 'patient_id' in entry:
-                        self._memory_positions[entry['patient_id']] = doctor_id
-            return True
-    
+        return self.backend.reorder_queue(doctor_id, new_order)
+
+    def queued_patients(self):
+        """{patient_id: doctor_id} for every patient queued with any doctor."""
+        return self.backend.queued_patients()
+
     def get_queue_length(self, doctor_id):
-        if self.use_redis and self.redis_client:
-            queue_key = self._get_queue_key(doctor_id)
-            return self.redis_client.zcard(queue_key)
-        else:
-            # In-memory fallback
-            with self._lock:
-                return len(self._memory_queues[doctor_id])
-    
+        return self.backend.get_queue_length(doctor_id)
+
+    def get_queue_lengths(self, doctor_ids):
+        """{doctor_id: queue length} for many doctors in one batched read."""
+        return self.backend.get_queue_lengths(list(doctor_ids))
+
     def clear_queue(self, doctor_id):
-        if self.use_redis and self.redis_client:
-            queue_key = self._get_queue_key(doctor_id)
-            return bool(self.redis_client.delete(queue_key))
-        else:
-            # In-memory fallback
-            with self._lock:
-                if doctor_id in self._memory_queues:
-                    # Remove position entries for patients in this queue
-                    queue = self._memory_queues[doctor_id]
-                    for score, counter, entry in queue:
-                        if entry['patient_id'] in self._memory_positions:
-                            del self._memory_positions[entry['patient_id']]
-                    del self._memory_queues[doctor_id]
-                    return True
-                return False
+        return self.backend.clear_queue(doctor_id)
 
     def clear_all(self):
         """Clear all queues - used for testing"""
-        if self.use_redis and self.redis_client:
-            self.redis_client.flushdb()
-        else:
-            with self._lock:
-                self._memory_queues.clear()
-                self._memory_positions.clear()
-                self._counter = itertools.count()
+        self.backend.clear_all()
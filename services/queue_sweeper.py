@@ -0,0 +1,137 @@
+import time
+from datetime import datetime, timedelta, time as dt_time
+
+from sqlalchemy import insert, literal, select
+
+from models import db, QueueEntry, QueueEntryArchive
+
+# Finished entries older than this many days move to queue_entries_archive
+ARCHIVE_AFTER_DAYS = 30
+
+# Statuses an entry can no longer leave, and so can be archived from
+FINISHED_STATUSES = ('completed', 'cancelled')
+
+# Held for a day so only one worker runs each scheduled sweep
+LOCK_KEY_PREFIX = 'queue_sweep:'
+
+
+def sweep_queues(queue_service, now=None, archive_after_days=ARCHIVE_AFTER_DAYS, batch_size=1000):
+    """
+    End-of-day cleanup, so the live queues and queue_entries only hold
+    what the clinic is working on:
+
+    - patients still queued from a previous day are taken off their queue,
+      and position keys left without a queue are dropped, in bulk removes
+      of batch_size (pipelined on Redis);
+    - waiting rows from a previous day are cancelled, and so are rows left
+      in_consultation (reported as closed), each with one UPDATE. Nobody
+      finished those consultations, so they are not marked completed and
+      teach the consult time estimator nothing;
+    - completed and cancelled rows that joined more than archive_after_days
+      before today are copied to queue_entries_archive and deleted, in
+      batches of batch_size, one transaction each.
+
+    "Today" starts at midnight UTC of `now` (default now). Running it twice
+    is harmless. Returns a report; needs an application context.
+    """
+    started = time.perf_counter()
+    now = now or datetime.utcnow()
+    day_start = datetime.combine(now.date(), dt_time.min)
+    report = {
+        'backend': queue_service.backend.name,
+        'unqueued': 0,
+        'dangling': 0,
+        'cancelled': 0,
+        'closed': 0,
+        'archived': 0
+    }
+
+    if not queue_service.stores_entries:
+        # The database backend reads the rows below; others keep their own state
+        patient_ids = list(queue_service.queued_patients())
+        stale, dangling = [], []
+        for i in range(0, len(patient_ids), batch_size):
+            for patient_id, info in queue_service.get_positions(patient_ids[i:i + batch_size]).items():
+                if info is None:
+                    dangling.append(patient_id)
+                elif _joined_before(info['entry'], day_start):
+                    stale.append(patient_id)
+        for i in range(0, len(stale), batch_size):
+            report['unqueued'] += queue_service.bulk_remove(stale[i:i + batch_size])
+        for i in range(0, len(dangling), batch_size):
+            queue_service.bulk_remove(dangling[i:i + batch_size])
+        report['dangling'] = len(dangling)
+
+    report['cancelled'] = QueueEntry.query.filter(
+        QueueEntry.status == 'waiting',
+        QueueEntry.joined_at < day_start
+    ).update({QueueEntry.status: 'cancelled'}, synchronize_session=False)
+    report['closed'] = QueueEntry.query.filter(
+        QueueEntry.status == 'in_consultation',
+        QueueEntry.joined_at < day_start
+    ).update({QueueEntry.status: 'cancelled'}, synchronize_session=False)
+    db.session.commit()
+
+    report['archived'] = archive_entries(day_start - timedelta(days=archive_after_days), now, batch_size)
+    report['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return report
+
+
+def archive_entries(cutoff, archived_at=None, batch_size=1000):
+    """Move finished rows that joined before cutoff to the archive table. Returns how many moved."""
+    archived_at = archived_at or datetime.utcnow()
+    columns = [column.name for column in QueueEntry.__table__.columns]
+    moved = 0
+    while True:
+        ids = [row.id for row in db.session.query(QueueEntry.id).filter(
+            QueueEntry.status.in_(FINISHED_STATUSES),
+            QueueEntry.joined_at < cutoff
+        ).order_by(QueueEntry.id).limit(batch_size)]
+        if not ids:
+            return moved
+        source = select(
+            *[QueueEntry.__table__.c[name] for name in columns],
+            literal(archived_at, db.DateTime)
+        ).where(QueueEntry.id.in_(ids))
+        db.session.execute(insert(QueueEntryArchive).from_select(columns + ['archived_at'], source))
+        QueueEntry.query.filter(QueueEntry.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        moved += len(ids)
+
+
+def _joined_before(entry, day_start):
+    joined_at = entry.get('joined_at')
+    return joined_at is not None and datetime.fromisoformat(joined_at) < day_start
+
+
+def seconds_until(at, now):
+    """Seconds from now until the next HH:MM (UTC)."""
+    hour, minute = (int(part) for part in at.split(':'))
+    next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+
+def claim_sweep(redis_client, day):
+    """True for the one worker that should sweep on `day`; always True without Redis."""
+    if redis_client is None:
+        return True
+    return bool(redis_client.set(f"{LOCK_KEY_PREFIX}{day.isoformat()}", 1, nx=True, ex=24 * 3600))
+
+
+def run_scheduled_sweeps(app, queue_service, at, sleep):
+    """
+    Sweep every day at `at` (HH:MM, UTC) for as long as the process lives.
+    Meant for a background task; `sleep` is the server's cooperative sleep.
+    """
+    while True:
+        sleep(seconds_until(at, datetime.utcnow()))
+        with app.app_context():
+            try:
+                if claim_sweep(queue_service.redis_client, datetime.utcnow().date()):
+                    report = sweep_queues(queue_service, archive_after_days=app.config['QUEUE_ARCHIVE_AFTER_DAYS'])
+                    app.logger.info('Queue sweep: %s', report)
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('Queue sweep failed')
@@ -0,0 +1,93 @@
+import threading
+import time
+from functools import partial
+from queue import Empty, LifoQueue
+
+import redis
+
+
+class PoolTimeoutError(redis.exceptions.RedisError):
+    """
+    No pooled connection came free within the pool's wait timeout. The pool
+    is too small for the load, which is not Redis being down, so this is not
+    a ConnectionError and does not trip the failover circuit.
+    """
+
+
+class _TimedQueue(LifoQueue):
+    """The pool's free list, reporting how long each checkout waited."""
+
+    def __init__(self, on_checkout, maxsize=0):
+        super().__init__(maxsize)
+        self._on_checkout = on_checkout
+
+    def get(self, block=True, timeout=None):
+        try:
+            item = super().get(block=False)
+        except Empty:
+            if not block:
+                raise
+        else:
+            self._on_checkout(0.0, False)
+            return item
+
+        started = time.perf_counter()
+        try:
+            item = super().get(True, timeout)
+        except Empty:
+            self._on_checkout(time.perf_counter() - started, True)
+            raise PoolTimeoutError(f"No Redis connection came free within {timeout}s")
+        self._on_checkout(time.perf_counter() - started, False)
+        return item
+
+
+class InstrumentedConnectionPool(redis.BlockingConnectionPool):
+    """
+    Redis connection pool that makes callers wait up to `timeout` seconds
+    for a free connection once max_connections are out, rather than failing
+    at once with "Too many connections" as the default pool does. Under
+    eventlet the wait yields to other greenlets.
+
+    Counts checkouts, how many had to wait, for how long and how many gave
+    up, so the pool can be sized from what it actually sees.
+    """
+
+    def __init__(self, max_connections=50, timeout=5, **connection_kwargs):
+        self._stats_lock = threading.Lock()
+        self.stats = {'checkouts': 0, 'waits': 0, 'timeouts': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+        super().__init__(
+            max_connections=max_connections,
+            timeout=timeout,
+            queue_class=partial(_TimedQueue, self._record_checkout),
+            **connection_kwargs
+        )
+
+    def _record_checkout(self, waited, timed_out):
+        with self._stats_lock:
+            self.stats['checkouts'] += 1
+            if waited or timed_out:
+                self.stats['waits'] += 1
+                self.stats['wait_seconds'] += waited
+                self.stats['max_wait_seconds'] = max(self.stats['max_wait_seconds'], waited)
+            if timed_out:
+                self.stats['timeouts'] += 1
+
+    def metrics(self):
+        """Connections in use and idle, and checkout wait counters."""
+        # The free list holds idle connections and None for ones never opened
+        idle = sum(1 for connection in list(self.pool.queue) if connection is not None)
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return {
+            'max_connections': self.max_connections,
+            'timeout': self.timeout,
+            'open': len(self._connections),
+            'in_use': len(self._connections) - idle,
+            'idle': idle,
+            'checkouts': stats['checkouts'],
+            'waits': stats['waits'],
+            'timeouts': stats['timeouts'],
+            'wait_ms_total': round(stats['wait_seconds'] * 1000, 1),
+            'wait_ms_max': round(stats['max_wait_seconds'] * 1000, 1),
+            'wait_ms_avg': round(stats['wait_seconds'] * 1000 / stats['waits'], 2) if stats['waits'] else 0.0
+        }
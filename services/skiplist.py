@@ -0,0 +1,199 @@
+import math
+import random
+
+
+class _Tail:
+    """Sentinel key that sorts after every real key."""
+    __slots__ = ()
+
+    def __lt__(self, other):
+        return False
+
+    def __le__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return True
+
+    def __ge__(self, other):
+        return True
+
+
+class _Node:
+    __slots__ = ('key', 'value', 'next', 'width')
+
+    def __init__(self, key, value, levels):
+        self.key = key
+        self.value = value
+        self.next = [None] * levels
+        # width[level] = number of level-0 steps from this node to next[level]
+        self.width = [1] * levels
+
+
+class IndexableSkipList:
+    """
+    Sorted mapping of unique, comparable keys to values with O(log n)
+    insert, remove, rank and index access.
+
+    Every link records how many entries it skips, which is what turns a
+    plain skip list into an order-statistic structure: rank(key) and
+    self[i] sum link widths on the way down instead of walking the list.
+    """
+
+    MAX_LEVELS = 24  # comfortably above log2 of any realistic queue size
+
+    def __init__(self):
+        self._tail = _Node(_Tail(), None, 0)
+        self._head = _Node(None, None, self.MAX_LEVELS)
+        self._head.next = [self._tail] * self.MAX_LEVELS
+        self._size = 0
+
+    @classmethod
+    def from_sorted(cls, items):
+        """
+        Build a list from (key, value) pairs already in strictly ascending key
+        order in O(n), linking each level left to right instead of searching
+        for every insert. Used to restore queues from a snapshot.
+        """
+        skiplist = cls()
+        last = [skiplist._head] * cls.MAX_LEVELS  # last node linked at each level
+        last_index = [0] * cls.MAX_LEVELS  # its 1-based index; the head is 0
+        index = 0
+        for key, value in items:
+            index += 1
+            node = _Node(key, value, skiplist._random_levels())
+            for level in range(len(node.next)):
+                last[level].next[level] = node
+                last[level].width[level] = index - last_index[level]
+                last[level] = node
+                last_index[level] = index
+        for level in range(cls.MAX_LEVELS):
+            last[level].next[level] = skiplist._tail
+            last[level].width[level] = index + 1 - last_index[level]
+        skiplist._size = index
+        return skiplist
+
+    def __len__(self):
+        return self._size
+
+    def __bool__(self):
+        return self._size > 0
+
+    def __iter__(self):
+        node = self._head.next[0]
+        while node is not self._tail:
+            yield node.key, node.value
+            node = node.next[0]
+
+    def _random_levels(self):
+        # Geometric distribution with p = 1/2
+        return min(self.MAX_LEVELS, 1 - int(math.log(1.0 - random.random(), 2.0)))
+
+    def insert(self, key, value):
+        """Insert key -> value. Keys must be unique."""
+        chain = [None] * self.MAX_LEVELS
+        steps_at_level = [0] * self.MAX_LEVELS
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level].key <= key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        levels = self._random_levels()
+        new_node = _Node(key, value, levels)
+        steps = 0
+        for level in range(levels):
+            prev = chain[level]
+            new_node.next[level] = prev.next[level]
+            prev.next[level] = new_node
+            new_node.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(levels, self.MAX_LEVELS):
+            chain[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, key):
+        """Remove key and return its value. Raises KeyError if absent."""
+        chain = [None] * self.MAX_LEVELS
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+
+        target = chain[0].next[0]
+        if target is self._tail or target.key != key:
+            raise KeyError(key)
+
+        levels = len(target.next)
+        for level in range(levels):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(levels, self.MAX_LEVELS):
+            chain[level].width[level] -= 1
+        self._size -= 1
+        return target.value
+
+    def rank(self, key):
+        """Zero-based index of key, or None if absent."""
+        position = 0
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+        candidate = node.next[0]
+        if candidate is self._tail or candidate.key != key:
+            return None
+        return position
+
+    def _node_at(self, index):
+        remaining = index + 1
+        node = self._head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        return node
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError('skip list index out of range')
+        node = self._node_at(index)
+        return node.key, node.value
+
+    def items(self, start=0, stop=None):
+        """(key, value) pairs for ranks [start, stop) in O(log n + k)."""
+        if stop is None or stop > self._size:
+            stop = self._size
+        if start < 0:
+            start = 0
+        if start >= stop:
+            return []
+        node = self._node_at(start)
+        result = []
+        for _ in range(stop - start):
+            result.append((node.key, node.value))
+            node = node.next[0]
+        return result
+
+    def pop_first(self):
+        """Remove and return the smallest (key, value) pair, or None if empty."""
+        first = self._head.next[0]
+        if first is self._tail:
+            return None
+        for level in range(len(first.next)):
+            self._head.width[level] += first.width[level] - 1
+            self._head.next[level] = first.next[level]
+        for level in range(len(first.next), self.MAX_LEVELS):
+            self._head.width[level] -= 1
+        self._size -= 1
+        return first.key, first.value
+
+    def clear(self):
+        self.__init__()
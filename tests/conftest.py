@@ -3,9 +3,15 @@ Pytest configuration and shared fixtures for all test types.
 """
 import pytest
 import os
+
+# The shared QueueService stays in memory whether or not a Redis runs locally;
+# tests that need Redis get a fake one through their fixtures
+os.environ.setdefault('USE_REDIS', 'False')
+
 from app import app, db
 from models import User, Department, Appointment, QueueEntry, MedicalRecord, Prescription, DoctorAvailability
-from services import QueueService
+from services import QueueService, consult_time_estimator
+from services.queue_backends import DatabaseQueueBackend, FailoverQueueBackend, MemoryQueueBackend, QueueJournal, RedisQueueBackend, ShardedRedisQueueBackend
 from datetime import datetime, timedelta
 
 
@@ -29,6 +35,7 @@ def test_app():
         db.create_all()
         # Clear queue state
         QueueService().clear_all()
+        consult_time_estimator().clear()
         yield app
         db.session.remove()
         db.drop_all()
@@ -126,6 +133,52 @@ def queue_service_instance():
     service.clear_all()
 
 
+@pytest.fixture(scope='function')
+def redis_queue_service(monkeypatch):
+    """QueueService switched onto an in-process fake Redis for testing the Redis path."""
+    fakeredis = pytest.importorskip('fakeredis')
+    service = QueueService()
+    monkeypatch.setattr(service, 'backend', RedisQueueBackend(fakeredis.FakeRedis(decode_responses=True)))
+    yield service
+    service.redis_client.flushdb()
+
+
+@pytest.fixture(scope='function')
+def database_queue_service(test_app, monkeypatch):
+    """QueueService switched onto the queue_entries table of the test database.
+    monkeypatch comes after test_app so the backend is restored before the tables are dropped."""
+    service = QueueService()
+    monkeypatch.setattr(service, 'backend', DatabaseQueueBackend())
+    yield service
+
+
+@pytest.fixture(params=['memory', 'memory-journal', 'redis', 'redis-sharded', 'failover', 'database'])
+def queue_backend(request):
+    """Every QueueBackend implementation, for the shared conformance and benchmark suites."""
+    if request.param == 'memory':
+        backend = MemoryQueueBackend()
+    elif request.param == 'memory-journal':
+        backend = MemoryQueueBackend(QueueJournal(str(request.getfixturevalue('tmp_path'))))
+    elif request.param == 'redis':
+        fakeredis = pytest.importorskip('fakeredis')
+        backend = RedisQueueBackend(fakeredis.FakeRedis(decode_responses=True))
+    elif request.param == 'redis-sharded':
+        fakeredis = pytest.importorskip('fakeredis')
+        backend = ShardedRedisQueueBackend({
+            f"shard-{n}": fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True) for n in range(3)
+        })
+    elif request.param == 'failover':
+        # What QueueService runs whenever Redis is configured
+        fakeredis = pytest.importorskip('fakeredis')
+        backend = FailoverQueueBackend(RedisQueueBackend(fakeredis.FakeRedis(decode_responses=True)), MemoryQueueBackend())
+    elif request.param == 'database':
+        # Runs against the test app's in-memory SQLite database
+        request.getfixturevalue('test_app')
+        backend = DatabaseQueueBackend()
+    yield backend
+    backend.clear_all()
+
+
 @pytest.fixture(scope='function')
 def authenticated_admin(client, admin_user):
     """Login as admin and return client."""
@@ -2,9 +2,12 @@
 System Performance Tests
 Tests system performance, load handling, and response times.
 """
+import json
 import pytest
 import time
-from models import db, User, Department, Appointment
+from contextlib import nullcontext
+from unittest.mock import patch
+from models import db, User, Department, Appointment, QueueEntry
 from services import QueueService
 from datetime import datetime, timedelta
 
@@ -190,3 +193,382 @@ class TestLoadHandling:
         assert len(dequeued) == 100
         assert dequeue_time < 2.0  # 100 dequeues in under 2 seconds
 
+
+
+@pytest.mark.performance
+class TestQueueScaling:
+    """Micro-benchmarks for the in-memory queue at realistic and extreme sizes."""
+    
+    def _per_op(self, fn, args):
+        start_time = time.perf_counter()
+        for arg in args:
+            fn(arg)
+        return (time.perf_counter() - start_time) / len(args)
+    
+    def _costs(self, size):
+        """Best-of-three cost per call of each O(log n) operation on an n-patient queue."""
+        from services.queue_backends import MemoryQueueBackend
+        backend = MemoryQueueBackend()
+        backend.bulk_enqueue([{'patient_id': i, 'doctor_id': 1} for i in range(size)])
+        probes = list(range(0, size, size // 200))
+        operations = {
+            'get_position': backend.get_position,
+            'remove': backend.remove_from_queue,
+            'enqueue': lambda pid: backend.enqueue(patient_id=pid, doctor_id=1),
+            '20-entry range': lambda start: backend.get_queue(1, offset=start, limit=20),
+        }
+        costs = {}
+        for _ in range(3):
+            for name, fn in operations.items():
+                costs[name] = min(costs.get(name, float('inf')), self._per_op(fn, probes))
+        assert backend.get_queue_length(1) == size
+        return costs
+    
+    @pytest.mark.benchmark
+    def test_in_memory_queue_ops_scale_logarithmically(self):
+        """Test: Position, removal, insertion and ranged reads stay O(log n)."""
+        small, large = self._costs(10_000), self._costs(100_000)
+        
+        print("\n[in-memory 10k -> 100k] " + ' '.join(
+            f"{name} {small[name] * 1e6:.1f}us -> {large[name] * 1e6:.1f}us" for name in small
+        ))
+        # Ten times the patients: an O(log n) cost grows by about a quarter
+        # (plus cache misses), an O(n) one tenfold
+        assert all(large[name] < small[name] * 4 for name in small)
+    
+    @pytest.mark.benchmark
+    def test_in_memory_queue_contention(self, queue_service_instance):
+        """Test: Many concurrent callers across many doctors stay consistent and fast."""
+        import threading
+        doctors, callers_per_doctor, ops = 32, 4, 250
+        errors = []
+        
+        def caller(doctor_id, base):
+            try:
+                for i in range(ops):
+                    patient_id = base + i
+                    queue_service_instance.enqueue(patient_id=patient_id, doctor_id=doctor_id)
+                    queue_service_instance.get_position(patient_id)
+                    if i % 2:
+                        queue_service_instance.remove_from_queue(patient_id)
+                    queue_service_instance.get_queue_length(doctor_id)
+            except Exception as exc:  # pragma: no cover - surfaced via assertion below
+                errors.append(exc)
+        
+        threads = [
+            threading.Thread(target=caller, args=(doctor_id, (doctor_id * callers_per_doctor + c) * ops))
+            for doctor_id in range(doctors)
+            for c in range(callers_per_doctor)
+        ]
+        start_time = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start_time
+        
+        total_ops = len(threads) * ops * 4
+        print(f"\n[in-memory contention] {len(threads)} callers over {doctors} doctors: "
+              f"{total_ops / elapsed:,.0f} ops/s")
+        
+        assert not errors
+        for doctor_id in range(doctors):
+            assert queue_service_instance.get_queue_length(doctor_id) == callers_per_doctor * ops // 2
+    
+    @pytest.mark.parametrize('backend', ['in-memory', 'redis'])
+    @pytest.mark.benchmark
+    def test_bulk_enqueue_throughput(self, request, backend):
+        """Test: Pipelined bulk enqueue/remove beats per-call enqueue/remove."""
+        fixture = 'queue_service_instance' if backend == 'in-memory' else 'redis_queue_service'
+        service = request.getfixturevalue(fixture)
+        entries = [{'patient_id': pid, 'doctor_id': pid % 20} for pid in range(5000)]
+        
+        start_time = time.perf_counter()
+        for entry in entries:
+            service.enqueue(**entry)
+        for entry in entries:
+            service.remove_from_queue(entry['patient_id'])
+        per_call = time.perf_counter() - start_time
+        
+        start_time = time.perf_counter()
+        service.bulk_enqueue(entries)
+        service.bulk_remove([entry['patient_id'] for entry in entries])
+        bulk = time.perf_counter() - start_time
+        
+        print(f"\n[{backend} 5000 enqueue+remove] per-call {len(entries) / per_call:,.0f}/s "
+              f"bulk {len(entries) / bulk:,.0f}/s")
+        assert all(service.get_queue_length(doctor_id) == 0 for doctor_id in range(20))
+        if backend == 'redis':
+            assert bulk < per_call
+
+
+    @pytest.mark.benchmark
+    def test_in_memory_snapshot_restore(self, tmp_path):
+        """Test: A journaled worker restores thousands of queues in milliseconds."""
+        from services.queue_backends import MemoryQueueBackend, QueueJournal
+        doctors, per_doctor = 2000, 10
+        backend = MemoryQueueBackend(QueueJournal(str(tmp_path), snapshot_every=10**9, snapshot_interval=10**9))
+        backend.bulk_enqueue([
+            {'patient_id': pid, 'doctor_id': pid % doctors, 'queue_number': pid // doctors + 1}
+            for pid in range(doctors * per_doctor)
+        ])
+        
+        start_time = time.perf_counter()
+        for pid in range(0, 1000):
+            backend.enqueue(patient_id=pid, doctor_id=pid % doctors)
+        log_time = (time.perf_counter() - start_time) / 1000
+        
+        stats = backend.snapshot()
+        backend.remove_from_queue(0)
+        backend._journal.close()
+        restored = MemoryQueueBackend(QueueJournal(str(tmp_path)))
+        
+        print(f"\n[journal {doctors} queues x {per_doctor}] logged enqueue {log_time * 1e6:.1f}us "
+              f"snapshot {stats['snapshot_ms']:.1f}ms ({stats['snapshot_bytes'] / 1024:.0f} KiB) "
+              f"restore {restored._journal.stats['restore_ms']:.1f}ms")
+        assert restored._journal.stats['restored_entries'] == doctors * per_doctor - 1
+        assert restored.get_queue(1) == backend.get_queue(1)
+        assert restored._journal.stats['restore_ms'] < 1000
+    
+    @pytest.mark.benchmark
+    def test_rebuild_after_flush_throughput(self, test_app, redis_queue_service):
+        """Test: Rebuilding tens of thousands of waiting rows into Redis takes seconds."""
+        from services import rebuild_queues
+        size, doctors = 20_000, 20
+        doctor_ids = []
+        for i in range(doctors):
+            doctor = User(email=f'rebuild_doc{i}@test.com', full_name=f'Dr. Rebuild {i}', role='doctor')
+            doctor.set_password('x')
+            db.session.add(doctor)
+            doctor_ids.append(doctor)
+        db.session.flush()
+        joined = datetime.utcnow() - timedelta(hours=1)
+        db.session.execute(QueueEntry.__table__.insert(), [
+            {'patient_id': 100_000 + i, 'doctor_id': doctor_ids[i % doctors].id, 'status': 'waiting',
+             'priority': 0, 'queue_number': i // doctors + 1, 'joined_at': joined + timedelta(milliseconds=i)}
+            for i in range(size)
+        ])
+        db.session.commit()
+        # Half of Redis survived, plus some patients the database no longer has waiting
+        redis_queue_service.bulk_enqueue([
+            {'patient_id': 100_000 + i, 'doctor_id': doctor_ids[i % doctors].id} for i in range(0, size, 2)
+        ] + [{'patient_id': 900_000 + i, 'doctor_id': doctor_ids[0].id} for i in range(500)])
+        
+        report = rebuild_queues(redis_queue_service)
+        
+        print(f"\n[rebuild n={size}] {report['restored']} restored, {report['removed']} removed "
+              f"in {report['elapsed_ms']:.0f} ms")
+        assert (report['in_sync'], report['restored'], report['removed']) == (size // 2, size // 2, 500)
+        assert sum(redis_queue_service.get_queue_length(doctor.id) for doctor in doctor_ids) == size
+        assert report['elapsed_ms'] < 10_000
+
+
+@pytest.mark.performance
+class TestQueueBackendBenchmark:
+    """Shared per-operation benchmark run against every QueueBackend."""
+    
+    @pytest.mark.benchmark
+    def test_backend_operation_costs(self, queue_backend):
+        """Test: Every backend handles each queue operation well inside the latency budget."""
+        size = 1000
+        queue_backend.bulk_enqueue([{'patient_id': pid, 'doctor_id': 1} for pid in range(size)])
+        probes = list(range(0, size, 10))
+        
+        timings = {}
+        
+        def measure(name, fn):
+            start_time = time.perf_counter()
+            for patient_id in probes:
+                fn(patient_id)
+            timings[name] = (time.perf_counter() - start_time) / len(probes)
+        
+        measure('get_position', queue_backend.get_position)
+        measure('get_queue_page', lambda pid: queue_backend.get_queue(1, offset=pid, limit=20))
+        measure('remove', queue_backend.remove_from_queue)
+        measure('enqueue', lambda pid: queue_backend.enqueue(pid, 1))
+        measure('dequeue', lambda pid: queue_backend.dequeue(1))
+        
+        print(f"\n[{queue_backend.name} n={size}] " + ' '.join(
+            f"{name} {seconds * 1e6:.0f}us" for name, seconds in timings.items()
+        ))
+        assert queue_backend.get_queue_length(1) == size - len(probes)
+        # The database backend pays an ORM round trip and a ranked SELECT per call
+        budget = 0.05 if queue_backend.name == 'database' else 0.01
+        assert all(seconds < budget for seconds in timings.values())
+    
+    @pytest.mark.benchmark
+    def test_cached_full_queue_reads(self, redis_queue_service):
+        """Test: Repeat full-queue reads of an unchanged queue skip the ZRANGE and JSON decode."""
+        redis_queue_service.bulk_enqueue([{'patient_id': pid, 'doctor_id': 1} for pid in range(500)])
+        reads = 200
+        
+        start_time = time.perf_counter()
+        for _ in range(reads):
+            redis_queue_service.backend.get_queue(1)
+        uncached = (time.perf_counter() - start_time) / reads
+        
+        redis_queue_service.get_queue(1)
+        start_time = time.perf_counter()
+        for _ in range(reads):
+            redis_queue_service.get_queue(1)
+        cached = (time.perf_counter() - start_time) / reads
+        
+        print(f"\n[redis n=500] get_queue uncached {uncached * 1e6:.0f}us cached {cached * 1e6:.0f}us")
+        assert cached < uncached / 2
+
+
+@pytest.mark.performance
+class TestConditionalPolling:
+    """Cost of an idle dashboard poll with and without If-None-Match."""
+    
+    @pytest.mark.benchmark
+    def test_idle_dashboard_poll_savings(self, authenticated_doctor, doctor_user):
+        """Test: A 304 poll of an unchanged 20-patient page is far cheaper in bytes and CPU."""
+        patients = [
+            User(email=f'poll{i}@test.com', full_name=f'Polling Patient {i}', role='patient', phone='5550000')
+            for i in range(20)
+        ]
+        for patient in patients:
+            patient.password_hash = 'x'
+        db.session.add_all(patients)
+        db.session.commit()
+        QueueService().bulk_enqueue([{'patient_id': p.id, 'doctor_id': doctor_user.id} for p in patients])
+        url = '/doctor/queue-data?limit=20'
+        polls = 200
+        
+        def measure(headers):
+            start_cpu = time.process_time()
+            sent = 0
+            for _ in range(polls):
+                response = authenticated_doctor.get(url, headers=headers)
+                sent += len(response.data)
+            return (time.process_time() - start_cpu) / polls, sent / polls
+        
+        etag = authenticated_doctor.get(url).headers['ETag']
+        full_cpu, full_bytes = measure({})
+        cond_cpu, cond_bytes = measure({'If-None-Match': etag})
+        
+        # A dashboard polls every 10s: 360 polls per open hour
+        print(f"\n[idle dashboard, 20 patients] 200: {full_bytes:.0f} B {full_cpu * 1e3:.2f} ms CPU; "
+              f"304: {cond_bytes:.0f} B {cond_cpu * 1e3:.2f} ms CPU; "
+              f"saves {(full_bytes - cond_bytes) * 360 / 1024:.0f} KiB and "
+              f"{(full_cpu - cond_cpu) * 360 * 1e3:.0f} ms CPU per dashboard-hour")
+        assert cond_bytes == 0
+        assert cond_cpu < full_cpu
+
+
+@pytest.mark.performance
+class TestAsyncQueueBenchmark:
+    """Blocking vs asyncio QueueService under 1k concurrent position polls."""
+    
+    POLLS = 1000
+    
+    def _clients(self):
+        # BENCH_REDIS_URL points the benchmark at a real server; by default
+        # both sides share an in-process fake one
+        import os
+        redis_url = os.environ.get('BENCH_REDIS_URL')
+        if redis_url:
+            import redis
+            import redis.asyncio as aioredis
+            return (lambda: redis.Redis.from_url(redis_url, decode_responses=True, max_connections=10),
+                    lambda: aioredis.Redis.from_url(redis_url, decode_responses=True, max_connections=100))
+        fakeredis = pytest.importorskip('fakeredis')
+        server = fakeredis.FakeServer()
+        return (lambda: fakeredis.FakeRedis(server=server, decode_responses=True),
+                lambda: fakeredis.aioredis.FakeRedis(server=server, decode_responses=True))
+    
+    def test_concurrent_position_polls(self):
+        """Test: 1k concurrent get_position calls through greenlets and through asyncio."""
+        import asyncio
+        import eventlet
+        from services import AsyncQueueService
+        from services.queue_backends import RedisQueueBackend
+        
+        make_sync, make_async = self._clients()
+        blocking = RedisQueueBackend(make_sync())
+        blocking.clear_all()
+        blocking.bulk_enqueue([{'patient_id': pid, 'doctor_id': pid % 20} for pid in range(self.POLLS)])
+        
+        start_time = time.perf_counter()
+        pool = eventlet.GreenPool(self.POLLS)
+        sync_results = list(pool.imap(blocking.get_position, range(self.POLLS)))
+        sync_rate = self.POLLS / (time.perf_counter() - start_time)
+        
+        async def poll_all():
+            service = AsyncQueueService(client=make_async())
+            started = time.perf_counter()
+            results = await asyncio.gather(*(service.get_position(pid) for pid in range(self.POLLS)))
+            elapsed = time.perf_counter() - started
+            await service.aclose()
+            return results, self.POLLS / elapsed
+        
+        async_results, async_rate = asyncio.run(poll_all())
+        blocking.clear_all()
+        
+        print(f"\n[{self.POLLS} concurrent position polls] eventlet+redis {sync_rate:,.0f} req/s, "
+              f"asyncio+redis.asyncio {async_rate:,.0f} req/s")
+        assert async_results == sync_results
+        assert all(result['position'] == pid // 20 + 1 for pid, result in enumerate(async_results))
+
+
+@pytest.mark.performance
+class TestQueueBenchmarkHarness:
+    """Smoke run of the bench-queue harness on small sizes."""
+    
+    @pytest.mark.benchmark
+    def test_small_run_covers_matrix(self, test_app):
+        """Test: Every backend, size, caller count and operation gets a result."""
+        pytest.importorskip('fakeredis')
+        from bench import BACKENDS, OPERATIONS, run_benchmark
+        
+        report = run_benchmark(sizes=(100,), callers=(1, 4), samples=10)
+        
+        cells = {(r['backend'], r['size'], r['callers'], r['op']) for r in report['results']}
+        assert cells == {(backend, 100, callers, op) for backend in BACKENDS for callers in (1, 4) for op in OPERATIONS} \
+            | {(backend, 100, 1, 'fill') for backend in BACKENDS}
+        assert all(result['p50_us'] > 0 for result in report['results'])
+        assert json.loads(json.dumps(report)) == report
+    
+    def test_queue_restored_as_found(self):
+        """Test: Dequeued and removed patients go back with their place, join time and priority."""
+        import random
+        from bench.queue_bench import DOCTOR_ID, _fill, _measure
+        from services.queue_backends import MemoryQueueBackend
+        
+        backend = MemoryQueueBackend()
+        _fill(backend, list(range(50)))
+        backend.enqueue(50, DOCTOR_ID, priority=3)
+        before = backend.get_queue(DOCTOR_ID)
+        
+        for op in ('dequeue', 'remove'):
+            _measure(backend, nullcontext, 'memory', op, 51, 2, 10, random.Random(0), 100)
+            assert backend.get_queue(DOCTOR_ID) == before
+    
+    def test_failing_operation_raises(self):
+        """Test: An operation that errors stops the run instead of being timed."""
+        from bench import run_benchmark
+        from services.queue_backends import MemoryQueueBackend
+        
+        def broken(self, patient_id):
+            raise RuntimeError('lookup failed')
+        
+        with patch.object(MemoryQueueBackend, 'get_position', broken):
+            with pytest.raises(RuntimeError, match='lookup failed'):
+                run_benchmark(backends=('memory',), sizes=(100,), callers=(4,), operations=('get_position',), samples=10)
+    
+    def test_compare_results(self):
+        """Test: A comparison pairs up the same measurements and ranks slowdowns first."""
+        from bench import compare_results
+        
+        def results(*p50s):
+            return {'version': 1, 'results': [
+                {'backend': 'memory', 'size': 100, 'callers': 1, 'op': op, 'p50_us': p50}
+                for op, p50 in zip(('enqueue', 'dequeue'), p50s)
+            ]}
+        
+        rows = compare_results(results(10.0, 20.0), results(15.0, 10.0))
+        
+        assert [(row['op'], row['ratio']) for row in rows] == [('enqueue', 1.5), ('dequeue', 0.5)]
+        with pytest.raises(ValueError):
+            compare_results(dict(results(1.0), version=0), results(1.0))
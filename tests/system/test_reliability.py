@@ -3,6 +3,8 @@ System Reliability Tests
 Tests system stability, error handling, and recovery.
 """
 import pytest
+from contextlib import ExitStack, contextmanager
+from unittest.mock import patch
 from models import db, User, Department, Appointment
 from services import QueueService
 from datetime import datetime, timedelta
@@ -168,3 +170,82 @@ class TestReliability:
         # Should redirect to login
         assert response.status_code in [200, 302]
 
+
+
+class TestConcurrentDequeue:
+    """Concurrent call-next must never hand the same patient to two callers."""
+    
+    @contextmanager
+    def _yielding(self, backend):
+        """
+        Make every greenlet give way where production could switch: before
+        and after taking a doctor's lock, and before each Redis command.
+        Without these points greenlets never yield, and a dequeue that is
+        not atomic would pass as easily as one that is.
+        """
+        import eventlet
+        
+        class YieldingLock:
+            def __init__(self, lock):
+                self._lock = lock
+            
+            def __enter__(self):
+                eventlet.sleep(0)
+                self._lock.acquire()
+                eventlet.sleep(0)
+                return self
+            
+            def __exit__(self, *exc_info):
+                self._lock.release()
+        
+        with ExitStack() as stack:
+            if hasattr(backend, '_get_doctor_lock'):
+                get_doctor_lock = backend._get_doctor_lock
+                stack.enter_context(patch.object(
+                    backend, '_get_doctor_lock', lambda doctor_id: YieldingLock(get_doctor_lock(doctor_id))
+                ))
+            if getattr(backend, 'redis_client', None) is not None:
+                execute_command = backend.redis_client.execute_command
+                
+                def yielding_command(*args, **options):
+                    eventlet.sleep(0)
+                    return execute_command(*args, **options)
+                stack.enter_context(patch.object(backend.redis_client, 'execute_command', yielding_command))
+            yield
+    
+    def _hammer(self, service, doctor_id, patients, callers):
+        import eventlet
+        for patient_id in range(1, patients + 1):
+            service.enqueue(patient_id=patient_id, doctor_id=doctor_id)
+        
+        popped = []
+        
+        def call_next():
+            while True:
+                entry = service.dequeue(doctor_id)
+                if entry is None:
+                    return
+                popped.append(entry['patient_id'])
+        
+        with self._yielding(service.backend):
+            pool = eventlet.GreenPool(callers)
+            for _ in range(callers):
+                pool.spawn(call_next)
+            pool.waitall()
+        return popped
+    
+    def test_concurrent_dequeue_redis(self, redis_queue_service):
+        """Test: Many greenlets dequeuing from Redis pop each patient exactly once."""
+        popped = self._hammer(redis_queue_service, doctor_id=10, patients=200, callers=50)
+        
+        assert sorted(popped) == list(range(1, 201))
+        assert redis_queue_service.get_queue_length(doctor_id=10) == 0
+        assert not redis_queue_service.redis_client.keys('position:patient:*')
+        assert not redis_queue_service.redis_client.exists('queue:doctor:10:entries')
+    
+    def test_concurrent_dequeue_in_memory(self, queue_service_instance):
+        """Test: Many greenlets dequeuing from memory pop each patient exactly once."""
+        popped = self._hammer(queue_service_instance, doctor_id=10, patients=200, callers=50)
+        
+        assert sorted(popped) == list(range(1, 201))
+        assert queue_service_instance.get_position(patient_id=1) is None
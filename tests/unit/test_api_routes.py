@@ -0,0 +1,106 @@
+"""
+Unit Tests for API Routes
+Tests individual REST API endpoints.
+"""
+import pytest
+from services import QueueService
+
+
+class TestQueuePositionsApi:
+    """Unit tests for the batch queue positions endpoint."""
+    
+    def test_positions_requires_staff(self, authenticated_patient):
+        """Test patients cannot read other patients' positions."""
+        response = authenticated_patient.get('/api/queue/positions?patient_ids=1')
+        assert response.status_code == 403
+    
+    def test_positions_validates_ids(self, authenticated_doctor):
+        """Test malformed or missing patient_ids are rejected."""
+        assert authenticated_doctor.get('/api/queue/positions').status_code == 400
+        assert authenticated_doctor.get('/api/queue/positions?patient_ids=1,x').status_code == 400
+    
+    def test_positions(self, authenticated_doctor, doctor_user):
+        """Test positions are returned for queued and unqueued patients."""
+        QueueService().enqueue(patient_id=101, doctor_id=doctor_user.id, queue_number=7)
+        QueueService().enqueue(patient_id=102, doctor_id=doctor_user.id, queue_number=8)
+        
+        response = authenticated_doctor.get('/api/queue/positions?patient_ids=102,555')
+        assert response.status_code == 200
+        positions = {item['patient_id']: item for item in response.get_json()['positions']}
+        assert positions[102]['position'] == 2
+        assert positions[102]['entry']['queue_number'] == 8
+        assert positions[555]['position'] is None
+
+
+class TestQueueStatusApi:
+    """Unit tests for conditional polling of the queue status endpoint."""
+    
+    def test_patient_status_not_modified(self, authenticated_patient, patient_user, doctor_user):
+        """Test a queued patient's repeat poll is a 304 until their doctor's queue changes."""
+        QueueService().enqueue(patient_id=patient_user.id, doctor_id=doctor_user.id)
+        first = authenticated_patient.get('/api/queue/status')
+        assert first.get_json()['position']['position'] == 1
+        etag = first.headers['ETag']
+        
+        assert authenticated_patient.get('/api/queue/status', headers={'If-None-Match': etag}).status_code == 304
+        
+        QueueService().enqueue(patient_id=999, doctor_id=doctor_user.id, priority=5)
+        changed = authenticated_patient.get('/api/queue/status', headers={'If-None-Match': etag})
+        assert changed.status_code == 200
+        assert changed.get_json()['position']['position'] == 2
+        
+        QueueService().remove_from_queue(patient_user.id)
+        left = authenticated_patient.get('/api/queue/status', headers={'If-None-Match': changed.headers['ETag']})
+        assert left.status_code == 200
+        assert left.get_json()['position'] is None
+        assert 'ETag' not in left.headers
+    
+    def test_doctor_status_not_modified(self, authenticated_doctor, doctor_user):
+        """Test a doctor's repeat poll is a 304 while their queue is unchanged."""
+        QueueService().enqueue(patient_id=101, doctor_id=doctor_user.id)
+        first = authenticated_doctor.get('/api/queue/status?limit=5')
+        assert first.get_json()['queue_length'] == 1
+        
+        repeat = authenticated_doctor.get('/api/queue/status?limit=5', headers={'If-None-Match': first.headers['ETag']})
+        assert repeat.status_code == 304
+        
+        QueueService().enqueue(patient_id=102, doctor_id=doctor_user.id)
+        assert authenticated_doctor.get(
+            '/api/queue/status?limit=5', headers={'If-None-Match': first.headers['ETag']}
+        ).get_json()['queue_length'] == 2
+
+
+class TestQueueMetricsApi:
+    """Unit tests for the queue metrics endpoint."""
+    
+    def test_metrics_admin_only(self, authenticated_patient):
+        """Test non-admins are refused."""
+        assert authenticated_patient.get('/api/queue/metrics').status_code == 403
+    
+    def test_metrics(self, authenticated_admin):
+        """Test admins see broadcast coalescing and queue cache counters."""
+        data = authenticated_admin.get('/api/queue/metrics').get_json()
+        assert {'events_in', 'events_out', 'window_ms', 'max_delay_ms', 'coalesced_ratio'} <= set(data['broadcasts'])
+        assert set(data['queue_cache']) == {'hits', 'misses'}
+        assert data['failover'] is None
+        assert data['redis_pool'] is None
+
+
+class TestQueueTicketStatusApi:
+    """Unit tests for a queue ticket's live status."""
+    
+    def test_estimated_wait_uses_learned_consult_time(self, authenticated_patient, patient_user, doctor_user):
+        """Test the wait follows how long the doctor's consults really take."""
+        from datetime import datetime, timedelta
+        from models import db, QueueEntry
+        called = datetime.utcnow() - timedelta(days=1)
+        db.session.add(QueueEntry(patient_id=500, doctor_id=doctor_user.id, status='completed',
+                                  called_at=called, completed_at=called + timedelta(minutes=40)))
+        ticket = QueueEntry(patient_id=patient_user.id, doctor_id=doctor_user.id, status='waiting')
+        db.session.add(ticket)
+        db.session.commit()
+        QueueService().enqueue(patient_id=501, doctor_id=doctor_user.id)
+        QueueService().enqueue(patient_id=patient_user.id, doctor_id=doctor_user.id)
+        
+        data = authenticated_patient.get(f'/api/queue/status/{ticket.id}').get_json()
+        assert (data['position'], data['estimated_wait']) == (2, 40)
@@ -0,0 +1,120 @@
+"""
+Unit Tests for AsyncQueueService
+Runs the asyncio service against an in-process fake Redis and checks it
+shares its key layout with the blocking service.
+"""
+import asyncio
+import pytest
+from services import AsyncQueueService, QueueService
+from services.queue_backends import RedisQueueBackend
+
+fakeredis = pytest.importorskip('fakeredis')
+
+
+@pytest.fixture
+def fake_server():
+    return fakeredis.FakeServer()
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def async_service(server):
+    return AsyncQueueService(client=fakeredis.aioredis.FakeRedis(server=server, decode_responses=True))
+
+
+class TestAsyncQueueService:
+    """Unit tests for AsyncQueueService."""
+    
+    def test_queue_operations(self, fake_server):
+        """Test enqueue, positions, paging, dequeue and remove behave like QueueService."""
+        async def scenario():
+            service = async_service(fake_server)
+            for patient_id in (1, 2, 3):
+                assert await service.enqueue(patient_id, 10, queue_number=patient_id) is True
+            await service.enqueue(4, 10, priority=2)
+            
+            assert [entry['patient_id'] for entry in await service.get_queue(10)] == [4, 1, 2, 3]
+            assert [entry['position'] for entry in await service.get_queue(10, offset=1, limit=2)] == [2, 3]
+            position = await service.get_position(2)
+            assert (position['position'], position['total'], position['doctor_id']) == (3, 4, 10)
+            assert (await service.dequeue(10))['patient_id'] == 4
+            assert await service.remove_from_queue(1) is True
+            assert await service.remove_from_queue(1) is False
+            assert await service.get_queue_length(10) == 2
+            assert await service.queued_patients() == {2: 10, 3: 10}
+            await service.aclose()
+        
+        run(scenario())
+    
+    def test_bulk_reorder_and_clear(self, fake_server):
+        """Test bulk operations, reorder and clearing."""
+        async def scenario():
+            service = async_service(fake_server)
+            service.backend.BATCH_SIZE = 7  # force pipelined batches
+            assert await service.bulk_enqueue({'patient_id': pid, 'doctor_id': 10 + pid % 2} for pid in range(40)) == 40
+            assert await service.bulk_remove(range(0, 40, 4)) == 10
+            
+            queue = await service.get_queue(11, limit=3)
+            assert await service.reorder_queue(11, [queue[2], queue[0]]) is True
+            assert [entry['patient_id'] for entry in await service.get_queue(11)] == [5, 1]
+            
+            positions = await service.get_positions([5, 2, 999])
+            assert positions[5]['position'] == 1
+            assert positions[2]['doctor_id'] == 10
+            assert positions[999] is None
+            
+            assert await service.clear_queue(11) is True
+            await service.clear_all()
+            assert await service.get_queue_length(10) == 0
+            await service.aclose()
+        
+        run(scenario())
+    
+    def test_shares_layout_with_blocking_service(self, fake_server):
+        """Test entries written by one service are read back identically by the other."""
+        blocking = RedisQueueBackend(fakeredis.FakeRedis(server=fake_server, decode_responses=True))
+        blocking.enqueue(1, 10, queue_number=5)
+        
+        async def scenario():
+            service = async_service(fake_server)
+            await service.enqueue(2, 10)
+            queue = await service.get_queue(10)
+            await service.aclose()
+            return queue
+        
+        assert run(scenario()) == blocking.get_queue(10)
+        assert blocking.get_position(2)['position'] == 2
+    
+    def test_lengths_and_etags_match_blocking_service(self, fake_server, monkeypatch):
+        """Test batch lengths and queue ETags agree with QueueService on the same Redis."""
+        blocking = QueueService()
+        monkeypatch.setattr(blocking, 'backend', RedisQueueBackend(fakeredis.FakeRedis(server=fake_server, decode_responses=True)))
+        blocking.bulk_enqueue([{'patient_id': pid, 'doctor_id': 10 + pid % 2} for pid in range(5)])
+        
+        async def scenario():
+            service = async_service(fake_server)
+            lengths = await service.get_queue_lengths([10, 11, 12])
+            etag = await service.queue_etag(10, 'page', 1)
+            await service.enqueue(9, 10)
+            changed = await service.queue_etag(10, 'page', 1)
+            await service.aclose()
+            return lengths, etag, changed
+        
+        lengths, etag, changed = run(scenario())
+        assert lengths == {10: 3, 11: 2, 12: 0}
+        assert AsyncQueueService.etag_doctor(etag) == 10
+        assert changed != etag
+        assert changed == blocking.queue_etag(10, 'page', 1)
+    
+    def test_settings_come_from_config(self, monkeypatch):
+        """Test the Redis URL and pool size are taken from the config QueueService was given."""
+        monkeypatch.setattr(QueueService, 'config', dict(
+            QueueService.config, REDIS_URL='redis://queue-redis:6390/3', ASYNC_REDIS_MAX_CONNECTIONS=7
+        ))
+        service = AsyncQueueService()
+        pool = service.redis_client.connection_pool
+        
+        assert (pool.connection_kwargs['host'], pool.connection_kwargs['port'], pool.connection_kwargs['db']) == ('queue-redis', 6390, 3)
+        assert pool.max_connections == 7
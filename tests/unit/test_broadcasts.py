@@ -0,0 +1,79 @@
+"""
+Unit Tests for BroadcastCoalescer
+Checks that bursts of broadcasts to a room are merged within the latency bounds.
+"""
+import threading
+import time
+import pytest
+from services.broadcasts import BroadcastCoalescer
+
+
+class RecordingSocketIO:
+    """Stands in for SocketIO: records emits and runs background tasks on threads."""
+    
+    def __init__(self):
+        self.sent = []
+    
+    def emit(self, event, data, room=None):
+        self.sent.append((event, data, room, time.monotonic()))
+    
+    def start_background_task(self, target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        return thread
+    
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class TestBroadcastCoalescer:
+    """Unit tests for per-room broadcast coalescing."""
+    
+    def test_burst_sends_latest(self):
+        """Test a burst to one room goes out once, carrying the latest payload."""
+        socketio = RecordingSocketIO()
+        coalescer = BroadcastCoalescer(socketio, window=0.05, max_delay=0.2)
+        for n in range(5):
+            coalescer.emit('board', {'n': n}, 'room_a')
+        coalescer.emit('board', {'n': 'b'}, 'room_b')
+        time.sleep(0.3)
+        
+        assert sorted((room, data['n']) for event, data, room, sent_at in socketio.sent) == [('room_a', 4), ('room_b', 'b')]
+        metrics = coalescer.metrics()
+        assert (metrics['events_in'], metrics['events_out'], metrics['largest_batch']) == (6, 2, 5)
+        assert metrics['coalesced_ratio'] == pytest.approx(2 / 6, abs=0.001)
+    
+    def test_registered_merge(self):
+        """Test a registered merge function sees every payload of the burst."""
+        socketio = RecordingSocketIO()
+        coalescer = BroadcastCoalescer(socketio, window=10)
+        coalescer.register('tick', lambda payloads: sum(payloads))
+        for n in (1, 2, 3):
+            coalescer.emit('tick', n, 'room')
+        coalescer.flush()
+        
+        assert [data for event, data, room, sent_at in socketio.sent] == [6]
+    
+    def test_max_delay_bounds_latency(self):
+        """Test a steady stream is still sent once max_delay has passed since its first event."""
+        socketio = RecordingSocketIO()
+        coalescer = BroadcastCoalescer(socketio, window=0.1, max_delay=0.2)
+        started = time.monotonic()
+        while time.monotonic() - started < 0.5:
+            coalescer.emit('board', {}, 'room')
+            time.sleep(0.02)
+        coalescer.flush()
+        
+        first_sent = socketio.sent[0][3] - started
+        assert 0.15 < first_sent < 0.35
+        assert len(socketio.sent) >= 2
+    
+    def test_zero_window_sends_immediately(self):
+        """Test window=0 turns coalescing off."""
+        socketio = RecordingSocketIO()
+        coalescer = BroadcastCoalescer(socketio, window=0)
+        coalescer.emit('board', 1, 'room')
+        coalescer.emit('board', 2, 'room')
+        
+        assert [data for event, data, room, sent_at in socketio.sent] == [1, 2]
+        assert coalescer.metrics()['pending_rooms'] == 0
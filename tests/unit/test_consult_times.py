@@ -0,0 +1,84 @@
+"""
+Unit Tests for ConsultTimeEstimator
+Checks the learned per-doctor, per-time-of-day consultation lengths.
+"""
+import pytest
+from datetime import datetime, timedelta
+from models import db, QueueEntry
+from services import ConsultTimeEstimator, QueueService
+
+
+@pytest.fixture(params=['memory', 'redis'])
+def estimator(request, test_app):
+    """An estimator keeping its averages in this process or in (fake) Redis."""
+    if request.param == 'memory':
+        return ConsultTimeEstimator()
+    fakeredis = pytest.importorskip('fakeredis')
+    return ConsultTimeEstimator(fakeredis.FakeRedis(decode_responses=True))
+
+
+def complete(doctor, called_at, minutes):
+    entry = QueueEntry(patient_id=900, doctor_id=doctor.id, status='completed',
+                       called_at=called_at, completed_at=called_at + timedelta(minutes=minutes))
+    db.session.add(entry)
+    db.session.commit()
+    return entry
+
+
+class TestConsultTimeEstimator:
+    """Unit tests for the consultation-time estimator."""
+    
+    morning = datetime(2024, 5, 6, 9, 0)
+    afternoon = datetime(2024, 5, 6, 15, 0)
+    
+    def test_configured_time_before_any_consult(self, estimator, doctor_user):
+        """Test a doctor with no history is estimated at their configured time."""
+        assert estimator.minutes_per_patient(doctor_user) == 15
+        assert estimator.estimated_wait(doctor_user.id, 3) == 30
+    
+    def test_seeded_from_history_as_moving_average(self, estimator, doctor_user):
+        """Test past consults are replayed oldest first into the moving average."""
+        complete(doctor_user, self.morning, 10)
+        complete(doctor_user, self.morning + timedelta(minutes=30), 20)
+        
+        # 0.2 * 20 + 0.8 * 10
+        assert estimator.minutes_per_patient(doctor_user, self.morning) == pytest.approx(12)
+    
+    def test_record_updates_incrementally(self, estimator, doctor_user):
+        """Test each completed consult moves the average once, including the one that seeded it."""
+        entry = complete(doctor_user, self.morning, 10)
+        assert estimator.record(doctor_user.id, entry.called_at, entry.completed_at) == 10
+        assert estimator.minutes_per_patient(doctor_user, self.morning) == pytest.approx(10)
+        
+        entry = complete(doctor_user, self.morning + timedelta(minutes=20), 30)
+        estimator.record(doctor_user.id, entry.called_at, entry.completed_at)
+        assert estimator.minutes_per_patient(doctor_user, self.morning) == pytest.approx(14)
+    
+    def test_time_of_day_buckets(self, estimator, doctor_user):
+        """Test a bucket with enough consults is used over the all-day average."""
+        for n in range(3):
+            complete(doctor_user, self.morning + timedelta(minutes=10 * n), 8)
+            complete(doctor_user, self.afternoon + timedelta(minutes=30 * n), 25)
+        
+        assert estimator.minutes_per_patient(doctor_user, self.morning) == pytest.approx(8)
+        assert estimator.minutes_per_patient(doctor_user, self.afternoon) == pytest.approx(25)
+        # Evening has no consults yet, so the doctor's all-day average stands in
+        evening = estimator.minutes_per_patient(doctor_user, self.morning.replace(hour=20))
+        assert 8 < evening < 25
+    
+    def test_implausible_durations_ignored(self, estimator, doctor_user):
+        """Test consults left open for hours or closed at once teach nothing."""
+        complete(doctor_user, self.morning, 600)
+        complete(doctor_user, self.afternoon, 0)
+        assert estimator.minutes_per_patient(doctor_user) == 15
+    
+    def test_shared_through_redis(self, test_app, doctor_user):
+        """Test two workers on one Redis see each other's consults."""
+        fakeredis = pytest.importorskip('fakeredis')
+        client = fakeredis.FakeRedis(decode_responses=True)
+        first, second = ConsultTimeEstimator(client), ConsultTimeEstimator(client)
+        assert second.minutes_per_patient(doctor_user, self.morning) == 15
+        
+        entry = complete(doctor_user, self.morning, 40)
+        first.record(doctor_user.id, entry.called_at, entry.completed_at)
+        assert second.minutes_per_patient(doctor_user, self.morning) == pytest.approx(40)
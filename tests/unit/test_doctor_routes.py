@@ -42,3 +42,79 @@ class TestDoctorAvailability:
         }, follow_redirects=True)
         assert response.status_code == 200
 
+
+
+class TestDoctorQueueData:
+    """Unit tests for the paged queue-data endpoint."""
+    
+    def _queue_patients(self, doctor, count):
+        from models import db, User
+        from services import QueueService
+        for i in range(count):
+            patient = User(email=f'queued{i}@test.com', full_name=f'Queued {i}', role='patient')
+            patient.set_password('pass123')
+            db.session.add(patient)
+            db.session.commit()
+            QueueService().enqueue(patient.id, doctor.id)
+    
+    def test_queue_data_full(self, authenticated_doctor, doctor_user):
+        """Test queue-data without paging returns the whole queue and total."""
+        self._queue_patients(doctor_user, 3)
+        data = authenticated_doctor.get('/doctor/queue-data').get_json()
+        assert data['total'] == 3
+        assert [item['position'] for item in data['queue']] == [1, 2, 3]
+    
+    def test_queue_data_page(self, authenticated_doctor, doctor_user):
+        """Test queue-data honours offset and limit."""
+        self._queue_patients(doctor_user, 5)
+        data = authenticated_doctor.get('/doctor/queue-data?offset=1&limit=2').get_json()
+        assert data['total'] == 5
+        assert data['offset'] == 1
+        assert data['limit'] == 2
+        assert [item['position'] for item in data['queue']] == [2, 3]
+        assert data['queue'][0]['patient_name'] == 'Queued 1'
+    
+    def test_queue_data_not_modified(self, authenticated_doctor, doctor_user):
+        """Test an unchanged queue answers a repeat poll with an empty 304."""
+        self._queue_patients(doctor_user, 2)
+        first = authenticated_doctor.get('/doctor/queue-data?limit=10')
+        etag = first.headers['ETag']
+        
+        repeat = authenticated_doctor.get('/doctor/queue-data?limit=10', headers={'If-None-Match': etag})
+        assert repeat.status_code == 304
+        assert repeat.data == b''
+        assert repeat.headers['ETag'] == etag
+        
+        # Another page of the same queue is a different view
+        assert authenticated_doctor.get('/doctor/queue-data?limit=1', headers={'If-None-Match': etag}).status_code == 200
+        
+        from services import QueueService
+        QueueService().dequeue(doctor_user.id)
+        changed = authenticated_doctor.get('/doctor/queue-data?limit=10', headers={'If-None-Match': etag})
+        assert changed.status_code == 200
+        assert changed.get_json()['total'] == 1
+        assert changed.headers['ETag'] != etag
+
+
+class TestConsultation:
+    """Unit tests for completing a consultation."""
+    
+    def test_called_patient_completed_and_learned(self, authenticated_doctor, doctor_user, patient_user):
+        """Test finishing a called patient completes their in_consultation entry and teaches the estimator."""
+        from datetime import datetime, timedelta
+        from models import db, QueueEntry
+        from services import QueueService, consult_time_estimator
+        entry = QueueEntry(patient_id=patient_user.id, doctor_id=doctor_user.id, status='waiting', queue_number=1)
+        db.session.add(entry)
+        db.session.commit()
+        QueueService().enqueue(patient_user.id, doctor_user.id, queue_number=1)
+        authenticated_doctor.get('/doctor/call-next')
+        # Pretend the consult started 25 minutes ago
+        entry.called_at = datetime.utcnow() - timedelta(minutes=25)
+        db.session.commit()
+        
+        authenticated_doctor.post(f'/doctor/consult/{patient_user.id}', data={'symptoms': 'Cough', 'diagnosis': 'Cold'})
+        
+        db.session.refresh(entry)
+        assert entry.status == 'completed'
+        assert consult_time_estimator().minutes_per_patient(doctor_user) == pytest.approx(25, abs=0.5)
@@ -0,0 +1,209 @@
+"""
+Unit Tests for FailoverQueueBackend
+Checks queues keep working while Redis is down and changes reach it once it is back.
+"""
+import pytest
+import redis
+from datetime import datetime, timedelta
+from models import db, QueueEntry
+from services import QueueNumberCounter
+from services.queue_backends import FailoverQueueBackend, MemoryQueueBackend, RedisQueueBackend
+from services.queue_rebuild import seed_queues
+
+fakeredis = pytest.importorskip('fakeredis')
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def failover(server, clock):
+    """A failover backend over a fake Redis that tests can take down."""
+    primary = RedisQueueBackend(fakeredis.FakeRedis(server=server, decode_responses=True))
+    return FailoverQueueBackend(primary, MemoryQueueBackend(), retry_after=5, clock=clock)
+
+
+def _order(backend, doctor_id):
+    return [entry['patient_id'] for entry in backend.get_queue(doctor_id)]
+
+
+class TestFailoverQueueBackend:
+    """Unit tests for the Redis circuit breaker and replay."""
+    
+    def test_healthy_calls_go_to_redis(self, failover):
+        """Test nothing is kept in memory while Redis answers."""
+        failover.enqueue(patient_id=1, doctor_id=10)
+        
+        assert _order(failover.primary, 10) == [1]
+        assert failover.fallback.queued_patients() == {}
+        assert failover.get_version(10) == failover.primary.get_version(10)
+        assert failover.metrics()['state'] == 'healthy'
+    
+    def test_outage_served_from_memory_then_replayed(self, failover, server, clock):
+        """Test joins during an outage are answered from memory and land in Redis on failback."""
+        failover.enqueue(patient_id=1, doctor_id=10)
+        server.connected = False
+        
+        assert failover.enqueue(patient_id=2, doctor_id=10) is True
+        assert failover.get_position(2)['position'] == 1
+        assert failover.get_version(10) is None
+        assert failover.metrics()['state'] == 'degraded'
+        assert failover.metrics()['buffered'] == 1
+        
+        server.connected = True
+        clock.now = 6
+        assert failover.get_queue_length(10) == 2
+        
+        assert _order(failover.primary, 10) == [1, 2]
+        metrics = failover.metrics()
+        assert (metrics['state'], metrics['failovers'], metrics['failbacks']) == ('healthy', 1, 1)
+        assert (metrics['replayed'], metrics['buffered'], metrics['degraded_seconds']) == (1, 0, 6)
+        assert failover.fallback.queued_patients() == {}
+    
+    def test_dequeue_replayed_as_removal(self, failover, server, clock):
+        """Test a patient called during the outage leaves Redis, not whoever heads its queue."""
+        failover.bulk_enqueue([{'patient_id': 1, 'doctor_id': 10}, {'patient_id': 2, 'doctor_id': 10}])
+        failover.seed = lambda fallback: fallback.bulk_enqueue([{'patient_id': 2, 'doctor_id': 10}]) or True
+        server.connected = False
+        
+        assert failover.dequeue(10)['patient_id'] == 2
+        
+        server.connected = True
+        clock.now = 6
+        assert _order(failover, 10) == [1]
+    
+    def test_replay_keeps_join_order(self, failover, server, clock):
+        """Test patients who joined during the outage queue behind those who joined before."""
+        failover.enqueue(patient_id=1, doctor_id=10)
+        server.connected = False
+        failover.enqueue(patient_id=2, doctor_id=10)
+        failover.enqueue(patient_id=3, doctor_id=10)
+        failover.remove_from_queue(2)
+        
+        server.connected = True
+        clock.now = 6
+        assert _order(failover, 10) == [1, 3]
+    
+    def test_probe_waits_for_retry_interval(self, failover, server, clock):
+        """Test Redis is only pinged again once retry_after has passed, and failed probes are counted."""
+        server.connected = False
+        failover.enqueue(patient_id=1, doctor_id=10)
+        server.connected = True
+        
+        clock.now = 4
+        failover.get_queue_length(10)
+        assert failover.degraded
+        
+        server.connected = False
+        clock.now = 6
+        failover.get_queue_length(10)
+        assert failover.degraded
+        assert failover.metrics()['failed_probes'] == 1
+        
+        server.connected = True
+        clock.now = 12
+        failover.get_queue_length(10)
+        assert not failover.degraded
+        assert _order(failover.primary, 10) == [1]
+    
+    def test_starts_degraded_when_unavailable(self, server, clock):
+        """Test a backend built while Redis is down serves from memory and switches over later."""
+        server.connected = False
+        primary = RedisQueueBackend(fakeredis.FakeRedis(server=server, decode_responses=True))
+        failover = FailoverQueueBackend(primary, retry_after=5, available=False, clock=clock)
+        failover.enqueue(patient_id=1, doctor_id=10)
+        
+        server.connected = True
+        clock.now = 5
+        assert failover.get_position(1)['position'] == 1
+        assert not failover.degraded
+        assert _order(primary, 10) == [1]
+    
+    def test_buffer_limit(self, failover, server, capsys):
+        """Test changes beyond max_buffered are dropped, counted and warned about once."""
+        failover.max_buffered = 2
+        server.connected = False
+        for patient_id in range(1, 5):
+            failover.enqueue(patient_id=patient_id, doctor_id=10)
+        
+        metrics = failover.metrics()
+        assert (metrics['buffered'], metrics['dropped']) == (2, 2)
+        assert failover.get_queue_length(10) == 4
+        assert capsys.readouterr().out.count('Failover buffer is full') == 1
+    
+    def test_failure_threshold(self, server, clock):
+        """Test failures below the threshold are raised and do not open the circuit."""
+        primary = RedisQueueBackend(fakeredis.FakeRedis(server=server, decode_responses=True))
+        failover = FailoverQueueBackend(primary, failure_threshold=2, clock=clock)
+        server.connected = False
+        
+        with pytest.raises(redis.exceptions.ConnectionError):
+            failover.get_queue_length(10)
+        assert not failover.degraded
+        assert failover.get_queue_length(10) == 0
+        assert failover.degraded
+
+
+class TestDegradedServices:
+    """Unit tests for the services sharing Redis while it is down."""
+    
+    def test_seed_from_waiting_rows(self, test_app, doctor_user):
+        """Test the stand-in queues start with every patient who has a waiting row."""
+        joined_at = datetime.utcnow() - timedelta(minutes=5)
+        db.session.add_all([
+            QueueEntry(patient_id=101, doctor_id=doctor_user.id, status='waiting', joined_at=joined_at),
+            QueueEntry(patient_id=102, doctor_id=doctor_user.id, status='waiting'),
+            QueueEntry(patient_id=103, doctor_id=doctor_user.id, status='completed')
+        ])
+        db.session.commit()
+        backend = MemoryQueueBackend()
+        
+        assert seed_queues(backend) is True
+        assert _order(backend, doctor_user.id) == [101, 102]
+    
+    def test_queue_numbers_fall_back_to_database(self, test_app, doctor_user, server):
+        """Test ticket numbers carry on from the entries when Redis stops answering."""
+        counter = QueueNumberCounter(fakeredis.FakeRedis(server=server, decode_responses=True))
+        assert counter.next_number(doctor_user.id) == 1
+        db.session.add(QueueEntry(patient_id=101, doctor_id=doctor_user.id, queue_number=1))
+        db.session.commit()
+        server.connected = False
+        
+        assert counter.next_number(doctor_user.id) == 2
+        assert counter.next_number(doctor_user.id) == 3
+    
+    def test_queue_numbers_resume_after_outage(self, test_app, doctor_user, server):
+        """Test Redis carries on above the numbers the database issued during a mid-day outage."""
+        counter = QueueNumberCounter(fakeredis.FakeRedis(server=server, decode_responses=True))
+        issued = []
+        
+        def join():
+            issued.append(counter.next_number(doctor_user.id))
+            db.session.add(QueueEntry(patient_id=100 + len(issued), doctor_id=doctor_user.id, queue_number=issued[-1]))
+            db.session.commit()
+        
+        join()
+        join()
+        server.connected = False
+        join()
+        join()
+        server.connected = True
+        join()
+        join()
+        
+        assert issued == [1, 2, 3, 4, 5, 6]
@@ -0,0 +1,61 @@
+"""
+Unit Tests for Socket.IO fan-out through a message queue
+Runs two Socket.IO servers on the local stand-in as if they were two workers.
+"""
+import time
+import socketio
+from extensions import LocalPubSubManager, message_queue_options
+
+
+def worker(channel):
+    """A Socket.IO server on `channel` that records the events it sends to its clients."""
+    server = socketio.Server(async_mode='threading', client_manager=LocalPubSubManager(channel=channel))
+    listening = len(LocalPubSubManager._subscribers[channel])
+    server.manager.initialize()
+    wait_for(lambda: len(LocalPubSubManager._subscribers[channel]) > listening)
+    server.sent = []
+    server._send_eio_packet = lambda eio_sid, eio_pkt: server.sent.append(
+        (eio_sid, socketio.packet.Packet(encoded_packet=eio_pkt.data).data)
+    )
+    return server
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestMessageQueue:
+    """Unit tests for emitting across workers."""
+    
+    def test_emit_reaches_room_on_other_worker(self):
+        """Test an emit on one worker reaches the room's clients connected to another."""
+        first, second = worker('test-fanout'), worker('test-fanout')
+        sid = second.manager.connect('eio-doctor', '/')
+        second.manager.enter_room(sid, '/', 'doctor_7')
+        second.manager.connect('eio-other', '/')
+        
+        first.emit('queue:update', {'doctor_id': 7, 'op': 'removed', 'version': 3}, room='doctor_7')
+        
+        assert wait_for(lambda: second.sent)
+        assert second.sent == [('eio-doctor', ['queue:update', {'doctor_id': 7, 'op': 'removed', 'version': 3}])]
+        assert first.sent == []
+    
+    def test_channels_are_separate(self):
+        """Test workers on another channel (another deployment) hear nothing."""
+        first, other = worker('test-fanout-a'), worker('test-fanout-b')
+        sid = other.manager.connect('eio-1', '/')
+        other.manager.enter_room(sid, '/', 'doctor_7')
+        
+        first.emit('queue:update', {}, room='doctor_7')
+        assert not wait_for(lambda: other.sent, timeout=0.2)
+    
+    def test_message_queue_options(self):
+        """Test the init_app options chosen for each kind of URL."""
+        assert message_queue_options(None) == {}
+        assert message_queue_options('redis://redis:6379/0', 'mq') == {'message_queue': 'redis://redis:6379/0', 'channel': 'mq'}
+        manager = message_queue_options('local://workers')['client_manager']
+        assert isinstance(manager, LocalPubSubManager)
+        assert manager.channel == 'workers'
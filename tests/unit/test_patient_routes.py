@@ -3,8 +3,9 @@ Unit Tests for Patient Routes
 Tests individual patient route handlers.
 """
 import pytest
-from models import db, User, Appointment, Department, DoctorAvailability
+from models import db, User, Appointment, Department, DoctorAvailability, QueueEntry
 from datetime import datetime, timedelta
+from services import QueueService
 
 
 class TestPatientDashboard:
@@ -89,3 +90,73 @@ class TestBookAppointment:
         assert response.status_code == 200
         assert b'Invalid doctor selected' in response.data
 
+
+
+class TestDatabaseQueueFlow:
+    """Unit tests for the queue routes on the database backend."""
+    
+    def test_join_writes_one_entry(self, database_queue_service, authenticated_patient, patient_user, doctor_user):
+        """Test joining creates exactly one waiting entry with its ticket number."""
+        authenticated_patient.get(f'/patient/join-queue/{doctor_user.id}', follow_redirects=True)
+        
+        entries = QueueEntry.query.filter_by(patient_id=patient_user.id).all()
+        assert len(entries) == 1
+        assert (entries[0].status, entries[0].queue_number) == ('waiting', 1)
+        assert database_queue_service.get_position(patient_user.id)['position'] == 1
+    
+    def test_dequeue_and_leave_update_entries(self, database_queue_service, authenticated_patient, patient_user, doctor_user):
+        """Test call-next and leaving change the entry status without extra rows."""
+        authenticated_patient.get(f'/patient/join-queue/{doctor_user.id}', follow_redirects=True)
+        called = database_queue_service.dequeue(doctor_user.id)
+        assert called['patient_id'] == patient_user.id
+        assert QueueEntry.query.get(called['id']).status == 'in_consultation'
+        
+        authenticated_patient.get(f'/patient/join-queue/{doctor_user.id}', follow_redirects=True)
+        authenticated_patient.get('/patient/leave-queue', follow_redirects=True)
+        statuses = sorted(entry.status for entry in QueueEntry.query.filter_by(patient_id=patient_user.id))
+        assert statuses == ['cancelled', 'in_consultation']
+        assert database_queue_service.get_position(patient_user.id) is None
+
+
+class TestJoinFastestQueue:
+    """Unit tests for joining the department queue with the shortest predicted wait."""
+    
+    def _doctor(self, department, email, minutes):
+        doctor = User(email=email, full_name=email, role='doctor', department_id=department.id,
+                      avg_consultation_time=minutes, is_active=True)
+        doctor.set_password('doctor123')
+        db.session.add(doctor)
+        db.session.commit()
+        return doctor
+    
+    def test_joins_lowest_predicted_wait(self, authenticated_patient, patient_user, department):
+        """Test the patient joins the doctor they would see soonest, not the shortest queue."""
+        quick = self._doctor(department, 'quick@test.com', 5)
+        slow = self._doctor(department, 'slow@test.com', 30)
+        QueueService().bulk_enqueue([{'patient_id': pid, 'doctor_id': quick.id} for pid in (500, 501, 502)])
+        QueueService().enqueue(503, slow.id)
+        
+        authenticated_patient.get(f'/patient/join-fastest-queue/{department.id}')
+        position = QueueService().get_position(patient_user.id)
+        assert (position['doctor_id'], position['position']) == (quick.id, 4)
+    
+    def test_observed_consults_change_the_pick(self, authenticated_patient, patient_user, department):
+        """Test a doctor whose consults really run long stops looking fast."""
+        quick = self._doctor(department, 'quick@test.com', 5)
+        slow = self._doctor(department, 'slow@test.com', 30)
+        called = datetime.utcnow() - timedelta(hours=2)
+        for _ in range(3):
+            db.session.add(QueueEntry(patient_id=600, doctor_id=quick.id, status='completed',
+                                      called_at=called, completed_at=called + timedelta(minutes=40)))
+        db.session.commit()
+        QueueService().bulk_enqueue([{'patient_id': pid, 'doctor_id': quick.id} for pid in (500, 501, 502)])
+        QueueService().enqueue(503, slow.id)
+        
+        authenticated_patient.get(f'/patient/join-fastest-queue/{department.id}')
+        assert QueueService().get_position(patient_user.id)['doctor_id'] == slow.id
+    
+    def test_empty_department(self, authenticated_patient, patient_user, department):
+        """Test a department without doctors sends the patient back with a message."""
+        response = authenticated_patient.get(f'/patient/join-fastest-queue/{department.id}', follow_redirects=True)
+        assert b'No doctors are available' in response.data
+        assert QueueService().get_position(patient_user.id) is None
@@ -0,0 +1,262 @@
+"""
+Conformance Tests for QueueBackend implementations
+Every backend runs the same suite so their behaviour cannot drift apart.
+"""
+import pytest
+from sqlalchemy import event
+from models import db
+from services.queue_backends import DatabaseQueueBackend
+from datetime import datetime, timedelta
+
+
+class TestQueueBackendConformance:
+    """Shared behaviour required of every QueueBackend."""
+    
+    def _ids(self, entries):
+        return [entry['patient_id'] for entry in entries]
+    
+    def test_fifo_order(self, queue_backend):
+        """Test regular joiners are served in join order."""
+        for patient_id in (1, 2, 3):
+            queue_backend.enqueue(patient_id, 10)
+        
+        assert self._ids(queue_backend.get_queue(10)) == [1, 2, 3]
+        assert [entry['position'] for entry in queue_backend.get_queue(10)] == [1, 2, 3]
+        assert queue_backend.dequeue(10)['patient_id'] == 1
+        assert queue_backend.dequeue(10)['patient_id'] == 2
+    
+    def test_priority_order(self, queue_backend):
+        """Test priority joiners go first, highest priority first."""
+        queue_backend.enqueue(1, 10)
+        queue_backend.enqueue(2, 10, priority=1)
+        queue_backend.enqueue(3, 10, priority=5)
+        queue_backend.enqueue(4, 10)
+        
+        assert self._ids(queue_backend.get_queue(10)) == [3, 2, 1, 4]
+    
+    def test_equal_priority_served_in_join_order(self, queue_backend):
+        """Test priority joiners with the same priority are served first come, first served."""
+        for patient_id in (9, 10, 100, 2):
+            queue_backend.enqueue(patient_id, 10, priority=1)
+        queue_backend.enqueue(5, 10, priority=2)
+        
+        assert self._ids(queue_backend.get_queue(10)) == [5, 9, 10, 100, 2]
+    
+    def test_bulk_enqueue_keeps_batch_order(self, queue_backend):
+        """Test a batch joined at once is served in the order it was given."""
+        queue_backend.bulk_enqueue([{'patient_id': pid, 'doctor_id': 10} for pid in (9, 10, 100, 2)])
+        
+        assert self._ids(queue_backend.get_queue(10)) == [9, 10, 100, 2]
+    
+    def test_entry_payload(self, queue_backend):
+        """Test stored payload fields round-trip."""
+        queue_backend.enqueue(1, 10, priority=0, appointment_id=7, queue_number=3)
+        
+        entry = queue_backend.get_position(1)['entry']
+        assert entry['patient_id'] == 1
+        assert entry['doctor_id'] == 10
+        assert entry['appointment_id'] == 7
+        assert entry['queue_number'] == 3
+        assert 'joined_at' in entry
+    
+    def test_get_position(self, queue_backend):
+        """Test position, total and doctor for a queued patient."""
+        for patient_id in (1, 2, 3):
+            queue_backend.enqueue(patient_id, 10)
+        
+        position = queue_backend.get_position(2)
+        assert (position['position'], position['total'], position['doctor_id']) == (2, 3, 10)
+        assert queue_backend.get_position(99) is None
+    
+    def test_get_positions(self, queue_backend):
+        """Test batch positions agree with single lookups."""
+        queue_backend.enqueue(1, 10)
+        queue_backend.enqueue(2, 20)
+        
+        positions = queue_backend.get_positions([1, 2, 99, 1])
+        assert set(positions) == {1, 2, 99}
+        assert positions[1] == queue_backend.get_position(1)
+        assert positions[2]['doctor_id'] == 20
+        assert positions[99] is None
+    
+    def test_paging(self, queue_backend):
+        """Test ranged reads with absolute positions."""
+        for patient_id in range(1, 8):
+            queue_backend.enqueue(patient_id, 10)
+        
+        page = queue_backend.get_queue(10, offset=2, limit=3)
+        assert self._ids(page) == [3, 4, 5]
+        assert [entry['position'] for entry in page] == [3, 4, 5]
+        assert self._ids(queue_backend.get_queue(10, offset=5)) == [6, 7]
+        assert queue_backend.get_queue(10, offset=10, limit=2) == []
+        assert queue_backend.get_queue(10, limit=0) == []
+    
+    def test_remove(self, queue_backend):
+        """Test removal returns whether the patient was queued."""
+        queue_backend.enqueue(1, 10)
+        queue_backend.enqueue(2, 10)
+        
+        assert queue_backend.remove_from_queue(1) is True
+        assert queue_backend.remove_from_queue(1) is False
+        assert queue_backend.get_position(2)['position'] == 1
+        assert queue_backend.get_queue_length(10) == 1
+    
+    def test_enqueue_again_moves_patient(self, queue_backend):
+        """Test a patient joining a second queue leaves the first one."""
+        queue_backend.enqueue(1, 10)
+        queue_backend.enqueue(2, 10)
+        queue_backend.enqueue(1, 20)
+        
+        assert self._ids(queue_backend.get_queue(10)) == [2]
+        assert queue_backend.get_position(1)['doctor_id'] == 20
+        assert queue_backend.get_queue_length(20) == 1
+    
+    def test_bulk_operations(self, queue_backend):
+        """Test bulk enqueue and remove across doctors."""
+        assert queue_backend.bulk_enqueue([
+            {'patient_id': pid, 'doctor_id': 10 + pid % 3} for pid in range(30)
+        ]) == 30
+        assert queue_backend.get_queue_length(10) == 10
+        
+        assert queue_backend.bulk_remove(list(range(0, 30, 2)) + [999]) == 15
+        assert sum(queue_backend.get_queue_length(d) for d in (10, 11, 12)) == 15
+        assert queue_backend.get_position(2) is None
+        assert queue_backend.bulk_enqueue([]) == 0
+        assert queue_backend.bulk_remove([]) == 0
+    
+    def test_reorder(self, queue_backend):
+        """Test reorder keeps the given order, drops omitted patients and sits after priority joiners."""
+        for patient_id in (1, 2, 3):
+            queue_backend.enqueue(patient_id, 10)
+        
+        queue = queue_backend.get_queue(10)
+        assert queue_backend.reorder_queue(10, [queue[2], queue[0]]) is True
+        assert self._ids(queue_backend.get_queue(10)) == [3, 1]
+        assert 'position' not in queue_backend.get_position(3)['entry']
+        assert queue_backend.get_position(2) is None
+        
+        queue_backend.enqueue(4, 10)
+        queue_backend.enqueue(5, 10, priority=2)
+        assert self._ids(queue_backend.get_queue(10)) == [5, 3, 1, 4]
+    
+    def test_clear_queue(self, queue_backend):
+        """Test clearing a queue also clears its patients' positions."""
+        queue_backend.enqueue(1, 10)
+        queue_backend.enqueue(2, 10)
+        queue_backend.enqueue(3, 20)
+        
+        assert queue_backend.clear_queue(10) is True
+        assert queue_backend.clear_queue(10) is False
+        assert queue_backend.get_queue_length(10) == 0
+        assert queue_backend.get_position(1) is None
+        assert queue_backend.get_position(3)['position'] == 1
+    
+    def test_dequeue_empty(self, queue_backend):
+        """Test dequeue on an empty queue."""
+        assert queue_backend.dequeue(10) is None
+        queue_backend.enqueue(1, 10)
+        queue_backend.dequeue(10)
+        assert queue_backend.dequeue(10) is None
+        assert queue_backend.get_position(1) is None
+    
+    def test_clear_all(self, queue_backend):
+        """Test clear_all empties every queue."""
+        queue_backend.enqueue(1, 10)
+        queue_backend.enqueue(2, 20)
+        queue_backend.clear_all()
+        
+        assert queue_backend.get_queue_length(10) == 0
+        assert queue_backend.get_position(2) is None
+    
+    def test_queued_patients(self, queue_backend):
+        """Test every queued patient is listed with their doctor."""
+        queue_backend.enqueue(1, 10)
+        queue_backend.enqueue(2, 20)
+        queue_backend.enqueue(3, 20)
+        queue_backend.dequeue(20)
+        
+        assert queue_backend.queued_patients() == {1: 10, 3: 20}
+    
+    def test_enqueue_with_original_join_time(self, queue_backend):
+        """Test an entry restored with its old join time goes back to its place."""
+        queue_backend.enqueue(1, 10)
+        queue_backend.bulk_enqueue([{
+            'patient_id': 2, 'doctor_id': 10, 'joined_at': datetime.utcnow() - timedelta(minutes=5)
+        }])
+        
+        assert self._ids(queue_backend.get_queue(10)) == [2, 1]
+    
+    def test_version_bumped_by_every_change(self, queue_backend):
+        """Test every kind of change to a queue moves its version on."""
+        if queue_backend.get_version(10) is None:
+            pytest.skip(f"{queue_backend.name} backend keeps no queue versions")
+        seen = [queue_backend.get_version(10)]
+        
+        def changed():
+            version = queue_backend.get_version(10)
+            assert version not in seen
+            seen.append(version)
+        
+        queue_backend.enqueue(1, 10)
+        changed()
+        queue_backend.bulk_enqueue([{'patient_id': 2, 'doctor_id': 10}, {'patient_id': 3, 'doctor_id': 10}])
+        changed()
+        queue_backend.dequeue(10)
+        changed()
+        queue_backend.remove_from_queue(2)
+        changed()
+        queue_backend.enqueue(4, 10)
+        queue = queue_backend.get_queue(10)
+        changed()
+        queue_backend.reorder_queue(10, list(reversed(queue)))
+        changed()
+        queue_backend.enqueue(4, 20)
+        changed()
+        queue_backend.clear_queue(10)
+        changed()
+        queue_backend.clear_all()
+        changed()
+        
+        # Reads and no-op removals leave it alone
+        queue_backend.get_queue(10)
+        queue_backend.remove_from_queue(99)
+        assert queue_backend.get_version(10) == seen[-1]
+    
+    def test_get_queue_lengths(self, queue_backend):
+        """Test lengths for many doctors come back in one batch, zero for empty queues."""
+        queue_backend.bulk_enqueue([{'patient_id': pid, 'doctor_id': 10} for pid in (1, 2, 3)])
+        queue_backend.enqueue(4, 20)
+        
+        assert queue_backend.get_queue_lengths([10, 20, 30]) == {10: 3, 20: 1, 30: 0}
+
+
+class TestDatabaseQueueBackend:
+    """Unit tests specific to queues kept in queue_entries."""
+    
+    def test_reorder_beyond_bound_parameter_limit(self, test_app):
+        """Test a queue longer than SQLite's default 32766 bound parameters can be reordered."""
+        backend = DatabaseQueueBackend()
+        size = 33000
+        # Builds of SQLite may raise the limit, so count the parameters of each statement
+        parameters = []
+        
+        def count(conn, cursor, statement, params, context, executemany):
+            if not executemany:
+                parameters.append(len(params))
+        
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            backend.bulk_enqueue([{'patient_id': pid, 'doctor_id': 10} for pid in range(size)])
+            backend.enqueue(patient_id=size, doctor_id=20)
+            new_order = [{'patient_id': pid} for pid in range(size, 0, -1)]
+            
+            assert backend.reorder_queue(10, new_order) is True
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+        
+        assert max(parameters) <= 32766
+        assert backend.get_queue_length(10) == size
+        assert backend.get_queue_length(20) == 0
+        assert [entry['patient_id'] for entry in backend.get_queue(10, limit=3)] == [size, size - 1, size - 2]
+        assert backend.get_position(0) is None
+        assert backend.bulk_remove(range(size + 1)) == size
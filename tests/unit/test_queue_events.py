@@ -0,0 +1,180 @@
+"""
+Unit Tests for queue:update delta events
+Checks the deltas emitted for queue changes and the resync handshake.
+"""
+import pytest
+from unittest.mock import patch
+from flask_login import login_user
+from extensions import handle_join, socketio
+from services import QueueService, broadcasts, publish_queue_delta
+from services.queue_events import handle_queue_resync, merge_queue_updates
+
+
+@pytest.fixture
+def emitted():
+    """Events sent through socketio.emit, as (event, data, room)."""
+    events = []
+    broadcasts.flush()  # drop anything still pending from earlier tests
+    with patch.object(socketio, 'emit', side_effect=lambda event, data, room=None, **kwargs: events.append((event, data, room))):
+        yield events
+
+
+def updates(events, kind='doctor'):
+    """queue:update payloads sent to doctor_ rooms, or to `kind`_ rooms."""
+    broadcasts.flush()
+    return [data for event, data, room in events if event == 'queue:update' and room.startswith(f'{kind}_')]
+
+
+def resync(test_app, user, data):
+    """Run the queue:resync handler as `user` and return the snapshot it sent back."""
+    with test_app.test_request_context(), patch('services.queue_events.emit') as emit:
+        login_user(user)
+        handle_queue_resync(data)
+    (event, snapshot), kwargs = emit.call_args
+    assert event == 'queue:snapshot'
+    return snapshot
+
+
+class TestQueueEvents:
+    """Unit tests for delta-encoded queue:update events."""
+    
+    def test_join_and_leave_emit_deltas(self, authenticated_patient, patient_user, doctor_user, emitted):
+        """Test joining and leaving emit numbered inserted/removed deltas, not the queue."""
+        QueueService().enqueue(500, doctor_user.id)
+        
+        authenticated_patient.get(f'/patient/join-queue/{doctor_user.id}')
+        # Far enough apart not to share a broadcast window
+        broadcasts.flush()
+        authenticated_patient.get('/patient/leave-queue')
+        joined, left = updates(emitted)
+        
+        assert {room for event, data, room in emitted if event == 'queue:update'} == {
+            f'doctor_{doctor_user.id}', f'waiting_{doctor_user.id}'
+        }
+        assert joined['op'] == 'inserted'
+        assert joined['patient_id'] == patient_user.id
+        assert (joined['position'], joined['total']) == (2, 2)
+        assert 'queue' not in joined
+        assert left['op'] == 'removed'
+        assert (left['position'], left['total']) == (2, 1)
+        assert left['version'] == joined['version'] + 1
+    
+    def test_waiting_room_gets_no_entries(self, authenticated_patient, doctor_user, emitted):
+        """Test patients following a queue get positions and totals but not other patients' entries."""
+        QueueService().enqueue(500, doctor_user.id)
+        
+        authenticated_patient.get(f'/patient/join-queue/{doctor_user.id}')
+        (full,) = updates(emitted)
+        (public,) = updates(emitted, kind='waiting')
+        
+        assert 'entry' in full
+        assert public == {key: value for key, value in full.items() if key != 'entry'}
+    
+    def test_call_next_emits_removed(self, authenticated_doctor, doctor_user, emitted):
+        """Test calling the next patient removes the head for everyone watching the queue."""
+        QueueService().enqueue(500, doctor_user.id)
+        QueueService().enqueue(501, doctor_user.id)
+        
+        authenticated_doctor.get('/doctor/call-next')
+        (called,) = updates(emitted)
+        assert (called['op'], called['patient_id'], called['position'], called['total']) == ('removed', 500, 1, 1)
+        assert called['minutes_per_patient'] == doctor_user.avg_consultation_time
+    
+    def test_concurrent_change_sends_resync(self, doctor_user, emitted):
+        """Test a change slipping in between is reported as a resync rather than a wrong delta."""
+        service = QueueService()
+        base_version = service.get_version(doctor_user.id)
+        service.enqueue(500, doctor_user.id)
+        service.enqueue(501, doctor_user.id)
+    
+        event = publish_queue_delta(service, doctor_user.id, base_version, 'inserted', 500)
+        assert event == {'doctor_id': doctor_user.id, 'op': 'resync', 'version': base_version + 2}
+        assert updates(emitted) == [event]
+    
+    def test_patient_resync(self, test_app, patient_user, doctor_user):
+        """Test a patient's resync returns their own position in that queue only."""
+        QueueService().enqueue(500, doctor_user.id)
+        QueueService().enqueue(patient_user.id, doctor_user.id)
+        
+        snapshot = resync(test_app, patient_user, {'doctor_id': doctor_user.id})
+        assert snapshot['position']['position'] == 2
+        assert snapshot['total'] == 2
+        assert snapshot['version'] == QueueService().get_version(doctor_user.id)
+        assert 'queue' not in snapshot
+        
+        assert resync(test_app, patient_user, {'doctor_id': doctor_user.id + 100})['position'] is None
+    
+    def test_doctor_resync(self, test_app, doctor_user):
+        """Test the doctor's resync returns the whole queue at a version."""
+        QueueService().enqueue(500, doctor_user.id)
+        QueueService().enqueue(501, doctor_user.id)
+        
+        snapshot = resync(test_app, doctor_user, {'doctor_id': doctor_user.id})
+        assert [entry['patient_id'] for entry in snapshot['queue']] == [500, 501]
+        assert snapshot['version'] == QueueService().get_version(doctor_user.id)
+    
+    def test_burst_is_sent_as_one_batch(self, authenticated_doctor, doctor_user, emitted):
+        """Test changes inside one broadcast window reach the room as a single batch."""
+        QueueService().bulk_enqueue([{'patient_id': pid, 'doctor_id': doctor_user.id} for pid in (500, 501, 502)])
+        before = broadcasts.metrics()
+        
+        for _ in range(3):
+            authenticated_doctor.get('/doctor/call-next')
+        (batch,) = updates(emitted)
+        
+        assert batch['op'] == 'batch'
+        assert [change['patient_id'] for change in batch['changes']] == [500, 501, 502]
+        assert batch['version'] == batch['changes'][-1]['version']
+        metrics = broadcasts.metrics()
+        # One batch for the doctor's room and one for their waiting room
+        assert metrics['events_in'] - before['events_in'] == 6
+        assert metrics['events_out'] - before['events_out'] == 2
+
+
+class TestRoomAccess:
+    """Unit tests for who may join which Socket.IO room."""
+    
+    def joined(self, test_app, user, room):
+        with test_app.test_request_context(), patch('extensions.join_room') as join_room:
+            if user is not None:
+                login_user(user)
+            handle_join({'room': room})
+        return join_room.called
+    
+    def test_patient_rooms(self, test_app, patient_user, doctor_user):
+        """Test a patient may follow their own room and a waiting room, not a doctor's or another user's."""
+        assert self.joined(test_app, patient_user, f'user_{patient_user.id}')
+        assert self.joined(test_app, patient_user, f'waiting_{doctor_user.id}')
+        assert not self.joined(test_app, patient_user, f'doctor_{doctor_user.id}')
+        assert not self.joined(test_app, patient_user, f'user_{doctor_user.id}')
+    
+    def test_doctor_rooms(self, test_app, doctor_user, admin_user):
+        """Test a doctor may join their own room only, and an admin any doctor's."""
+        assert self.joined(test_app, doctor_user, f'doctor_{doctor_user.id}')
+        assert not self.joined(test_app, doctor_user, f'doctor_{doctor_user.id + 1}')
+        assert self.joined(test_app, admin_user, f'doctor_{doctor_user.id}')
+    
+    def test_anonymous_and_unknown_rooms(self, test_app, doctor_user):
+        """Test anonymous clients join nothing and unknown rooms are refused."""
+        assert not self.joined(test_app, None, f'waiting_{doctor_user.id}')
+        assert not self.joined(test_app, doctor_user, 'admins')
+        assert not self.joined(test_app, doctor_user, 'doctor_')
+
+
+class TestMergeQueueUpdates:
+    """Unit tests for merging a burst of queue:update events."""
+    
+    def _event(self, version, op='removed'):
+        return {'doctor_id': 1, 'op': op, 'patient_id': version, 'version': version}
+    
+    def test_consecutive_versions_batch_in_order(self):
+        """Test consecutive changes become one batch, ordered by version."""
+        merged = merge_queue_updates([self._event(5), self._event(4), self._event(6)])
+        assert merged['op'] == 'batch'
+        assert [change['version'] for change in merged['changes']] == [4, 5, 6]
+    
+    def test_gap_or_resync_becomes_resync(self):
+        """Test a burst with a missing version or a resync collapses into one resync."""
+        assert merge_queue_updates([self._event(4), self._event(6)]) == {'doctor_id': 1, 'op': 'resync', 'version': 6}
+        assert merge_queue_updates([self._event(4), self._event(5, op='resync')])['op'] == 'resync'
+
@@ -0,0 +1,141 @@
+"""
+Unit Tests for QueueJournal
+Checks that journaled in-memory queues come back intact after a restart.
+"""
+import os
+import pytest
+from unittest.mock import patch
+from services.queue_backends import MemoryQueueBackend, QueueJournal
+
+
+def restart(directory, **kwargs):
+    """A fresh backend restored from the journal, as a restarted worker would build it."""
+    return MemoryQueueBackend(QueueJournal(str(directory), **kwargs))
+
+
+def state(backend, doctor_ids):
+    return {
+        doctor_id: [(entry['patient_id'], entry['queue_number']) for entry in backend.get_queue(doctor_id)]
+        for doctor_id in doctor_ids
+    }
+
+
+class TestQueueJournal:
+    """Unit tests for snapshot + op log persistence of MemoryQueueBackend."""
+    
+    def _populate(self, backend):
+        for patient_id in range(1, 7):
+            backend.enqueue(patient_id, 10, queue_number=patient_id)
+        backend.enqueue(7, 10, priority=3, queue_number=7)
+        backend.enqueue(8, 20, queue_number=8)
+        backend.remove_from_queue(2)
+        backend.dequeue(10)
+        backend.enqueue(3, 20, queue_number=3)
+        queue = backend.get_queue(10)
+        backend.reorder_queue(10, [queue[2], queue[0], queue[1]])
+        backend.enqueue(9, 10, queue_number=9)
+    
+    def test_restore_from_log(self, tmp_path):
+        """Test every kind of change is replayed from the op log alone."""
+        backend = restart(tmp_path)
+        self._populate(backend)
+        expected = state(backend, (10, 20))
+        backend._journal.close()
+    
+        restored = restart(tmp_path)
+        assert state(restored, (10, 20)) == expected
+        assert restored.get_position(3)['doctor_id'] == 20
+        assert restored.get_position(7) is None
+    
+        restored.enqueue(10, 10, queue_number=10)
+        assert state(restored, (10,))[10][-1] == (10, 10)
+    
+    def test_restore_from_snapshot_and_log(self, tmp_path):
+        """Test a snapshot plus the records after it restore the same queues."""
+        backend = restart(tmp_path)
+        self._populate(backend)
+        stats = backend.snapshot()
+        backend.enqueue(11, 20, queue_number=11)
+        backend.remove_from_queue(8)
+        expected = state(backend, (10, 20))
+        backend._journal.close()
+    
+        assert stats['snapshot_bytes'] > 0
+        assert sorted(os.listdir(tmp_path)) == ['queues.1.log', 'queues.snapshot']
+        restored = restart(tmp_path)
+        assert state(restored, (10, 20)) == expected
+        assert restored._journal.stats['restored_entries'] == sum(len(queue) for queue in expected.values())
+    
+    def test_patient_moved_during_snapshot(self, tmp_path):
+        """Test a patient caught in two queues by a snapshot comes back in one only."""
+        backend = restart(tmp_path)
+        backend.enqueue(1, 10, queue_number=1)
+        backend.enqueue(2, 20, queue_number=2)
+        get_doctor_lock = backend._get_doctor_lock
+        moved = []
+        
+        def move_before_capturing_20(doctor_id):
+            # Doctor 10 is already captured with patient 1 in it
+            if doctor_id == 20 and not moved:
+                moved.append(True)
+                backend.enqueue(1, 20, queue_number=1)
+            return get_doctor_lock(doctor_id)
+        
+        with patch.object(backend, '_get_doctor_lock', move_before_capturing_20):
+            backend.snapshot()
+        assert moved
+        backend.remove_from_queue(1)
+        backend._journal.close()
+        
+        restored = restart(tmp_path)
+        assert state(restored, (10, 20)) == {10: [], 20: [(2, 2)]}
+        assert restored.get_position(1) is None
+    
+    def test_clear_is_replayed(self, tmp_path):
+        """Test cleared queues stay cleared after a restart."""
+        backend = restart(tmp_path)
+        self._populate(backend)
+        backend.snapshot()
+        backend.clear_queue(10)
+        backend._journal.close()
+    
+        restored = restart(tmp_path)
+        assert restored.get_queue_length(10) == 0
+        assert restored.get_position(1) is None
+        assert restored.get_queue_length(20) == 2
+    
+    def test_torn_tail_is_ignored(self, tmp_path):
+        """Test a half-written last record from a crash does not break restore."""
+        backend = restart(tmp_path)
+        backend.enqueue(1, 10)
+        backend.enqueue(2, 10)
+        backend._journal.close()
+        with open(tmp_path / 'queues.0.log', 'a', encoding='utf-8') as f:
+            f.write('["put",1.5,9')
+    
+        restored = restart(tmp_path)
+        assert [entry['patient_id'] for entry in restored.get_queue(10)] == [1, 2]
+    
+    def test_crash_before_snapshot_written(self, tmp_path):
+        """Test a crash after rotating the log but before the snapshot lands loses nothing."""
+        backend = restart(tmp_path)
+        backend.enqueue(1, 10)
+        backend._journal.rotate()
+        backend.enqueue(2, 10)
+        backend._journal.close()
+    
+        restored = restart(tmp_path)
+        assert [entry['patient_id'] for entry in restored.get_queue(10)] == [1, 2]
+    
+    def test_snapshot_every(self, tmp_path):
+        """Test a snapshot is taken in the background once enough ops are logged."""
+        backend = restart(tmp_path, snapshot_every=50)
+        for patient_id in range(120):
+            backend.enqueue(patient_id, patient_id % 4)
+        backend._snapshot_thread.join(timeout=5)
+        backend._journal.close()
+    
+        assert os.path.exists(tmp_path / 'queues.snapshot')
+        restored = restart(tmp_path)
+        assert sum(restored.get_queue_length(doctor_id) for doctor_id in range(4)) == 120
+
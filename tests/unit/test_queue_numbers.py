@@ -0,0 +1,85 @@
+"""
+Unit Tests for QueueNumberCounter
+Checks daily ticket numbers on Redis and on the queue_counters table.
+"""
+import threading
+import pytest
+from sqlalchemy import event
+from datetime import date, datetime, timedelta
+from models import db, QueueCounter, QueueEntry
+from services import QueueNumberCounter
+
+
+@pytest.fixture(params=['redis', 'database'])
+def counter(request, test_app):
+    """A counter on (fake) Redis or on the database."""
+    if request.param == 'database':
+        return QueueNumberCounter()
+    fakeredis = pytest.importorskip('fakeredis')
+    return QueueNumberCounter(fakeredis.FakeRedis(decode_responses=True))
+
+
+class TestQueueNumberCounter:
+    """Unit tests for per-doctor daily ticket numbers."""
+    
+    def test_numbers_count_up_per_doctor_and_day(self, counter, doctor_user):
+        """Test each doctor's numbers run 1, 2, 3 and start over the next day."""
+        today = date(2024, 5, 6)
+        assert [counter.next_number(doctor_user.id, today) for _ in range(3)] == [1, 2, 3]
+        assert counter.next_number(doctor_user.id + 1, today) == 1
+        assert counter.next_number(doctor_user.id, today + timedelta(days=1)) == 1
+    
+    def test_seeded_from_todays_entries(self, counter, doctor_user):
+        """Test a fresh counter carries on after numbers already on today's entries."""
+        db.session.add(QueueEntry(patient_id=500, doctor_id=doctor_user.id, queue_number=7, joined_at=datetime.utcnow()))
+        db.session.add(QueueEntry(patient_id=501, doctor_id=doctor_user.id, queue_number=30,
+                                  joined_at=datetime.utcnow() - timedelta(days=1)))
+        db.session.commit()
+        
+        assert counter.next_number(doctor_user.id) == 8
+        assert counter.next_number(doctor_user.id) == 9
+    
+    def test_database_counter_row(self, test_app, doctor_user):
+        """Test the fallback keeps one row per doctor and day holding the last number issued."""
+        counter = QueueNumberCounter()
+        for _ in range(4):
+            counter.next_number(doctor_user.id)
+        
+        (row,) = QueueCounter.query.all()
+        assert (row.doctor_id, row.day, row.last_number) == (doctor_user.id, datetime.utcnow().date(), 4)
+    
+    def test_concurrent_numbers_unique(self, test_app, doctor_user):
+        """Test numbers handed out from many threads at once never repeat."""
+        fakeredis = pytest.importorskip('fakeredis')
+        counter = QueueNumberCounter(fakeredis.FakeRedis(decode_responses=True))
+        counter.next_number(doctor_user.id)
+        numbers = []
+        
+        def join():
+            with test_app.app_context():
+                for _ in range(25):
+                    numbers.append(counter.next_number(doctor_user.id))
+        
+        threads = [threading.Thread(target=join) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(numbers) == list(range(2, 202))
+    
+    def test_redis_numbers_skip_the_database(self, test_app, doctor_user):
+        """Test only seeding a day's Redis counter reads the database, not every join."""
+        fakeredis = pytest.importorskip('fakeredis')
+        counter = QueueNumberCounter(fakeredis.FakeRedis(decode_responses=True))
+        counter.next_number(doctor_user.id)
+        statements = []
+        
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            assert [counter.next_number(doctor_user.id) for _ in range(5)] == [2, 3, 4, 5, 6]
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+        assert statements == []
@@ -2,9 +2,12 @@
 Unit Tests for QueueService
 Tests individual QueueService methods in isolation.
 """
+import threading
 import pytest
-from services import QueueService
-from datetime import datetime
+from models import db, QueueEntry
+from services import QueueService, rebuild_queues
+from services.queue_backends import MemoryQueueBackend, RedisQueueBackend
+from datetime import datetime, timedelta
 
 
 class TestQueueService:
@@ -142,3 +145,303 @@ class TestQueueService:
         queue = queue_service_instance.get_queue(doctor_id=10)
         assert queue[0]['appointment_id'] == 100
 
+
+    
+    def test_get_queue_page(self, queue_service_instance):
+        """Test ranged reads return the right slice with absolute positions."""
+        for patient_id in range(1, 11):
+            queue_service_instance.enqueue(patient_id=patient_id, doctor_id=10)
+        
+        page = queue_service_instance.get_queue(doctor_id=10, offset=3, limit=4)
+        assert [entry['patient_id'] for entry in page] == [4, 5, 6, 7]
+        assert [entry['position'] for entry in page] == [4, 5, 6, 7]
+        assert [entry['patient_id'] for entry in queue_service_instance.get_queue(doctor_id=10, offset=8)] == [9, 10]
+        assert queue_service_instance.get_queue(doctor_id=10, offset=20, limit=5) == []
+        assert queue_service_instance.get_queue(doctor_id=10, limit=0) == []
+    
+    def test_get_positions(self, queue_service_instance):
+        """Test batch position lookup across doctors."""
+        queue_service_instance.enqueue(patient_id=1, doctor_id=10)
+        queue_service_instance.enqueue(patient_id=2, doctor_id=10)
+        queue_service_instance.enqueue(patient_id=3, doctor_id=20)
+        
+        positions = queue_service_instance.get_positions([2, 3, 999])
+        assert positions[2]['position'] == 2
+        assert positions[2]['total'] == 2
+        assert positions[3] == queue_service_instance.get_position(patient_id=3)
+        assert positions[999] is None
+        assert queue_service_instance.get_positions([]) == {}
+    
+    def test_bulk_enqueue(self, queue_service_instance):
+        """Test enqueuing a batch across several doctors."""
+        count = queue_service_instance.bulk_enqueue([
+            {'patient_id': 1, 'doctor_id': 10},
+            {'patient_id': 2, 'doctor_id': 20, 'queue_number': 4},
+            {'patient_id': 3, 'doctor_id': 10, 'priority': 5},
+        ])
+        assert count == 3
+        
+        assert [entry['patient_id'] for entry in queue_service_instance.get_queue(doctor_id=10)] == [3, 1]
+        assert queue_service_instance.get_queue(doctor_id=20)[0]['queue_number'] == 4
+        assert queue_service_instance.get_position(patient_id=1)['position'] == 2
+    
+    def test_bulk_remove(self, queue_service_instance):
+        """Test removing a batch, including patients who are not queued."""
+        queue_service_instance.bulk_enqueue([
+            {'patient_id': pid, 'doctor_id': 10 + pid % 2} for pid in range(1, 7)
+        ])
+        
+        assert queue_service_instance.bulk_remove([1, 2, 3, 999]) == 3
+        assert queue_service_instance.get_position(patient_id=1) is None
+        assert queue_service_instance.get_queue_length(doctor_id=10) == 2
+        assert queue_service_instance.get_queue_length(doctor_id=11) == 1
+        assert queue_service_instance.bulk_remove([]) == 0
+    
+    def test_create_queue_entries(self, test_app, doctor_user, patient_user):
+        """Test the DB companion inserts matching waiting rows."""
+        from models import QueueEntry
+        from services import create_queue_entries
+        
+        rows = create_queue_entries([
+            {'patient_id': patient_user.id, 'doctor_id': doctor_user.id, 'queue_number': 1},
+        ])
+        assert len(rows) == 1
+        assert rows[0].id is not None
+        assert QueueEntry.query.filter_by(doctor_id=doctor_user.id, status='waiting').count() == 1
+    
+    def test_get_queue_cached_until_changed(self, queue_service_instance):
+        """Test repeat reads are served from the cache until the queue changes."""
+        queue_service_instance.enqueue(1, 10)
+        queue_service_instance.enqueue(2, 10)
+        first = queue_service_instance.get_queue(10)
+        hits = queue_service_instance.cache_stats['hits']
+        
+        first[0]['patient_id'] = 99
+        assert [entry['patient_id'] for entry in queue_service_instance.get_queue(10)] == [1, 2]
+        assert queue_service_instance.cache_stats['hits'] == hits + 1
+        
+        queue_service_instance.dequeue(10)
+        assert [entry['patient_id'] for entry in queue_service_instance.get_queue(10)] == [2]
+        assert queue_service_instance.get_queue(10, offset=0, limit=1)[0]['patient_id'] == 2
+
+
+class TestRedisQueueService:
+    """Unit tests for the Redis-backed QueueService path."""
+    
+    def test_members_are_patient_ids(self, redis_queue_service):
+        """Test the sorted set holds patient ids and payloads live in a hash."""
+        redis_queue_service.enqueue(patient_id=1, doctor_id=10, queue_number=7)
+        
+        client = redis_queue_service.redis_client
+        assert client.zrange('queue:doctor:10', 0, -1) == ['1']
+        assert client.hexists('queue:doctor:10:entries', '1')
+        assert client.get('position:patient:1') == '10'
+    
+    def test_get_position(self, redis_queue_service):
+        """Test position comes from rank and cardinality of the sorted set."""
+        for patient_id in (1, 2, 3):
+            redis_queue_service.enqueue(patient_id=patient_id, doctor_id=10)
+        
+        position = redis_queue_service.get_position(patient_id=3)
+        assert position['position'] == 3
+        assert position['total'] == 3
+        assert position['doctor_id'] == 10
+        assert position['entry']['patient_id'] == 3
+    
+    def test_get_position_after_remove(self, redis_queue_service):
+        """Test removing a patient shifts the positions behind them."""
+        for patient_id in (1, 2, 3):
+            redis_queue_service.enqueue(patient_id=patient_id, doctor_id=10)
+        
+        assert redis_queue_service.remove_from_queue(patient_id=1) is True
+        assert redis_queue_service.get_position(patient_id=1) is None
+        assert redis_queue_service.get_position(patient_id=3)['position'] == 2
+        assert not redis_queue_service.redis_client.hexists('queue:doctor:10:entries', '1')
+    
+    def test_remove_from_queue_not_exists(self, redis_queue_service):
+        """Test removing a patient who is not queued."""
+        assert redis_queue_service.remove_from_queue(patient_id=999) is False
+    
+    def test_dequeue_and_get_queue(self, redis_queue_service):
+        """Test dequeue pops the head and get_queue keeps order."""
+        redis_queue_service.enqueue(patient_id=1, doctor_id=10)
+        redis_queue_service.enqueue(patient_id=2, doctor_id=10, priority=5)
+        
+        queue = redis_queue_service.get_queue(doctor_id=10)
+        assert [entry['patient_id'] for entry in queue] == [2, 1]
+        assert [entry['position'] for entry in queue] == [1, 2]
+        
+        entry = redis_queue_service.dequeue(doctor_id=10)
+        assert entry['patient_id'] == 2
+        assert redis_queue_service.get_position(patient_id=2) is None
+        assert redis_queue_service.get_queue_length(doctor_id=10) == 1
+    
+    def test_bulk_enqueue_and_remove(self, redis_queue_service):
+        """Test bulk operations keep the sorted set, payloads and position keys in step."""
+        redis_queue_service.bulk_enqueue([
+            {'patient_id': pid, 'doctor_id': 10} for pid in range(1, 6)
+        ])
+        assert redis_queue_service.get_position(patient_id=5)['position'] == 5
+        
+        assert redis_queue_service.bulk_remove([2, 4, 999]) == 2
+        assert [entry['patient_id'] for entry in redis_queue_service.get_queue(doctor_id=10)] == [1, 3, 5]
+        assert redis_queue_service.redis_client.hlen('queue:doctor:10:entries') == 3
+        assert redis_queue_service.redis_client.get('position:patient:2') is None
+    
+    def test_get_queue_page(self, redis_queue_service):
+        """Test ranged reads on Redis return the right slice with absolute positions."""
+        for patient_id in range(1, 11):
+            redis_queue_service.enqueue(patient_id=patient_id, doctor_id=10)
+        
+        page = redis_queue_service.get_queue(doctor_id=10, offset=3, limit=4)
+        assert [entry['patient_id'] for entry in page] == [4, 5, 6, 7]
+        assert [entry['position'] for entry in page] == [4, 5, 6, 7]
+        assert [entry['patient_id'] for entry in redis_queue_service.get_queue(doctor_id=10, offset=8)] == [9, 10]
+        assert redis_queue_service.get_queue(doctor_id=10, offset=20, limit=5) == []
+    
+    def test_get_positions(self, redis_queue_service):
+        """Test batch position lookup on Redis matches single lookups."""
+        for patient_id in (1, 2, 3):
+            redis_queue_service.enqueue(patient_id=patient_id, doctor_id=10)
+        redis_queue_service.enqueue(patient_id=4, doctor_id=20)
+        
+        positions = redis_queue_service.get_positions([3, 4, 999])
+        assert positions[3] == redis_queue_service.get_position(patient_id=3)
+        assert positions[3]['position'] == 3
+        assert positions[4]['doctor_id'] == 20
+        assert positions[999] is None
+    
+    def test_get_queue_cache_sees_other_workers(self, redis_queue_service):
+        """Test a change made through another client invalidates the cached queue."""
+        redis_queue_service.enqueue(1, 10)
+        assert len(redis_queue_service.get_queue(10)) == 1
+        
+        other_worker = RedisQueueBackend(redis_queue_service.redis_client)
+        other_worker.enqueue(2, 10)
+        assert [entry['patient_id'] for entry in redis_queue_service.get_queue(10)] == [1, 2]
+    
+    def test_lost_data_gets_new_epoch(self, redis_queue_service):
+        """Test counters restarted by a flush do not match tags or cache entries from before it."""
+        redis_queue_service.enqueue(1, 10)
+        etag = redis_queue_service.queue_etag(10)
+        assert [entry['patient_id'] for entry in redis_queue_service.get_queue(10)] == [1]
+        
+        redis_queue_service.redis_client.flushdb()
+        redis_queue_service.enqueue(2, 10)
+        assert redis_queue_service.get_version(10) == 1
+        assert redis_queue_service.queue_etag(10) != etag
+        assert [entry['patient_id'] for entry in redis_queue_service.get_queue(10)] == [2]
+        
+        other_worker = RedisQueueBackend(redis_queue_service.redis_client)
+        assert other_worker.get_epoch(10) == redis_queue_service.backend.get_epoch(10)
+
+
+class TestQueueServiceLocking:
+    """Unit tests for per-doctor locking of the in-memory queues."""
+    
+    def test_busy_doctor_does_not_block_others(self):
+        """Test a held lock on one doctor's queue leaves other doctors usable."""
+        backend = MemoryQueueBackend()
+        backend.enqueue(patient_id=1, doctor_id=10)
+        
+        lock = backend._get_doctor_lock(10)
+        assert lock.acquire(timeout=1)
+        try:
+            assert backend.enqueue(patient_id=2, doctor_id=20) is True
+            assert backend.get_position(patient_id=2)['position'] == 1
+            assert backend.dequeue(doctor_id=20)['patient_id'] == 2
+        finally:
+            lock.release()
+    
+    def test_doctor_lock_is_stable(self):
+        """Test the same lock object is handed out for a doctor every time."""
+        backend = MemoryQueueBackend()
+        assert backend._get_doctor_lock(10) is backend._get_doctor_lock(10)
+        assert backend._get_doctor_lock(10) is not backend._get_doctor_lock(20)
+    
+    def test_move_holds_both_doctors(self):
+        """Test a patient moving between doctors waits for both queues and is never in neither."""
+        backend = MemoryQueueBackend()
+        backend.enqueue(patient_id=1, doctor_id=10)
+        
+        with backend._get_doctor_lock(20):
+            mover = threading.Thread(target=backend.enqueue, kwargs={'patient_id': 1, 'doctor_id': 20})
+            mover.start()
+            mover.join(0.1)
+            assert mover.is_alive()
+            assert backend._memory_positions[1] == 10
+            assert len(backend._memory_queues[10]) == 1
+        mover.join(1)
+        
+        assert backend.get_position(patient_id=1)['doctor_id'] == 20
+        assert backend.get_queue_length(doctor_id=10) == 0
+    
+    def test_clear_all_waits_for_doctor_locks(self):
+        """Test clearing everything waits for a queue operation in progress."""
+        backend = MemoryQueueBackend()
+        backend.enqueue(patient_id=1, doctor_id=10)
+        
+        with backend._get_doctor_lock(10):
+            clearer = threading.Thread(target=backend.clear_all)
+            clearer.start()
+            clearer.join(0.1)
+            assert clearer.is_alive()
+            assert len(backend._memory_queues[10]) == 1
+        clearer.join(1)
+        
+        assert backend.get_queue_length(doctor_id=10) == 0
+
+
+class TestRebuildQueues:
+    """Unit tests for reconciling the live queues with queue_entries."""
+    
+    def _waiting(self, patient_id, doctor_id, minutes_ago):
+        return QueueEntry(
+            patient_id=patient_id,
+            doctor_id=doctor_id,
+            status='waiting',
+            queue_number=patient_id,
+            joined_at=datetime.utcnow() - timedelta(minutes=minutes_ago)
+        )
+    
+    def test_rebuild_after_flush(self, test_app, redis_queue_service, doctor_user):
+        """Test waiting rows come back in join order and orphans leave Redis."""
+        db.session.add_all([self._waiting(pid, doctor_user.id, minutes) for pid, minutes in ((101, 30), (102, 20), (103, 10))])
+        db.session.commit()
+        redis_queue_service.bulk_enqueue([
+            {'patient_id': 102, 'doctor_id': doctor_user.id, 'joined_at': datetime.utcnow() - timedelta(minutes=20)},
+            {'patient_id': 999, 'doctor_id': doctor_user.id}
+        ])
+        
+        report = rebuild_queues(redis_queue_service)
+        
+        assert (report['db_waiting'], report['queued_before']) == (3, 2)
+        assert (report['in_sync'], report['restored'], report['removed']) == (1, 2, 1)
+        assert [entry['patient_id'] for entry in redis_queue_service.get_queue(doctor_user.id)] == [101, 102, 103]
+        assert redis_queue_service.get_position(patient_id=999) is None
+        assert redis_queue_service.get_position(patient_id=103)['entry']['queue_number'] == 103
+    
+    def test_rebuild_cancels_stale_rows(self, test_app, queue_service_instance, doctor_user):
+        """Test duplicate rows and rows for missing doctors are cancelled."""
+        old_row = self._waiting(101, doctor_user.id, 20)
+        new_row = self._waiting(101, doctor_user.id, 10)
+        lost_row = self._waiting(102, 424242, 5)
+        db.session.add_all([old_row, new_row, lost_row])
+        db.session.commit()
+        
+        report = rebuild_queues(queue_service_instance)
+        
+        assert (report['restored'], report['cancelled']) == (1, 2)
+        assert (old_row.status, new_row.status, lost_row.status) == ('cancelled', 'waiting', 'cancelled')
+        assert queue_service_instance.queued_patients() == {101: doctor_user.id}
+    
+    def test_rebuild_dry_run(self, test_app, queue_service_instance, doctor_user):
+        """Test a dry run reports drift without changing anything."""
+        db.session.add(self._waiting(101, doctor_user.id, 5))
+        db.session.commit()
+        queue_service_instance.enqueue(patient_id=999, doctor_id=doctor_user.id)
+        
+        report = rebuild_queues(queue_service_instance, dry_run=True)
+        
+        assert (report['restored'], report['removed']) == (1, 1)
+        assert queue_service_instance.queued_patients() == {999: doctor_user.id}
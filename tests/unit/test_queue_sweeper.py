@@ -0,0 +1,112 @@
+"""
+Unit Tests for the end-of-day queue sweep
+Checks stale entries are closed, live queues cleared and old rows archived.
+"""
+import pytest
+from datetime import datetime, timedelta
+from models import db, QueueEntry, QueueEntryArchive
+from services import archive_entries, sweep_queues
+from services.queue_backends.redis_backend import POSITION_KEY_PREFIX
+from services.queue_sweeper import claim_sweep, seconds_until
+
+
+def _entry(patient_id, doctor_id, status, days_ago, **fields):
+    joined_at = datetime.utcnow() - timedelta(days=days_ago)
+    return QueueEntry(patient_id=patient_id, doctor_id=doctor_id, status=status, joined_at=joined_at, **fields)
+
+
+class TestSweepQueues:
+    """Unit tests for closing entries left over from previous days."""
+    
+    def test_stale_entries_closed(self, test_app, queue_service_instance, doctor_user):
+        """Test yesterday's waiting and in-consultation rows are closed and today's are left alone."""
+        stale_waiting = _entry(101, doctor_user.id, 'waiting', 1)
+        stale_consult = _entry(102, doctor_user.id, 'in_consultation', 1)
+        today = _entry(103, doctor_user.id, 'waiting', 0)
+        db.session.add_all([stale_waiting, stale_consult, today])
+        db.session.commit()
+        
+        report = sweep_queues(queue_service_instance)
+        
+        assert (report['cancelled'], report['closed']) == (1, 1)
+        db.session.expire_all()
+        assert (stale_waiting.status, stale_consult.status, today.status) == ('cancelled', 'cancelled', 'waiting')
+        assert stale_consult.completed_at is None
+    
+    def test_stale_patients_leave_live_queue(self, test_app, redis_queue_service, doctor_user):
+        """Test patients queued since yesterday are removed, with dangling position keys."""
+        redis_queue_service.bulk_enqueue([
+            {'patient_id': 101, 'doctor_id': doctor_user.id, 'joined_at': datetime.utcnow() - timedelta(days=1)},
+            {'patient_id': 102, 'doctor_id': doctor_user.id}
+        ])
+        redis_queue_service.redis_client.set(f"{POSITION_KEY_PREFIX}999", doctor_user.id)
+        
+        report = sweep_queues(redis_queue_service, batch_size=1)
+        
+        assert (report['unqueued'], report['dangling']) == (1, 1)
+        assert redis_queue_service.queued_patients() == {102: doctor_user.id}
+        assert redis_queue_service.redis_client.get(f"{POSITION_KEY_PREFIX}999") is None
+    
+    def test_sweep_is_idempotent(self, test_app, queue_service_instance, doctor_user):
+        """Test a second sweep finds nothing left to do."""
+        db.session.add(_entry(101, doctor_user.id, 'waiting', 2))
+        db.session.commit()
+        sweep_queues(queue_service_instance)
+        
+        report = sweep_queues(queue_service_instance)
+        
+        assert [report[key] for key in ('unqueued', 'dangling', 'cancelled', 'closed', 'archived')] == [0] * 5
+
+
+class TestArchiveEntries:
+    """Unit tests for moving old finished entries out of queue_entries."""
+    
+    def test_old_finished_rows_archived(self, test_app, queue_service_instance, doctor_user):
+        """Test finished rows past the retention window move to the archive unchanged."""
+        old = _entry(101, doctor_user.id, 'completed', 40, queue_number=7, priority=2,
+                     called_at=datetime(2024, 1, 1, 9, 0), completed_at=datetime(2024, 1, 1, 9, 20))
+        old_cancelled = _entry(102, doctor_user.id, 'cancelled', 35)
+        recent = _entry(103, doctor_user.id, 'completed', 5)
+        db.session.add_all([old, old_cancelled, recent])
+        db.session.commit()
+        old_id = old.id
+        
+        report = sweep_queues(queue_service_instance, archive_after_days=30)
+        
+        assert report['archived'] == 2
+        assert [row.id for row in QueueEntry.query.all()] == [recent.id]
+        archived = db.session.get(QueueEntryArchive, old_id)
+        assert (archived.patient_id, archived.queue_number, archived.priority) == (101, 7, 2)
+        assert (archived.called_at, archived.completed_at) == (datetime(2024, 1, 1, 9, 0), datetime(2024, 1, 1, 9, 20))
+        assert archived.archived_at is not None
+    
+    def test_archived_in_batches(self, test_app, doctor_user):
+        """Test every matching row is moved however small the batch."""
+        db.session.add_all([_entry(100 + n, doctor_user.id, 'completed', 40) for n in range(7)])
+        db.session.commit()
+        
+        assert archive_entries(datetime.utcnow() - timedelta(days=30), batch_size=3) == 7
+        assert QueueEntry.query.count() == 0
+        assert QueueEntryArchive.query.count() == 7
+
+
+class TestSweepScheduling:
+    """Unit tests for timing and claiming the daily sweep."""
+    
+    def test_seconds_until(self):
+        """Test the next run is later today, or tomorrow once the time has passed."""
+        now = datetime(2024, 5, 6, 23, 0)
+        assert seconds_until('23:30', now) == 30 * 60
+        assert seconds_until('00:15', now) == 75 * 60
+        assert seconds_until('23:00', now) == 24 * 3600
+    
+    def test_one_worker_claims_each_day(self):
+        """Test only the first claim of a day succeeds on shared Redis."""
+        fakeredis = pytest.importorskip('fakeredis')
+        client = fakeredis.FakeRedis(decode_responses=True)
+        day = datetime(2024, 5, 6).date()
+        
+        assert claim_sweep(client, day) is True
+        assert claim_sweep(client, day) is False
+        assert claim_sweep(client, day + timedelta(days=1)) is True
+        assert claim_sweep(None, day) is True
@@ -0,0 +1,97 @@
+"""
+Unit Tests for InstrumentedConnectionPool
+Checks callers wait for a free connection and the pool counts what it sees.
+"""
+import threading
+import time
+import pytest
+import redis
+from services import PoolTimeoutError, QueueService
+from services.queue_backends import FailoverQueueBackend, RedisQueueBackend
+from services.redis_pool import InstrumentedConnectionPool
+
+fakeredis = pytest.importorskip('fakeredis')
+
+
+@pytest.fixture
+def make_pool():
+    """Pools over one fake Redis server."""
+    server = fakeredis.FakeServer()
+    
+    def make(max_connections, timeout):
+        return InstrumentedConnectionPool(
+            max_connections=max_connections,
+            timeout=timeout,
+            connection_class=fakeredis.FakeRedisConnection,
+            server=server,
+            decode_responses=True
+        )
+    return make
+
+
+class TestInstrumentedConnectionPool:
+    """Unit tests for the blocking, instrumented Redis pool."""
+    
+    def test_in_use_and_idle(self, make_pool):
+        """Test connections are counted as in use while checked out and idle once released."""
+        pool = make_pool(4, 1)
+        first = pool.get_connection('PING')
+        second = pool.get_connection('PING')
+        
+        metrics = pool.metrics()
+        assert (metrics['open'], metrics['in_use'], metrics['idle']) == (2, 2, 0)
+        
+        pool.release(first)
+        metrics = pool.metrics()
+        assert (metrics['in_use'], metrics['idle'], metrics['checkouts'], metrics['waits']) == (1, 1, 2, 0)
+        pool.release(second)
+    
+    def test_waits_for_released_connection(self, make_pool):
+        """Test a caller over the limit waits for a connection rather than failing."""
+        pool = make_pool(1, 2)
+        held = pool.get_connection('PING')
+        threading.Timer(0.1, pool.release, args=[held]).start()
+        
+        connection = pool.get_connection('PING')
+        
+        assert connection is held
+        metrics = pool.metrics()
+        assert (metrics['waits'], metrics['timeouts']) == (1, 0)
+        assert metrics['wait_ms_max'] >= 50
+        pool.release(connection)
+    
+    def test_wait_timeout(self, make_pool):
+        """Test giving up raises PoolTimeoutError, which is not a connection failure."""
+        pool = make_pool(1, 0.05)
+        held = pool.get_connection('PING')
+        
+        started = time.perf_counter()
+        with pytest.raises(PoolTimeoutError) as error:
+            pool.get_connection('PING')
+        
+        assert time.perf_counter() - started >= 0.05
+        assert not isinstance(error.value, redis.exceptions.ConnectionError)
+        assert pool.metrics()['timeouts'] == 1
+        pool.release(held)
+    
+    def test_exhausted_pool_does_not_fail_over(self, make_pool):
+        """Test a busy pool is reported to the caller without opening the failover circuit."""
+        pool = make_pool(1, 0.05)
+        backend = FailoverQueueBackend(RedisQueueBackend(redis.Redis(connection_pool=pool)))
+        held = pool.get_connection('PING')
+        
+        with pytest.raises(PoolTimeoutError):
+            backend.get_queue_length(10)
+        
+        assert not backend.degraded
+        pool.release(held)
+        assert backend.get_queue_length(10) == 0
+    
+    def test_sized_from_app_config(self, monkeypatch):
+        """Test QueueService sizes its pools from the configured settings."""
+        monkeypatch.setattr(QueueService, 'config', dict(QueueService.config, REDIS_MAX_CONNECTIONS=7, REDIS_POOL_TIMEOUT=0.5))
+        monkeypatch.setattr(QueueService, '_redis_pools', {})
+        
+        pool = QueueService._client('redis://127.0.0.1:6399/0').connection_pool
+        
+        assert (pool.max_connections, pool.timeout) == (7, 0.5)
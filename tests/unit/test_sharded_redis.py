@@ -0,0 +1,137 @@
+"""
+Unit Tests for ShardedRedisQueueBackend
+Checks placement by doctor, cross-shard moves and minimal rebalancing.
+"""
+import pytest
+from services.queue_backends import HashRing, ShardedRedisQueueBackend
+
+fakeredis = pytest.importorskip('fakeredis')
+
+
+def fake_client():
+    return fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+
+
+@pytest.fixture
+def sharded():
+    return ShardedRedisQueueBackend({f"shard-{n}": fake_client() for n in range(3)})
+
+
+def doctors_on_different_shards(backend):
+    first = 1
+    second = next(doctor_id for doctor_id in range(2, 100) if backend.shard_name(doctor_id) != backend.shard_name(first))
+    return first, second
+
+
+class TestHashRing:
+    """Unit tests for consistent hashing."""
+    
+    def test_spread_and_stable(self):
+        """Test keys spread over every node and land on the same node every time."""
+        ring = HashRing(['a', 'b', 'c'])
+        owners = [ring.get(f"doctor:{n}") for n in range(3000)]
+        assert all(owners.count(node) > 600 for node in 'abc')
+        assert owners == [HashRing(['c', 'a', 'b']).get(f"doctor:{n}") for n in range(3000)]
+    
+    def test_added_node_only_takes_keys(self):
+        """Test adding a node moves keys only onto it, about 1/N of them."""
+        ring = HashRing(['a', 'b', 'c'])
+        before = {n: ring.get(n) for n in range(3000)}
+        ring.add('d')
+        moved = {n for n in before if ring.get(n) != before[n]}
+        assert all(ring.get(n) == 'd' for n in moved)
+        assert 400 < len(moved) < 1200
+
+
+class TestShardedRedisQueueBackend:
+    """Unit tests for queues spread across Redis shards."""
+    
+    def test_keys_colocated_with_doctor(self, sharded):
+        """Test a doctor's queue and its patients' position keys live on one shard only."""
+        sharded.enqueue(7, 42)
+        home = sharded.shard_name(42)
+        for name, shard in sharded.shards.items():
+            keys = set(shard.redis_client.keys('*')) - {'shard:patient:7'}
+            if name == home:
+                assert {'queue:doctor:42', 'queue:doctor:42:entries', 'position:patient:7'} <= keys
+            else:
+                assert keys == set()
+        assert sharded.index.redis_client.get('shard:patient:7') == '42'
+    
+    def test_patient_lookups_ask_one_shard(self, sharded, monkeypatch):
+        """Test positions and removal read the index, then only the doctor's shard."""
+        first, second = doctors_on_different_shards(sharded)
+        sharded.enqueue(7, first)
+        sharded.enqueue(8, second)
+        sharded.get_position(7)  # loads the position script
+        calls = {name: 0 for name in sharded.shards}
+        for name, shard in sharded.shards.items():
+            def counted(*args, name=name, execute_command=shard.redis_client.execute_command, **options):
+                calls[name] += 1
+                return execute_command(*args, **options)
+            monkeypatch.setattr(shard.redis_client, 'execute_command', counted)
+        index_name = next(name for name, shard in sharded.shards.items() if shard is sharded.index)
+        
+        assert sharded.get_position(7)['doctor_id'] == first
+        assert sharded.get_position(999) is None
+        assert sum(calls.values()) == 3
+        assert set(name for name, count in calls.items() if count) <= {index_name, sharded.shard_name(first)}
+        
+        assert sharded.remove_from_queue(7) is True
+        assert sharded.get_position(7) is None
+        assert sharded.index.redis_client.get('shard:patient:7') is None
+        assert sharded.dequeue(second)['patient_id'] == 8
+        assert sharded.index.redis_client.get('shard:patient:8') is None
+    
+    def test_rebalance_indexes_unindexed_patients(self, sharded):
+        """Test queues written before the patient index existed become findable after a rebalance."""
+        sharded.bulk_enqueue([{'patient_id': pid, 'doctor_id': pid % 7} for pid in range(30)])
+        for key in sharded.index.redis_client.keys('shard:patient:*'):
+            sharded.index.redis_client.delete(key)
+        assert sharded.get_position(5) is None
+        
+        assert sharded.rebalance()['patients_indexed'] == 30
+        assert sharded.get_position(5)['doctor_id'] == 5
+        assert sharded.rebalance()['patients_indexed'] == 0
+    
+    def test_move_across_shards(self, sharded):
+        """Test joining a doctor on another shard leaves the old queue and bumps its version."""
+        first, second = doctors_on_different_shards(sharded)
+        sharded.enqueue(7, first)
+        version = sharded.get_version(first)
+        
+        sharded.enqueue(7, second)
+        assert sharded.get_queue_length(first) == 0
+        assert sharded.get_version(first) == version + 1
+        assert sharded.get_position(7)['doctor_id'] == second
+        assert sharded.queued_patients() == {7: second}
+        
+        sharded.reorder_queue(first, [{'patient_id': 7, 'doctor_id': first}])
+        assert sharded.get_queue_length(second) == 0
+        assert sharded.get_position(7)['doctor_id'] == first
+    
+    def test_add_shard_moves_only_affected_doctors(self, sharded):
+        """Test a new shard receives the doctors the ring now gives it and nothing else moves."""
+        sharded.bulk_enqueue([
+            {'patient_id': 1000 + doctor_id * 10 + n, 'doctor_id': doctor_id, 'priority': n % 2}
+            for doctor_id in range(60) for n in range(3)
+        ])
+        before = {doctor_id: sharded.shard_name(doctor_id) for doctor_id in range(60)}
+        queues = {doctor_id: sharded.get_queue(doctor_id) for doctor_id in range(60)}
+        versions = {doctor_id: sharded.get_version(doctor_id) for doctor_id in range(60)}
+        
+        report = sharded.add_shard('shard-3', fake_client())
+        
+        moved = {doctor_id for doctor_id in before if sharded.shard_name(doctor_id) != before[doctor_id]}
+        assert moved and all(sharded.shard_name(doctor_id) == 'shard-3' for doctor_id in moved)
+        assert report == {'doctors_checked': 60, 'doctors_moved': len(moved), 'patients_moved': 3 * len(moved),
+                          'patients_indexed': 0}
+        assert {key.split(':')[2] for key in sharded.shards['shard-3'].redis_client.keys('queue:doctor:*')} == {str(d) for d in moved}
+        for doctor_id in range(60):
+            assert sharded.get_queue(doctor_id) == queues[doctor_id]
+            if doctor_id in moved:
+                assert sharded.get_version(doctor_id) > versions[doctor_id]
+            else:
+                assert sharded.get_version(doctor_id) == versions[doctor_id]
+        assert sharded.get_position(1000 + next(iter(moved)) * 10)['position'] in (1, 2, 3)
+        assert sharded.rebalance()['doctors_moved'] == 0
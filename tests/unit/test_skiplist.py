@@ -0,0 +1,83 @@
+"""
+Unit Tests for IndexableSkipList
+Checks the order-statistic operations against a plain sorted list.
+"""
+import random
+import pytest
+from services.skiplist import IndexableSkipList
+
+
+class TestIndexableSkipList:
+    """Unit tests for IndexableSkipList."""
+    
+    def test_empty(self):
+        """Test an empty skip list."""
+        skiplist = IndexableSkipList()
+        assert len(skiplist) == 0
+        assert not skiplist
+        assert skiplist.pop_first() is None
+        assert skiplist.rank((1, 0)) is None
+        assert skiplist.items() == []
+        with pytest.raises(IndexError):
+            skiplist[0]
+    
+    def test_insert_keeps_order(self):
+        """Test entries iterate in key order regardless of insertion order."""
+        skiplist = IndexableSkipList()
+        for key in [(5, 0), (1, 1), (3, 2), (1, 0)]:
+            skiplist.insert(key, str(key))
+        
+        assert [key for key, value in skiplist] == [(1, 0), (1, 1), (3, 2), (5, 0)]
+        assert skiplist[0] == ((1, 0), '(1, 0)')
+        assert skiplist[-1] == ((5, 0), '(5, 0)')
+    
+    def test_remove_missing_key(self):
+        """Test removing an absent key raises KeyError."""
+        skiplist = IndexableSkipList()
+        skiplist.insert((1, 0), 'a')
+        with pytest.raises(KeyError):
+            skiplist.remove((2, 0))
+        assert len(skiplist) == 1
+    
+    def test_matches_sorted_list(self):
+        """Test rank, index, range, remove and pop agree with a sorted list."""
+        rng = random.Random(42)
+        skiplist = IndexableSkipList()
+        reference = []
+        
+        for seq in range(2000):
+            key = (rng.choice([-5, -1, rng.random() * 1000]), seq)
+            skiplist.insert(key, seq)
+            reference.append(key)
+        reference.sort()
+        
+        for _ in range(500):
+            key = reference.pop(rng.randrange(len(reference)))
+            assert skiplist.remove(key) == key[1]
+        for _ in range(100):
+            assert skiplist.pop_first()[0] == reference.pop(0)
+        
+        assert len(skiplist) == len(reference)
+        assert [key for key, value in skiplist] == reference
+        for index in rng.sample(range(len(reference)), 200):
+            assert skiplist.rank(reference[index]) == index
+            assert skiplist[index][0] == reference[index]
+        assert [key for key, value in skiplist.items(100, 150)] == reference[100:150]
+        assert [key for key, value in skiplist.items(len(reference) - 3, len(reference) + 10)] == reference[-3:]
+    
+    def test_from_sorted(self):
+        """Test a list built from sorted pairs behaves like one built by inserts."""
+        rng = random.Random(7)
+        reference = sorted((rng.random() * 1000, seq) for seq in range(1000))
+        skiplist = IndexableSkipList.from_sorted((key, key[1]) for key in reference)
+        
+        assert len(skiplist) == len(reference)
+        for index in rng.sample(range(len(reference)), 100):
+            assert skiplist.rank(reference[index]) == index
+            assert skiplist[index][0] == reference[index]
+        
+        skiplist.insert((-1, -1), None)
+        assert skiplist.remove(reference[500]) == reference[500][1]
+        assert [key for key, value in skiplist.items(0, 3)] == [(-1, -1)] + reference[:2]
+        assert skiplist.rank(reference[501]) == 501
+        assert len(IndexableSkipList.from_sorted([])) == 0